@@ -1,24 +1,41 @@
 import argparse
 import glob
 import os
+import sys
 from pathlib import Path
 from pprint import pprint
 
 from pdf_toolbox.lib.basic import (delete_pdf, insert_pdf, merge_pdf, rotate_pdf,split_pdf,
                            slice_pdf)
-from pdf_toolbox.lib.bookmark import (add_toc_from_file, add_toc_from_ocr, extract_toc,
-                              transform_toc_file)
+from pdf_toolbox.lib.bookmark import (add_toc_from_contents, add_toc_from_file, add_toc_from_fonts, add_toc_from_ocr,
+                              extract_toc, transform_toc_file)
+from pdf_toolbox.lib.compress import compress_pdf
+from pdf_toolbox.lib.dedupe import dedupe_pdf
+from pdf_toolbox.lib.diff import diff_pdf
+from pdf_toolbox.lib.header_footer import debug_headers_footers, extract_headers_footers, redact_headers_footers
 from pdf_toolbox.lib.convert import convert_images_to_pdf, convert_pdf_to_images
-from pdf_toolbox.lib.encrypt import decrypt_pdf, encrypt_pdf
+from pdf_toolbox.lib.encrypt import DEFAULT_PERMISSIONS, PERMISSIONS, bulk_encrypt_pdf, decrypt_pdf, encrypt_pdf
 from pdf_toolbox.lib.extract import (debug_item_from_pdf, extract_item_from_pdf,
-                             extract_text_from_pdf)
-from pdf_toolbox.lib.ocr import ocr_from_image, ocr_from_pdf
+                             extract_tables_from_pdf, extract_text_from_pdf)
+from pdf_toolbox.lib.ocr import ocr_forms, ocr_from_image, ocr_from_pdf
+from pdf_toolbox.lib.orientation import auto_rotate_pdf
+from pdf_toolbox.lib.search import build_index, search_index
 from pdf_toolbox.lib.watermark import (add_mark_to_image, add_mark_to_pdf,
                                remove_mark_from_image, remove_mark_from_pdf)
+from pdf_toolbox.utils.inference import BACKENDS, PRECISIONS, set_inference_config
+from pdf_toolbox.utils.profiler import enable_profile, print_summary, save_profile
+from pdf_toolbox.watch import load_ops, watch
 
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", type=str, default=None, dest="profile_path", help="记录各阶段耗时并保存到该路径(.json为Chrome trace格式, .jsonl为每行一个事件)")
+    # 推理配置, 未指定时使用环境变量PDF_TOOLBOX_*(见pdf_toolbox.utils.inference)
+    parser.add_argument("--backend", type=str, default=None, choices=BACKENDS, dest="backend", help="推理后端")
+    parser.add_argument("--cpu-threads", type=int, default=None, dest="cpu_threads", help="推理cpu线程数")
+    parser.add_argument("--mkldnn", action="store_true", dest="enable_mkldnn", default=None, help="开启MKL-DNN加速")
+    parser.add_argument("--model-dir", type=str, default=None, dest="model_dir", help="模型目录(目录结构与~/.paddleocr相同)")
+    parser.add_argument("--precision", type=str, default=None, choices=PRECISIONS, dest="precision", help="推理精度")
 
     sub_parsers = parser.add_subparsers()
 
@@ -35,6 +52,15 @@ def main():
     convert_parser   = sub_parsers.add_parser("convert", help="转换", description="与pdf相关的文件格式转换，如pdf转图片、图片转pdf等")
     ocr_parser       = sub_parsers.add_parser("ocr", help="OCR识别", description="使用paddleocr识别图片或pdf文件中的文本")
     debug_parser     = sub_parsers.add_parser("debug", help="调试", description="可以指定title、figure、table等不同类型来判断paddleocr检测效果")
+    dedupe_parser    = sub_parsers.add_parser("dedupe", help="去重", description="检测并删除一个或多个pdf中的重复页面(多个文件时先合并)")
+    diff_parser      = sub_parsers.add_parser("diff", help="比较", description="逐页比较同一文档的两个版本, 找出新增、删除、移动和修改的页面")
+    compress_parser  = sub_parsers.add_parser("compress", help="压缩", description="压缩扫描件pdf: 图片降采样、重新编码为jpeg、黑白页转1位图、合并相同图片")
+    watch_parser     = sub_parsers.add_parser("watch", help="监视目录", description="轮询输入目录, 对新增或变化的pdf执行操作链, 结果保存到输出目录(已完成的文件不会重复处理)")
+    index_parser     = sub_parsers.add_parser("index", help="建立索引", description="为pdf建立/增量更新页面级全文索引(sqlite fts5)")
+    search_parser    = sub_parsers.add_parser("search", help="全文检索", description="在已建立的索引中检索文本, 返回文件、页码和摘要")
+    bench_parser     = sub_parsers.add_parser("bench", help="基准测试", description="使用合成pdf语料测试各命令的性能, 并与基线结果比较")
+    serve_parser     = sub_parsers.add_parser("serve", help="常驻服务", description="以本地HTTP/Unix socket服务形式提供各项操作, 模型预加载常驻内存")
+    models_parser    = sub_parsers.add_parser("models", help="模型管理", description="离线模型包管理: 预下载/拷贝、校验、列出模型(模型目录由全局--model-dir指定, 默认~/.paddleocr)")
 
     # 书签
     bookmark_subparsers     = bookmark_parser.add_subparsers()
@@ -46,6 +72,8 @@ def main():
     bookmark_add_subparsers = bookmark_add_parser.add_subparsers()
     from_ocr_parser = bookmark_add_subparsers.add_parser("from_ocr", help="使用ocr自动生成目录书签")
     from_file_parser = bookmark_add_subparsers.add_parser("from_file", help="从文件导入目录书签")
+    from_fonts_parser = bookmark_add_subparsers.add_parser("from_fonts", help="根据文本层字体信息自动生成目录书签(非扫描件)")
+    from_contents_parser = bookmark_add_subparsers.add_parser("from_contents", help="识别pdf自身的目录页生成书签(只处理目录页)")
 
     from_ocr_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="pdf语言")
     from_ocr_parser.add_argument("-d", "--double-columns", action="store_true", dest='use_double_column', default=False, help="是否双栏")
@@ -60,6 +88,20 @@ def main():
     from_file_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
     from_file_parser.set_defaults(bookmark_add_which='file')
 
+    from_fonts_parser.add_argument("-r", "--range", type=str, default="all", dest="page_range", help="指定页面范围,例如: '1-3,7-19'")
+    from_fonts_parser.add_argument("-m", "--max-level", type=int, default=3, dest="max_level", help="最多识别的标题层级数")
+    from_fonts_parser.add_argument("input_path", type=str, help="输入文件路径")
+    from_fonts_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
+    from_fonts_parser.set_defaults(bookmark_add_which='fonts')
+
+    from_contents_parser.add_argument("-r", "--range", type=str, required=True, dest="page_range", help="目录页范围,例如: '3-7'")
+    from_contents_parser.add_argument("-d", "--offset", type=int, default=None, dest="offset", help="偏移量(实际页码-标注页码), 默认在目录页之后匹配标题自动推断")
+    from_contents_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="pdf语言")
+    from_contents_parser.add_argument("--dpi", type=int, default=144, dest="dpi", help="目录页无文本层时的ocr渲染分辨率")
+    from_contents_parser.add_argument("input_path", type=str, help="输入文件路径")
+    from_contents_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
+    from_contents_parser.set_defaults(bookmark_add_which='contents')
+
     bookmark_add_parser.set_defaults(bookmark_which='add')
 
     ## 书签清洗
@@ -95,6 +137,7 @@ def main():
     watermark_remove_group = watermark_parser.add_argument_group("去除水印")
     watermark_remove_group.add_argument("--remove", action="store_true", dest='remove', default=False, help="是否去除水印")
     watermark_remove_group.add_argument("--watermark-color", type=str, default="#808080", dest="watermark_color", help="水印文本颜色")
+    watermark_remove_group.add_argument("--max-memory", type=float, default=None, dest="max_memory", help="内存预算(MB), 超出时释放缓存并将已处理页面写入磁盘")
 
     watermark_parser.add_argument("-t", "--type", type=str, default="pdf", choices=['pdf', 'image'], dest="type", help="被加水印对象类型")
     watermark_parser.add_argument("-r", "--range", type=str, default="all", dest="page_range", help="指定页面范围,例如: '1-3,7-19'")
@@ -103,17 +146,27 @@ def main():
     watermark_parser.set_defaults(which='watermark')
 
     # 加/解密
-    encrypt_parser.add_argument("--user-pass", type=str, default=None, required=True, dest="user_pass", help="指定用户密码")
+    encrypt_parser.add_argument("--user-pass", type=str, default=None, dest="user_pass", help="指定用户密码(批量模式下为csv中未指定密码时的默认值)")
     encrypt_parser.add_argument("--owner-pass", type=str, default=None, dest="owner_pass", help="指定所有者密码")
-    encrypt_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
+    encrypt_parser.add_argument("--perm", type=str, default=DEFAULT_PERMISSIONS, dest="permissions", help=f"权限, 逗号分隔, 可选: {','.join(PERMISSIONS)},all,none")
+    encrypt_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径, 批量模式下为保存目录")
     encrypt_parser.add_argument("-d", "--decrypt", action="store_true", dest='decrypt', default=False, help="是否解密")
-    encrypt_parser.add_argument("input_path", type=str, help="输入文件路径")
+    encrypt_parser.add_argument("-j", "--workers", type=int, default=None, dest="workers", help="批量模式的进程数, 默认为cpu核数")
+    encrypt_parser.add_argument("--report", type=str, default=None, dest="report_path", help="批量模式的结果报告保存路径(csv)")
+    encrypt_parser.add_argument("input_path", type=str, help="输入文件路径; 目录或csv文件(path,user_pw,owner_pw,permissions)时批量处理")
     encrypt_parser.set_defaults(which='encrypt')
     
     # 旋转
     rotate_parser.add_argument("-r", "--range", type=str, default="all", dest="page_range", help="指定页面范围,例如: '1-3,7-19'")
     rotate_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
     rotate_parser.add_argument("-a", "--angle", type=int, default=90, choices=[90, -90, 180], dest="angle", help="旋转角度, 90表示顺时针转, -90表示逆时针转")
+    rotate_parser.add_argument("--auto", action="store_true", dest="auto", default=False, help="自动判断每页方向(忽略--angle)")
+    rotate_parser.add_argument("--deskew", action="store_true", dest="deskew", default=False, help="自动模式下同时纠正小角度倾斜")
+    rotate_parser.add_argument("--max-skew", type=float, default=5., dest="max_skew", help="纠正的最大倾斜角度")
+    rotate_parser.add_argument("--dpi", type=int, default=100, dest="dpi", help="扫描页分析时的渲染分辨率")
+    rotate_parser.add_argument("--cls", action="store_true", dest="use_cls", default=False, help="无法判断是否倒置时使用paddleocr方向分类模型")
+    rotate_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="方向分类模型的语言")
+    rotate_parser.add_argument("-j", "--workers", type=int, default=None, dest="workers", help="进程数, 默认为cpu核数")
     rotate_parser.add_argument("input_path", type=str, help="输入文件路径")
     rotate_parser.set_defaults(which='rotate')
 
@@ -140,6 +193,7 @@ def main():
     # 合并
     merge_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
     merge_parser.add_argument("-f", "--config", action="store_true", dest='config', default=False, help="是否将input_path作为配置文件(每行一个pdf文件路径)")
+    merge_parser.add_argument("-u", "--dedupe", action="store_true", dest='dedupe', default=False, help="是否删除重复页面")
     merge_parser.add_argument("input_path", type=str, nargs="+", default=None, help="输入文件路径或目录")
     merge_parser.set_defaults(which='merge')
 
@@ -154,6 +208,11 @@ def main():
     extract_parser.add_argument("-r", "--range", type=str, default="all", dest="page_range", help="指定页面范围,例如: '1-3,7-19'")
     extract_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="pdf语言")
     extract_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
+    extract_parser.add_argument("-f", "--format", type=str, default="csv", choices=['csv', 'xlsx', 'json', 'image'], dest="format", help="保存格式: table可选csv/xlsx/json/image(只保存表格区域截图), header/footer可选csv/json")
+    extract_parser.add_argument("--strip-headers", action="store_true", dest="strip_headers", default=False, help="提取文本时去除页眉页脚(仅对text有效)")
+    extract_parser.add_argument("--redact", action="store_true", dest="redact", default=False, help="从pdf中涂除页眉/页脚而不是导出(仅对header/footer有效)")
+    extract_parser.add_argument("--dpi", type=int, default=200, dest="dpi", help="表格区域的渲染分辨率(仅对table有效)")
+    extract_parser.add_argument("--max-memory", type=float, default=None, dest="max_memory", help="内存预算(MB), 超出时释放缓存")
     extract_parser.add_argument("input_path", type=str, help="输入文件路径")
     extract_parser.set_defaults(which='extract')
 
@@ -177,6 +236,11 @@ def main():
     ocr_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="pdf语言")
     ocr_parser.add_argument("-d", "--offset", type=float, default=5., dest="offset", help="判断同一行的偏移量")
     ocr_parser.add_argument("-s", "--show-log",  action="store_true", dest='show_log', default=False, help="是否显示log")
+    ocr_parser.add_argument("--max-memory", type=float, default=None, dest="max_memory", help="内存预算(MB), 超出时释放缓存")
+    ocr_parser.add_argument("-t", "--template", type=str, default=None, dest="template_path", help="区域模板(json), 指定后只识别模板中的字段区域, 输入可以是目录")
+    ocr_parser.add_argument("--dpi", type=int, default=None, dest="dpi", help="区域渲染分辨率, 默认使用模板中的dpi")
+    ocr_parser.add_argument("--no-text-layer", action="store_false", dest="use_text_layer", default=True, help="区域内有文本层时也进行ocr")
+    ocr_parser.add_argument("-j", "--workers", type=int, default=1, dest="workers", help="区域识别的进程数")
     ocr_parser.add_argument("input_path", type=str, help="输入文件路径")
     ocr_parser.set_defaults(which='ocr')
 
@@ -188,17 +252,146 @@ def main():
     debug_parser.add_argument("input_path", type=str, help="输入文件路径")
     debug_parser.set_defaults(which='debug')
 
+    # 去重
+    dedupe_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
+    dedupe_parser.add_argument("-t", "--max-distance", type=int, default=0, dest="max_distance", help="扫描页感知哈希允许的最大汉明距离, 大于0时查找近似重复的扫描页(逐像素比较确认), 默认0只删除完全相同的页面")
+    dedupe_parser.add_argument("-n", "--dry-run", action="store_true", dest="dry_run", default=False, help="只报告重复页面, 不删除")
+    dedupe_parser.add_argument("input_path", type=str, nargs="+", help="输入文件路径")
+    dedupe_parser.set_defaults(which='dedupe')
+
+    # 比较
+    diff_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="json报告保存路径, 默认保存到新版本旁边")
+    diff_parser.add_argument("--highlight", type=str, default=None, dest="highlight_path", help="标注差异的pdf保存路径")
+    diff_parser.add_argument("--dpi", type=int, default=50, dest="dpi", help="扫描页逐像素比较时的渲染分辨率")
+    diff_parser.add_argument("input_path1", type=str, help="旧版本")
+    diff_parser.add_argument("input_path2", type=str, help="新版本")
+    diff_parser.set_defaults(which='diff')
+
+    # 压缩
+    compress_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径")
+    compress_parser.add_argument("--dpi", type=int, default=150, dest="dpi", help="目标分辨率(按图片在页面上的显示尺寸计算), 超过的图片降采样")
+    compress_parser.add_argument("-q", "--quality", type=int, default=75, dest="quality", help="jpeg质量(1-100)")
+    compress_parser.add_argument("--no-bitonal", action="store_false", dest="bitonal", default=True, help="不将接近黑白的图片转为1位图")
+    compress_parser.add_argument("-j", "--workers", type=int, default=None, dest="workers", help="线程数, 默认为cpu核数")
+    compress_parser.add_argument("input_path", type=str, help="输入文件路径")
+    compress_parser.set_defaults(which='compress')
+
+    # 监视目录
+    watch_parser.add_argument("-o", "--output", type=str, required=True, dest="output_dir", help="输出目录")
+    watch_parser.add_argument("--ops", type=str, default="compress", dest="ops", help="操作链, 逗号分隔, 例如: 'rotate,ocr,bookmark,compress'")
+    watch_parser.add_argument("-c", "--config", type=str, default=None, dest="config_path", help="操作链配置文件(json, 可指定各操作的参数), 指定后忽略--ops")
+    watch_parser.add_argument("--db", type=str, default=None, dest="db_path", help="状态数据库路径, 默认为输出目录下的.pdf_toolbox_watch.db")
+    watch_parser.add_argument("--interval", type=float, default=10., dest="interval", help="轮询间隔(秒)")
+    watch_parser.add_argument("--settle", type=float, default=5., dest="settle", help="修改时间距今不足该秒数的文件视为仍在写入")
+    watch_parser.add_argument("-j", "--workers", type=int, default=1, dest="workers", help="工作进程数")
+    watch_parser.add_argument("--max-attempts", type=int, default=3, dest="max_attempts", help="同一文件内容失败后最多尝试次数")
+    watch_parser.add_argument("--once", action="store_true", dest="once", default=False, help="只处理一次后退出(用于cron)")
+    watch_parser.add_argument("input_dirs", type=str, nargs="+", help="输入目录")
+    watch_parser.set_defaults(which='watch')
+
+    # 索引
+    index_parser.add_argument("-d", "--db", type=str, default="pdf_index.db", dest="db_path", help="索引数据库路径")
+    index_parser.add_argument("--ocr", action="store_true", dest="use_ocr", default=False, help="无文本层的页面是否实时ocr(优先使用已有ocr结果)")
+    index_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="pdf语言")
+    index_parser.add_argument("--no-prune", action="store_false", dest="prune", default=True, help="不删除已不存在文件的索引")
+    index_parser.add_argument("input_path", type=str, nargs="+", help="输入文件路径或目录")
+    index_parser.set_defaults(which='index')
+
+    # 检索
+    search_parser.add_argument("-d", "--db", type=str, default="pdf_index.db", dest="db_path", help="索引数据库路径")
+    search_parser.add_argument("-n", "--limit", type=int, default=20, dest="limit", help="最多返回结果数")
+    search_parser.add_argument("--raw", action="store_true", dest="raw", default=False, help="使用fts5查询语法(AND/OR/NEAR等)")
+    search_parser.add_argument("query", type=str, help="检索词")
+    search_parser.set_defaults(which='search')
+
+    # 基准测试
+    bench_subparsers      = bench_parser.add_subparsers()
+    bench_run_parser      = bench_subparsers.add_parser("run", help="运行基准测试")
+    bench_compare_parser  = bench_subparsers.add_parser("compare", help="与基线结果比较")
+    bench_infer_parser    = bench_subparsers.add_parser("infer", help="比较不同推理配置的吞吐")
+
+    bench_run_parser.add_argument("-o", "--output", type=str, default="bench.json", dest="output_path", help="结果保存路径")
+    bench_run_parser.add_argument("--corpus-dir", type=str, default=None, dest="corpus_dir", help="合成语料保存目录(已存在则复用)")
+    bench_run_parser.add_argument("--scale", type=float, default=1.0, dest="scale", help="语料页数缩放比例")
+    bench_run_parser.add_argument("--repeat", type=int, default=1, dest="repeat", help="每个用例重复次数")
+    bench_run_parser.add_argument("--ocr", action="store_true", dest="include_ocr", default=False, help="是否运行ocr用例(需要本地已缓存模型)")
+    bench_run_parser.add_argument("-c", "--case", type=str, nargs="+", default=None, dest="case_names", help="仅运行指定用例")
+    bench_run_parser.set_defaults(bench_which='run')
+
+    bench_infer_parser.add_argument("-t", "--task", type=str, default="ocr", choices=['ocr', 'layout'], dest="task", help="测试的推理任务")
+    bench_infer_parser.add_argument("-n", "--pages", type=int, default=5, dest="pages", help="使用样例文档的前n页")
+    bench_infer_parser.add_argument("-l", "--lang", type=str, default="ch", choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="lang", help="ocr语言")
+    bench_infer_parser.add_argument("--backends", type=str, nargs="+", default=["paddle"], choices=BACKENDS, dest="backends", help="待比较的推理后端")
+    bench_infer_parser.add_argument("--threads", type=int, nargs="+", default=None, dest="threads", help="待比较的cpu线程数")
+    bench_infer_parser.add_argument("--mkldnn", type=str, nargs="+", default=["off"], choices=['on', 'off'], dest="mkldnn", help="待比较的MKL-DNN开关")
+    bench_infer_parser.add_argument("--precisions", type=str, nargs="+", default=["fp32"], choices=PRECISIONS, dest="precisions", help="待比较的推理精度")
+    bench_infer_parser.add_argument("-o", "--output", type=str, default=None, dest="output_path", help="结果保存路径(json)")
+    bench_infer_parser.add_argument("input_path", type=str, help="样例pdf")
+    bench_infer_parser.set_defaults(bench_which='infer')
+
+    bench_compare_parser.add_argument("baseline_path", type=str, help="基线结果路径")
+    bench_compare_parser.add_argument("current_path", type=str, help="当前结果路径")
+    bench_compare_parser.add_argument("-t", "--threshold", type=float, default=0.1, dest="threshold", help="回退阈值, 0.1表示增长10%%以上视为回退")
+    bench_compare_parser.set_defaults(bench_which='compare')
+
+    bench_parser.set_defaults(which='bench')
+
+    # 常驻服务
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1", dest="host", help="监听地址")
+    serve_parser.add_argument("-p", "--port", type=int, default=8765, dest="port", help="监听端口")
+    serve_parser.add_argument("--unix-socket", type=str, default=None, dest="unix_socket", help="监听unix socket路径(指定后忽略host/port)")
+    serve_parser.add_argument("-j", "--concurrency", type=int, default=1, dest="concurrency", help="工作进程数, 每个进程各自预加载模型")
+    serve_parser.add_argument("--queue-size", type=int, default=100, dest="queue_size", help="最大排队任务数")
+    serve_parser.add_argument("-l", "--preload-lang", type=str, nargs="*", default=[], choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="preload_langs", help="预加载ocr模型的语言")
+    serve_parser.add_argument("--preload-structure", action="store_true", dest="preload_structure", default=False, help="是否预加载版面分析模型")
+    serve_parser.set_defaults(which='serve')
+
+    # 模型管理
+    models_subparsers      = models_parser.add_subparsers()
+    models_preload_parser  = models_subparsers.add_parser("preload", help="将模型放入模型目录(从网络下载或从其他目录拷贝)")
+    models_verify_parser   = models_subparsers.add_parser("verify", help="检查模型是否齐全并校验文件")
+    models_list_parser     = models_subparsers.add_parser("list", help="列出模型及状态")
+
+    for p in (models_preload_parser, models_verify_parser, models_list_parser):
+        p.add_argument("-l", "--lang", type=str, nargs="*", default=None, choices=['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht'], dest="langs", help="ocr语言, 默认为全部语言(preload默认为ch)")
+        p.add_argument("--structure", action="store_true", dest="structure", default=False, help="包含版面分析、表格模型")
+    models_preload_parser.add_argument("--source", type=str, default=None, dest="source", help="从该模型目录拷贝(如联网机器上的~/.paddleocr), 不指定则从网络下载")
+    models_preload_parser.set_defaults(models_which='preload')
+    models_verify_parser.add_argument("--load", action="store_true", dest="load", default=False, help="同时加载各引擎并运行一次推理")
+    models_verify_parser.set_defaults(models_which='verify')
+    models_list_parser.set_defaults(models_which='list')
+
+    models_parser.set_defaults(which='models')
+
     args = parser.parse_args()
+    set_inference_config(backend=args.backend, cpu_threads=args.cpu_threads, enable_mkldnn=args.enable_mkldnn,
+                         model_dir=args.model_dir, precision=args.precision)
 
     # pprint(args)
     # assert False, "debug"
 
+    if args.profile_path:
+        enable_profile()
+        try:
+            run(args)
+        finally:
+            save_profile(args.profile_path)
+            print_summary()
+    else:
+        run(args)
+
+def run(args):
+
     if args.which == "bookmark":
         if args.bookmark_which == "add":
             if args.bookmark_add_which == 'ocr':
                 add_toc_from_ocr(args.input_path, lang=args.lang, use_double_columns=args.use_double_column, output_path=args.output_path)
             elif args.bookmark_add_which == 'file':
                 add_toc_from_file(args.toc_path, args.input_path, offset=args.offset, output_path=args.output_path)
+            elif args.bookmark_add_which == 'contents':
+                add_toc_from_contents(args.input_path, args.page_range, args.offset, args.lang, args.dpi, args.output_path)
+            elif args.bookmark_add_which == 'fonts':
+                add_toc_from_fonts(args.input_path, args.page_range, args.max_level, output_path=args.output_path)
         elif args.bookmark_which == "clean":
             transform_toc_file(args.input_path, args.is_add_indent, args.is_remove_trailing_dots, args.add_offset, args.output_path)
         elif args.bookmark_which == "extract":
@@ -212,7 +405,7 @@ def main():
                 path_list = glob.glob(os.path.join(args.input_path[0], "*.pdf"))
             else:
                 path_list = args.input_path
-        merge_pdf(path_list, args.output_path)
+        merge_pdf(path_list, args.output_path, args.dedupe)
     elif args.which == "insert":
         insert_pdf(args.input_path1, args.input_path2, args.pos, args.output_path)
     elif args.which == "slice":
@@ -220,10 +413,14 @@ def main():
     elif args.which == "remove":
         delete_pdf(args.input_path, args.page_range, args.output_path)
     elif args.which == "rotate":
-        rotate_pdf(args.input_path, args.angle, args.page_range, args.output_path)
+        if args.auto:
+            auto_rotate_pdf(args.input_path, args.page_range, args.deskew, args.max_skew, dpi=args.dpi, use_cls=args.use_cls,
+                            lang=args.lang, workers=args.workers, output_path=args.output_path)
+        else:
+            rotate_pdf(args.input_path, args.angle, args.page_range, args.output_path)
     elif args.which == "watermark":
         if not args.remove:
-            assert args.mark_text is None, "you must specify mark_text with '--mark-text'" 
+            assert args.mark_text is not None, "you must specify mark_text with '--mark-text'"
             mark_args = {
                 "size": args.font_size,
                 "space": args.space,
@@ -234,24 +431,36 @@ def main():
                 "font_height_crop": args.font_height_crop,
             }
             if args.type == "pdf":
-                add_mark_to_pdf(args.input_path, args.mark_text, args.quality, **mark_args)
+                add_mark_to_pdf(args.input_path, args.mark_text, args.quality, args.output_path, **mark_args)
             elif args.type == "image":
-                add_mark_to_image(args.input_path, args.mark_text, args.quality, **mark_args)
+                add_mark_to_image(args.input_path, args.mark_text, args.quality, args.output_path, **mark_args)
         else:
             if args.type == "pdf":
-                remove_mark_from_pdf(args.input_path, args.watermark_color, args.output_path)
+                remove_mark_from_pdf(args.input_path, args.watermark_color, args.output_path, args.max_memory)
             elif args.type == "image":
                 remove_mark_from_image(args.input_path, args.watermark_color, args.output_path)
     elif args.which == "encrypt":
-        if args.decrypt:
+        if os.path.isdir(args.input_path) or args.input_path.lower().endswith(".csv"):
+            bulk_encrypt_pdf(args.input_path, args.user_pass, args.owner_pass, args.permissions, args.output_path, args.decrypt, args.workers, args.report_path)
+        elif args.decrypt:
+            assert args.user_pass is not None, "未指定密码!"
             decrypt_pdf(args.input_path, args.user_pass, args.output_path)
         else:
-            encrypt_pdf(args.input_path, args.user_pass, args.owner_pass, args.output_path)
+            assert args.user_pass is not None, "未指定密码!"
+            encrypt_pdf(args.input_path, args.user_pass, args.owner_pass, args.output_path, args.permissions)
     elif args.which == "extract":
-        if args.type in ['figure', 'table', 'equation']:
-            extract_item_from_pdf(args.input_path, args.page_range, args.type, args.output_path)
+        if args.type == 'table' and args.format != 'image':
+            extract_tables_from_pdf(args.input_path, args.page_range, args.format, args.output_path, args.lang, args.dpi, args.max_memory)
+        elif args.type in ['figure', 'table', 'equation']:
+            extract_item_from_pdf(args.input_path, args.page_range, args.type, args.output_path, args.max_memory)
         elif args.type == 'text':
-            extract_text_from_pdf(args.input_path, args.output_path)
+            extract_text_from_pdf(args.input_path, args.output_path, args.strip_headers)
+        elif args.type in ['header', 'footer']:
+            if args.redact:
+                redact_headers_footers(args.input_path, args.page_range, args.type, args.output_path)
+            else:
+                assert args.format in ['csv', 'json'], "页眉/页脚只支持导出为csv或json!"
+                extract_headers_footers(args.input_path, args.page_range, args.type, args.format, args.output_path)
     elif args.which == 'convert':
         if args.type == "image-to-pdf":
             convert_images_to_pdf(args.input_path, args.format_list, args.output_path)
@@ -259,15 +468,70 @@ def main():
             convert_pdf_to_images(args.input_path, args.page_range, args.output_path)
     elif args.which == "ocr":
         p = Path(args.input_path)
-        if p.suffix in (".png", ".jpg", ".jpeg"):
+        if args.template_path is not None:
+            ocr_forms(args.input_path, args.template_path, args.output_path, args.lang, args.dpi, args.use_text_layer, args.workers)
+        elif p.suffix in (".png", ".jpg", ".jpeg"):
             ocr_from_image(args.input_path, args.lang, args.output_path, args.offset, args.show_log)
         elif p.suffix in (".pdf"):
-            ocr_from_pdf(args.input_path, args.page_range, args.lang, args.output_path, args.offset, args.show_log)
+            ocr_from_pdf(args.input_path, args.page_range, args.lang, args.output_path, args.offset, args.show_log, args.max_memory)
         pass
     elif args.which == "split":
         split_pdf(args.input_path, args.pages_per_part, args.output_path)
     elif args.which == "debug":
-        debug_item_from_pdf(args.input_path, args.page_range, args.type, args.output_path)
+        if args.type in ['header', 'footer']:
+            debug_headers_footers(args.input_path, args.page_range, args.type, args.output_path)
+        else:
+            debug_item_from_pdf(args.input_path, args.page_range, args.type, args.output_path)
+    elif args.which == "dedupe":
+        dedupe_pdf(args.input_path, args.max_distance, dry_run=args.dry_run, output_path=args.output_path)
+    elif args.which == "diff":
+        diff_pdf(args.input_path1, args.input_path2, args.output_path, args.highlight_path, args.dpi)
+    elif args.which == "compress":
+        compress_pdf(args.input_path, args.dpi, args.quality, args.bitonal, workers=args.workers, output_path=args.output_path)
+    elif args.which == "watch":
+        ops = load_ops(args.config_path) if args.config_path else args.ops.split(",")
+        watch(args.input_dirs, args.output_dir, ops, args.db_path, args.interval, args.settle, args.workers, args.max_attempts, args.once)
+    elif args.which == "index":
+        build_index(args.input_path, args.db_path, args.use_ocr, args.lang, args.prune)
+    elif args.which == "search":
+        for path, page, snippet in search_index(args.query, args.db_path, args.limit, args.raw):
+            print(f"{path}:{page}: {snippet}")
+    elif args.which == "bench":
+        from pdf_toolbox.bench import compare_benchmarks, run_benchmarks
+        if args.bench_which == "run":
+            run_benchmarks(args.output_path, args.corpus_dir, args.scale, args.repeat, args.include_ocr, args.case_names)
+        elif args.bench_which == "infer":
+            from pdf_toolbox.bench.infer import benchmark_inference, make_configs
+            configs = make_configs(args.backends, args.threads, [v == "on" for v in args.mkldnn], args.precisions, args.model_dir)
+            benchmark_inference(args.input_path, args.task, configs, args.pages, args.lang, args.output_path)
+        elif args.bench_which == "compare":
+            if compare_benchmarks(args.baseline_path, args.current_path, args.threshold):
+                sys.exit(1)
+    elif args.which == "serve":
+        from pdf_toolbox.server import serve
+        serve(args.host, args.port, args.unix_socket, args.concurrency, args.queue_size, args.preload_langs, args.preload_structure)
+    elif args.which == "models":
+        from pdf_toolbox.utils.models import LANGS, bundle_dir, model_status, preload_models, verify_models, warmup_engines
+        if args.models_which == "preload":
+            status = preload_models(args.langs or ['ch'], args.structure, source=args.source)
+        else:
+            status = model_status(LANGS if args.langs is None else args.langs, args.structure or args.langs is None)
+        print(bundle_dir())
+        for v in status:
+            print(f"  {v['name']:<16}{'ok' if v['exists'] else 'missing':<10}{v['size']/1024/1024:>8.1f}MB  {v['path']}")
+        if args.models_which == "verify":
+            langs = LANGS if args.langs is None else args.langs
+            structure = args.structure or args.langs is None
+            problems = verify_models(langs, structure)
+            if not problems and args.load:
+                try:
+                    warmup_engines(langs, structure)
+                except Exception as e:
+                    problems.append(f"load failed: {e!r}")
+            for v in problems:
+                print(v)
+            if problems:
+                sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
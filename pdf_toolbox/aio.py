@@ -0,0 +1,158 @@
+"""asyncio接口: lib中各操作的awaitable版本, 在线程池或进程池中执行, 不阻塞事件循环
+
+用法:
+    from pdf_toolbox import aio
+
+    aio.configure(max_workers=4)
+    data = await aio.slice_pdf(pdf_bytes, "1-3")
+    async for page_number, text in aio.iter_ocr_pdf(pdf_bytes, lang="ch"):
+        ...
+
+PyMuPDF不支持在同一进程的多个线程中并发使用, 因此:
+    - 默认使用进程池执行各操作, 参数需要可序列化, 请传入文件路径或bytes而不是fitz.Document
+    - 使用线程池(use_process=False或自定义的非进程池执行器)时, 各操作统一在一个专用线程中依次执行, 不会并行
+    - 当前进程内的PyMuPDF调用(iter_ocr_pdf的打开和渲染)总是在该专用线程中执行, 只有ocr识别在执行器中并行
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from pdf_toolbox.lib import basic, bookmark, compress, convert, diff, encrypt, extract, header_footer, orientation, watermark
+from pdf_toolbox.lib import ocr
+from pdf_toolbox.lib.ocr import format_ocr_result, ocr_image
+from pdf_toolbox.utils import PdfSource, open_pdf, parse_range, render_page
+
+_executor: Executor = None
+_fitz_executor: ThreadPoolExecutor = None  # 当前进程内所有PyMuPDF调用使用的专用线程
+_max_pending: int = None
+_semaphore: asyncio.Semaphore = None
+_semaphore_loop = None
+
+
+def configure(max_workers: int = None, use_process: bool = True, max_pending: int = None, executor: Executor = None):
+    """配置执行器
+
+    Args:
+        max_workers (int, optional): 线程/进程数. Defaults to None(cpu核数).
+        use_process (bool, optional): 是否使用进程池; 使用线程池时各操作在专用线程中依次执行(PyMuPDF不支持多线程并发). Defaults to True.
+        max_pending (int, optional): 同时提交到执行器的最大任务数, 超出时调用方等待(背压). Defaults to None(2倍worker数).
+        executor (Executor, optional): 直接指定执行器, 此时忽略max_workers和use_process. Defaults to None.
+    """
+    global _executor, _max_pending, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    max_workers = max_workers or os.cpu_count() or 1
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers) if use_process else ThreadPoolExecutor(max_workers, thread_name_prefix="pdf_toolbox")
+    _executor = executor
+    _max_pending = max_pending or 2 * max_workers
+    _semaphore = None
+
+def shutdown(wait: bool = True):
+    global _executor, _fitz_executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+    if _fitz_executor is not None:
+        _fitz_executor.shutdown(wait=wait)
+        _fitz_executor = None
+
+def _get_fitz_executor() -> ThreadPoolExecutor:
+    global _fitz_executor
+    if _fitz_executor is None:
+        _fitz_executor = ThreadPoolExecutor(1, thread_name_prefix="pdf_toolbox-fitz")
+    return _fitz_executor
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(_max_pending)
+        _semaphore_loop = loop
+    return _semaphore
+
+async def run(func, *args, **kwargs):
+    """在执行器中运行同步函数, 提交前受max_pending限制; func不能在当前进程中使用PyMuPDF, 否则使用run_fitz"""
+    if _executor is None:
+        configure()
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def run_fitz(func, *args, **kwargs):
+    """运行使用PyMuPDF的同步函数: 执行器为进程池时在工作进程中运行, 否则在专用线程中依次运行"""
+    if _executor is None:
+        configure()
+    if isinstance(_executor, ProcessPoolExecutor):
+        return await run(func, *args, **kwargs)
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_fitz_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_fitz(func, *args, **kwargs)
+    return wrapper
+
+slice_pdf             = _wrap(basic.slice_pdf)
+split_pdf             = _wrap(basic.split_pdf)
+merge_pdf             = _wrap(basic.merge_pdf)
+rotate_pdf            = _wrap(basic.rotate_pdf)
+auto_rotate_pdf       = _wrap(orientation.auto_rotate_pdf)
+insert_pdf            = _wrap(basic.insert_pdf)
+delete_pdf            = _wrap(basic.delete_pdf)
+encrypt_pdf           = _wrap(encrypt.encrypt_pdf)
+decrypt_pdf           = _wrap(encrypt.decrypt_pdf)
+compress_pdf          = _wrap(compress.compress_pdf)
+diff_pdf              = _wrap(diff.diff_pdf)
+add_toc_from_ocr      = _wrap(bookmark.add_toc_from_ocr)
+add_toc_from_fonts    = _wrap(bookmark.add_toc_from_fonts)
+add_toc_from_file     = _wrap(bookmark.add_toc_from_file)
+add_toc_from_contents = _wrap(bookmark.add_toc_from_contents)
+extract_toc           = _wrap(bookmark.extract_toc)
+add_mark_to_pdf       = _wrap(watermark.add_mark_to_pdf)
+remove_mark_from_pdf  = _wrap(watermark.remove_mark_from_pdf)
+extract_text_from_pdf = _wrap(extract.extract_text_from_pdf)
+extract_item_from_pdf = _wrap(extract.extract_item_from_pdf)
+extract_tables_from_pdf = _wrap(extract.extract_tables_from_pdf)
+extract_headers_footers = _wrap(header_footer.extract_headers_footers)
+redact_headers_footers  = _wrap(header_footer.redact_headers_footers)
+convert_pdf_to_images = _wrap(convert.convert_pdf_to_images)
+convert_images_to_pdf = _wrap(convert.convert_images_to_pdf)
+ocr_zones             = _wrap(ocr.ocr_zones)
+
+
+def _render(doc, page_index: int):
+    return render_page(doc[page_index])
+
+async def iter_ocr_pdf(doc_path: PdfSource, page_range: str = 'all', lang: str = 'ch', offset: float = 5., show_log: bool = False):
+    """逐页ocr的异步迭代器, 每识别完一页产出(页码, 文本)
+
+    打开和渲染页面在PyMuPDF专用线程中进行, 识别在配置的执行器中进行; 任务被取消时不再提交后续页面
+    """
+    loop = asyncio.get_running_loop()
+    doc = await loop.run_in_executor(_get_fitz_executor(), open_pdf, doc_path)
+    if page_range == "all":
+        roi_indices = list(range(len(doc)))
+    else:
+        roi_indices = parse_range(page_range)
+    for page_index in roi_indices:
+        img = await loop.run_in_executor(_get_fitz_executor(), _render, doc, page_index)
+        result = await run(ocr_image, img, lang, show_log)
+        yield page_index+1, format_ocr_result(result, offset)
+
+async def ocr_from_pdf(doc_path: PdfSource, page_range: str = 'all', lang: str = 'ch', offset: float = 5., show_log: bool = False, progress=None) -> list:
+    """逐页ocr并返回每页识别文本的列表, 可在页与页之间取消
+
+    Args:
+        progress (callable, optional): 每完成一页调用progress(页码, 文本). Defaults to None.
+    """
+    texts = []
+    async for page_number, text in iter_ocr_pdf(doc_path, page_range, lang, offset, show_log):
+        texts.append(text)
+        if progress is not None:
+            progress(page_number, text)
+    return texts
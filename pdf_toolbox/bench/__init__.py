@@ -0,0 +1,2 @@
+from .corpus import build_corpus
+from .runner import compare_benchmarks, run_benchmarks
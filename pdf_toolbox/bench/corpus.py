@@ -0,0 +1,99 @@
+"""离线生成确定性的合成pdf语料, 用于性能基准测试
+"""
+import random
+from pathlib import Path
+
+import fitz
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud").split()
+
+# 语料名称 -> (生成函数, scale=1时的页数)
+CORPUS_SPECS = {}
+
+
+def register(name: str, pages: int):
+    def wrapper(func):
+        CORPUS_SPECS[name] = (func, pages)
+        return func
+    return wrapper
+
+
+def _fill_text_page(page: fitz.Page, rng: random.Random, chapter: int):
+    page.insert_text((72, 72), f"{chapter} Chapter {chapter}", fontsize=20, fontname="hebo")
+    y = 110
+    while y < page.rect.height - 72:
+        line = " ".join(rng.choice(WORDS) for _ in range(10))
+        page.insert_text((72, y), line, fontsize=10)
+        y += 14
+    page.insert_text((page.rect.width / 2, page.rect.height - 36), f"{page.number+1}", fontsize=9)
+
+
+@register("text", pages=50)
+def gen_text_pdf(output_path: str, pages: int, seed: int = 0):
+    """纯文本页面(含章节标题, 可用于书签相关测试)"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        _fill_text_page(page, rng, i // 5 + 1)
+    doc.save(output_path, garbage=3, deflate=True)
+
+
+@register("scan", pages=10)
+def gen_scan_pdf(output_path: str, pages: int, seed: int = 0, dpi: int = 150):
+    """仅含图片的扫描件页面(文本页渲染成图片后重新插入)"""
+    rng = random.Random(seed)
+    src = fitz.open()
+    doc = fitz.open()
+    for i in range(pages):
+        page = src.new_page()
+        _fill_text_page(page, rng, i // 5 + 1)
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        new_page = doc.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, stream=pix.tobytes("png"))
+    doc.save(output_path, garbage=3, deflate=True)
+
+
+@register("watermark", pages=3)
+def gen_watermark_pdf(output_path: str, pages: int, seed: int = 0):
+    """带灰色(#808080)斜向文字水印的扫描页面"""
+    rng = random.Random(seed)
+    src = fitz.open()
+    doc = fitz.open()
+    for i in range(pages):
+        page = src.new_page()
+        _fill_text_page(page, rng, i // 5 + 1)
+        for y in range(100, int(page.rect.height), 150):
+            page.insert_text((60, y), "CONFIDENTIAL", fontsize=40, color=(0.5, 0.5, 0.5),
+                             morph=(fitz.Point(60, y), fitz.Matrix(-30)))
+        pix = page.get_pixmap()
+        new_page = doc.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, stream=pix.tobytes("png"))
+    doc.save(output_path, garbage=3, deflate=True)
+
+
+@register("huge", pages=2000)
+def gen_huge_pdf(output_path: str, pages: int, seed: int = 0):
+    """页数很多的短文本页面"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), " ".join(rng.choice(WORDS) for _ in range(8)), fontsize=11)
+    doc.save(output_path, garbage=3, deflate=True)
+
+
+def build_corpus(output_dir: str, scale: float = 1.0, seed: int = 0) -> dict:
+    """生成全部语料, 返回 {语料名称: (文件路径, 页数)}, 已存在的文件直接复用
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    corpus = {}
+    for name, (func, pages) in CORPUS_SPECS.items():
+        pages = max(1, int(pages * scale))
+        path = output_dir / f"{name}-{pages}-{seed}.pdf"
+        if not path.exists():
+            func(str(path), pages, seed)
+        corpus[name] = (str(path), pages)
+    return corpus
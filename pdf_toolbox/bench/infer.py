@@ -0,0 +1,85 @@
+"""比较不同推理配置(后端、线程数、MKL-DNN、精度)在样例文档上的吞吐
+"""
+import itertools
+import json
+import multiprocessing
+import time
+
+import fitz
+from loguru import logger
+
+TASKS = ("ocr", "layout")
+
+
+def make_configs(backends: list = None, cpu_threads: list = None, mkldnn: list = None, precisions: list = None, model_dir: str = None) -> list:
+    """各参数取值的笛卡尔积, 返回配置(关键字参数)列表"""
+    configs = []
+    for backend, threads, enable_mkldnn, precision in itertools.product(
+            backends or ["paddle"], cpu_threads or [None], mkldnn or [False], precisions or ["fp32"]):
+        if backend == "onnx" and enable_mkldnn:
+            continue  # MKL-DNN只对paddle后端有效
+        configs.append({"backend": backend, "cpu_threads": threads, "enable_mkldnn": enable_mkldnn,
+                        "model_dir": model_dir, "precision": precision})
+    return configs
+
+def _run_config(input_path: str, task: str, config: dict, pages: int, lang: str) -> dict:
+    from pdf_toolbox.utils import get_ocr_engine, get_structure_engine, render_page
+    from pdf_toolbox.utils.inference import InferenceConfig, set_inference_config
+
+    set_inference_config(InferenceConfig(**config))
+    doc = fitz.open(input_path)
+    imgs = [render_page(doc[i]) for i in range(min(pages, doc.page_count))]  # 渲染不计入耗时
+
+    start = time.perf_counter()
+    if task == "ocr":
+        engine = get_ocr_engine(lang)
+        infer = lambda img: engine.ocr(img, cls=False)
+    else:
+        engine = get_structure_engine()
+        infer = engine
+    init_time = time.perf_counter() - start
+    infer(imgs[0])  # 预热, 不计入耗时
+
+    start = time.perf_counter()
+    for img in imgs:
+        infer(img)
+    elapsed = time.perf_counter() - start
+    return {"init_time": init_time, "wall_time": elapsed, "pages": len(imgs),
+            "pages_per_sec": len(imgs) / elapsed if elapsed > 0 else None}
+
+def benchmark_inference(input_path: str, task: str = "ocr", configs: list = None, pages: int = 5, lang: str = 'ch', output_path: str = None) -> list:
+    """在样例文档的前pages页上依次测试各推理配置, 每个配置在单独的子进程中运行
+
+    Args:
+        input_path (str): 样例pdf
+        task (str, optional): ocr或layout. Defaults to "ocr".
+        configs (list, optional): 配置列表, 见make_configs. Defaults to None(默认配置).
+        output_path (str, optional): 结果保存路径(json). Defaults to None.
+    """
+    if task not in TASKS:
+        raise ValueError(f"不支持的任务: {task}, 可选: {', '.join(TASKS)}!")
+    configs = configs or make_configs()
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for config in configs:
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            try:
+                res = pool.apply(_run_config, (input_path, task, config, pages, lang))
+            except Exception as e:
+                logger.error(f"{config}: {e!r}")
+                res = {"error": repr(e)}
+        results.append({"config": config, **res})
+
+    print(f"{'backend':<10}{'threads':>8}{'mkldnn':>8}{'precision':>10}{'init(s)':>10}{'pages/s':>12}")
+    for res in results:
+        config = res["config"]
+        threads = config["cpu_threads"] or "-"
+        head = f"{config['backend']:<10}{threads:>8}{str(config['enable_mkldnn']):>8}{config['precision']:>10}"
+        if "error" in res:
+            print(f"{head}{'error':>12}")
+        else:
+            print(f"{head}{res['init_time']:>10.2f}{res['pages_per_sec']:>12.2f}")
+    if output_path is not None:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
@@ -0,0 +1,258 @@
+"""运行基准测试用例并与基线结果比较
+"""
+import json
+import multiprocessing
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+from loguru import logger
+
+from pdf_toolbox.bench.corpus import build_corpus
+from pdf_toolbox.lib.basic import delete_pdf, insert_pdf, merge_pdf, rotate_pdf, slice_pdf, split_pdf
+from pdf_toolbox.lib.bookmark import add_toc_from_fonts
+from pdf_toolbox.lib.compress import compress_pdf
+from pdf_toolbox.lib.convert import convert_images_to_pdf, convert_pdf_to_images
+from pdf_toolbox.lib.encrypt import decrypt_pdf, encrypt_pdf
+from pdf_toolbox.lib.extract import extract_item_from_pdf, extract_text_from_pdf
+from pdf_toolbox.lib.ocr import ocr_from_pdf
+from pdf_toolbox.lib.watermark import add_mark_to_pdf, remove_mark_from_pdf
+from pdf_toolbox.utils.models import bundle_dir, model_status
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# 用例名称 -> (语料名称, 是否需要ocr模型, 执行函数, 准备函数)
+# 执行函数签名: func(input_path, workdir) -> 处理页数(返回None则按语料页数计)
+# 准备函数签名: setup(input_path, workdir) -> 新的input_path, 不计入耗时
+CASES = {}
+
+
+def case(name: str, corpus: str, ocr: bool = False, setup=None):
+    def wrapper(func):
+        CASES[name] = (corpus, ocr, func, setup)
+        return func
+    return wrapper
+
+
+@case("merge", "text")
+def bench_merge(input_path, workdir):
+    merge_pdf([input_path] * 4, str(Path(workdir) / "merged.pdf"))
+    return fitz.open(input_path).page_count * 4
+
+@case("slice", "huge")
+def bench_slice(input_path, workdir):
+    n = fitz.open(input_path).page_count
+    slice_pdf(input_path, f"1-{n//20},{n//4}-{n//2},{n*3//4}-{n*4//5}")
+
+@case("split", "huge")
+def bench_split(input_path, workdir):
+    split_pdf(input_path, 100)
+
+@case("rotate", "text")
+def bench_rotate(input_path, workdir):
+    rotate_pdf(input_path, 90)
+
+@case("insert", "text")
+def bench_insert(input_path, workdir):
+    insert_pdf(input_path, input_path, fitz.open(input_path).page_count // 2)
+
+@case("remove", "huge")
+def bench_remove(input_path, workdir):
+    delete_pdf(input_path, f"1-{fitz.open(input_path).page_count//2}")
+
+@case("encrypt", "text")
+def bench_encrypt(input_path, workdir):
+    encrypt_pdf(input_path, "123456")
+
+def _setup_decrypt(input_path, workdir):
+    output_path = str(Path(workdir) / "encrypted.pdf")
+    encrypt_pdf(input_path, "123456", output_path=output_path)
+    return output_path
+
+@case("decrypt", "text", setup=_setup_decrypt)
+def bench_decrypt(input_path, workdir):
+    decrypt_pdf(input_path, "123456")
+
+@case("pdf_to_images", "text")
+def bench_pdf_to_images(input_path, workdir):
+    convert_pdf_to_images(input_path)
+
+def _setup_images_to_pdf(input_path, workdir):
+    output_dir = Path(workdir) / "images"
+    convert_pdf_to_images(input_path, output_path=str(output_dir))
+    return str(output_dir)
+
+@case("images_to_pdf", "scan", setup=_setup_images_to_pdf)
+def bench_images_to_pdf(input_path, workdir):
+    convert_images_to_pdf(input_path, ["png"], str(Path(workdir) / "images.pdf"))
+
+@case("add_watermark", "scan")
+def bench_add_watermark(input_path, workdir):
+    add_mark_to_pdf(input_path, "CONFIDENTIAL")
+
+@case("compress", "scan")
+def bench_compress(input_path, workdir):
+    compress_pdf(input_path, dpi=100)
+
+@case("remove_watermark", "watermark")
+def bench_remove_watermark(input_path, workdir):
+    remove_mark_from_pdf(input_path, "#808080")
+
+@case("extract_text", "text")
+def bench_extract_text(input_path, workdir):
+    extract_text_from_pdf(input_path)
+
+@case("bookmark_fonts", "text")
+def bench_bookmark_fonts(input_path, workdir):
+    add_toc_from_fonts(input_path)
+
+@case("ocr", "scan", ocr=True)
+def bench_ocr(input_path, workdir):
+    ocr_from_pdf(input_path, "1-3")
+    return 3
+
+@case("extract_figure", "scan", ocr=True)
+def bench_extract_figure(input_path, workdir):
+    extract_item_from_pdf(input_path, "1-3", "figure")
+    return 3
+
+
+def _dir_size(path: Path) -> dict:
+    return {str(v): v.stat().st_size for v in path.rglob("*") if v.is_file()}
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux下单位为KB, macOS下单位为B
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+def _run_case(name: str, input_path: str, pages: int):
+    """在独立子进程中执行单个用例, 返回测量结果"""
+    _, _, func, setup = CASES[name]
+    with tempfile.TemporaryDirectory(prefix=f"pdf-toolbox-bench-{name}-") as workdir:
+        # lib中的函数默认把结果写到输入文件旁边, 因此先复制到临时目录
+        input_path = shutil.copy(input_path, workdir)
+        if setup is not None:
+            input_path = setup(input_path, workdir)
+        before = _dir_size(Path(workdir))
+        start = time.perf_counter()
+        processed = func(input_path, workdir)
+        elapsed = time.perf_counter() - start
+        after = _dir_size(Path(workdir))
+    processed = processed or pages
+    return {
+        "wall_time": elapsed,
+        "pages": processed,
+        "pages_per_sec": processed / elapsed if elapsed > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "output_size": sum(size for path, size in after.items() if before.get(path) != size),
+    }
+
+def has_cached_ocr_models() -> bool:
+    """ocr用例所需的模型(中文ocr和版面分析)是否都已在模型目录(--model-dir/PDF_TOOLBOX_MODEL_DIR, 默认~/.paddleocr)中"""
+    try:
+        return all(v['exists'] for v in model_status(["ch"], structure=True))
+    except ImportError:  # 未安装paddleocr
+        return False
+
+def run_benchmarks(output_path: str, corpus_dir: str = None, scale: float = 1.0, repeat: int = 1,
+                   include_ocr: bool = False, case_names: list = None) -> dict:
+    """运行基准测试, 每个用例在单独的子进程中运行以便统计峰值内存, 结果保存为json
+
+    Args:
+        output_path (str): 结果保存路径
+        corpus_dir (str, optional): 语料目录, 默认为系统临时目录. Defaults to None.
+        scale (float, optional): 语料页数缩放比例. Defaults to 1.0.
+        repeat (int, optional): 每个用例重复次数, 取最短耗时. Defaults to 1.
+        include_ocr (bool, optional): 是否运行ocr用例(需要本地已缓存模型). Defaults to False.
+        case_names (list, optional): 仅运行指定用例. Defaults to None.
+    """
+    if corpus_dir is None:
+        corpus_dir = str(Path(tempfile.gettempdir()) / "pdf-toolbox-bench-corpus")
+    corpus = build_corpus(corpus_dir, scale)
+    if include_ocr and not has_cached_ocr_models():
+        logger.warning(f"模型目录{bundle_dir()}中缺少ocr用例所需的模型, 跳过ocr用例")
+        include_ocr = False
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name, (corpus_name, ocr, _, _) in CASES.items():
+        if case_names and name not in case_names:
+            continue
+        if ocr and not include_ocr:
+            continue
+        input_path, pages = corpus[corpus_name]
+        runs = []
+        for _ in range(repeat):
+            with ctx.Pool(1, maxtasksperchild=1) as pool:
+                try:
+                    runs.append(pool.apply(_run_case, (name, input_path, pages)))
+                except Exception as e:
+                    logger.error(f"{name}: {e!r}")
+                    break
+        if not runs:
+            results[name] = {"error": True}
+            continue
+        best = min(runs, key=lambda x: x["wall_time"])
+        best["peak_rss_mb"] = max(v["peak_rss_mb"] or 0 for v in runs) or None
+        results[name] = best
+        logger.info(f"{name}: {best['wall_time']:.3f}s, {best['pages_per_sec']:.1f} pages/s")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pymupdf": fitz.VersionBind,
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_results(results)
+    return report
+
+def print_results(results: dict):
+    print(f"{'case':<20}{'time(s)':>10}{'pages/s':>12}{'rss(MB)':>10}{'size(KB)':>12}")
+    for name, res in results.items():
+        if res.get("error"):
+            print(f"{name:<20}{'error':>10}")
+            continue
+        rss = f"{res['peak_rss_mb']:.1f}" if res["peak_rss_mb"] else "-"
+        print(f"{name:<20}{res['wall_time']:>10.3f}{res['pages_per_sec']:>12.1f}{rss:>10}{res['output_size']/1024:>12.1f}")
+
+def compare_benchmarks(baseline_path: str, current_path: str, threshold: float = 0.1) -> list:
+    """比较两次基准测试结果, 耗时或峰值内存增长超过threshold的视为性能回退, 返回回退项列表
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'case':<20}{'metric':<14}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name in baseline:
+        if name not in current or baseline[name].get("error") or current[name].get("error"):
+            continue
+        for metric in ("wall_time", "peak_rss_mb", "output_size"):
+            old, new = baseline[name].get(metric), current[name].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ""
+            if change > threshold:
+                regressions.append((name, metric, old, new))
+                flag = " !"
+            print(f"{name:<20}{metric:<14}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+    if regressions:
+        logger.warning(f"发现{len(regressions)}项性能回退(阈值{threshold:.0%})")
+    return regressions
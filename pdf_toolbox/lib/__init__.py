@@ -4,3 +4,9 @@ from .bookmark import *
 from .convert import *
 from .encrypt import *
 from .extract import *
+from .search import *
+from .dedupe import *
+from .compress import *
+from .diff import *
+from .header_footer import *
+from .orientation import *
@@ -6,32 +6,45 @@ from typing import List
 import fitz
 from tqdm import tqdm
 
-from pdf_toolbox.utils import parse_range
+from pdf_toolbox.lib.dedupe import remove_duplicate_pages
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf, parse_range, save_pdf
 
 
-def slice_pdf(doc_path: str, page_range: str = "all", is_multiple: bool = False, output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+def slice_pdf(doc_path: PdfSource, page_range: str = "all", is_multiple: bool = False, output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path)
     if page_range == "all":
         roi_indices = list(range(len(doc)))
     else:
         roi_indices = parse_range(page_range, is_multiple)
     if not is_multiple:
         doc.select(roi_indices)
-        if output_path is None:
-            output_path = str(p.parent / f"{p.stem}-slice.pdf")
-        doc.save(output_path)
+        return save_pdf(doc, doc_path, output_path, "-slice")
     else:
-        if output_path is None:
-            output_dir = p.parent / "parts"
+        if output_path is not None:
+            output_dir = Path(output_path)
+        elif is_path(doc_path):
+            output_dir = Path(doc_path).parent / "parts"
+        else:
+            output_dir = None
+        if output_dir is not None:
             output_dir.mkdir(parents=True, exist_ok=True)
+            stem = Path(doc_path).stem if is_path(doc_path) else "part"
+        # 每个部分都从原文件重新打开, 非文件输入则从序列化后的bytes重新打开
+        data = None if is_path(doc_path) else doc.tobytes()
+        parts = []
         for indices in roi_indices:
-            doc: fitz.Document = fitz.open(doc_path)
+            doc: fitz.Document = fitz.open(doc_path) if data is None else fitz.open(stream=data, filetype="pdf")
             doc.select(indices)
-            doc.save(str(output_dir / f"{p.stem}-{indices[0]+1}-{indices[-1]+1}.pdf"))
+            if output_dir is not None:
+                savepath = str(output_dir / f"{stem}-{indices[0]+1}-{indices[-1]+1}.pdf")
+                doc.save(savepath)
+                parts.append(savepath)
+            else:
+                parts.append(doc if isinstance(doc_path, fitz.Document) else doc.tobytes())
+        return parts
 
-def split_pdf(doc_path: str, pages_per_part: int = 10, output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
+def split_pdf(doc_path: PdfSource, pages_per_part: int = 10, output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path)
     ranges = []
     for i in range(1,doc.page_count+1,pages_per_part):
         if i+pages_per_part > doc.page_count:
@@ -39,21 +52,28 @@ def split_pdf(doc_path: str, pages_per_part: int = 10, output_path: str = None):
         else:
             ranges.append(f"{i}-{i+pages_per_part-1}")
     ranges =  ",".join(ranges)
-    slice_pdf(doc_path, ranges, is_multiple=True, output_path=output_path)
+    # 与slice_pdf的返回约定一致: Document输入返回Document列表, bytes/文件对象输入返回bytes列表(文件对象已被读取, 传入序列化后的数据)
+    if is_path(doc_path) or isinstance(doc_path, fitz.Document):
+        src = doc_path
+    else:
+        src = doc.tobytes()
+    return slice_pdf(src, ranges, is_multiple=True, output_path=output_path)
 
-def merge_pdf(doc_path_list: List[str], output_path: str = None):
-    doc = fitz.open(doc_path_list[0])
-    p = Path(doc_path_list[0])
+def merge_pdf(doc_path_list: List[PdfSource], output_path: str = None, dedupe: bool = False, max_distance: int = 0):
+    doc = open_pdf(doc_path_list[0])
     for doc_path in doc_path_list[1:]:
-        doc_temp = fitz.open(doc_path)
+        doc_temp = open_pdf(doc_path)
         doc.insert_pdf(doc_temp)
-    if output_path is None:
+    if dedupe:
+        # 删除合并后重复的页面(如重复合并的文件), 保留首次出现的页面; 默认只删除完全相同的页面
+        remove_duplicate_pages(doc, max_distance)
+    if output_path is None and is_path(doc_path_list[0]):
+        p = Path(doc_path_list[0])
         output_path = str(p.parent / f"[all-merged].pdf")
-    doc.save(output_path)
+    return save_pdf(doc, doc_path_list[0], output_path)
 
-def rotate_pdf(doc_path: str, angle: int, page_range: str = "all", output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+def rotate_pdf(doc_path: PdfSource, angle: int, page_range: str = "all", output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path)
     if page_range=="all":
         roi_indices = list(range(len(doc)))
     else:
@@ -61,31 +81,23 @@ def rotate_pdf(doc_path: str, angle: int, page_range: str = "all", output_path:
     for page_index in roi_indices: # iterate over pdf pages
         page = doc[page_index] # get the page
         page.set_rotation(angle) # rotate the page
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-rotated.pdf")
-    doc.save(output_path)
+    return save_pdf(doc, doc_path, output_path, "-rotated")
 
-def insert_pdf(doc_path1: str, doc_path2: str, pos: int, output_path: str = None):
-    p = Path(doc_path1)
-    doc: fitz.Document = fitz.open(doc_path1)
-    doc2: fitz.Document = fitz.open(doc_path2)
+def insert_pdf(doc_path1: PdfSource, doc_path2: PdfSource, pos: int, output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path1)
+    doc2: fitz.Document = open_pdf(doc_path2)
     n1, n2 = doc.page_count, doc2.page_count
     doc.insert_pdf(doc2)
     page_range = f"1-{pos},{n1+1}-{n1+n2},{pos+1}-{n1}"
     roi_indices = parse_range(page_range)
     doc.select(roi_indices)
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-inserted.pdf")
-    doc.save(output_path)
+    return save_pdf(doc, doc_path1, output_path, "-inserted")
 
-def delete_pdf(doc_path: str, page_range: str, output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+def delete_pdf(doc_path: PdfSource, page_range: str, output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path)
     if page_range=="all":
         roi_indices = list(range(len(doc)))
     else:
         roi_indices = parse_range(page_range)
     doc.delete_pages(roi_indices)
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-removed.pdf")
-    doc.save(output_path)
+    return save_pdf(doc, doc_path, output_path, "-removed")
@@ -1,22 +1,22 @@
 import glob
 import json
 import re
-import shutil
 import traceback
 from pathlib import Path
+from typing import Union
 
-import cv2
 import fitz
 import numpy as np
 from loguru import logger
-from paddleocr import PaddleOCR
 from tqdm import tqdm
 
-from pdf_toolbox.utils import ppstructure_analysis
+from pdf_toolbox.utils import (PdfSource, get_ocr_engine, imread, is_path, open_pdf, parse_range,
+                               ppstructure_analysis, render_page, save_pdf)
+from pdf_toolbox.utils.profiler import stage
 
 
 def title_preprocess(title: str):
-    """提取标题层级和标题内容
+    """提取标题层级和标题内容, numbered表示层级是否来自编号规则(否则来自缩进)
     """
     try:
         title = title.rstrip()
@@ -26,6 +26,7 @@ def title_preprocess(title: str):
         if m is not None:
             res['text'] = f"{m.group(1)} {m.group(3)}"
             res['level'] = len([v for v in m.group(1).split(".") if v])
+            res['numbered'] = True
             return res
         
         # 匹配：第1章 标题
@@ -33,6 +34,7 @@ def title_preprocess(title: str):
         if m is not None:
             res['text'] = f"{m.group(1)} {m.group(2)}"
             res['level'] = 1
+            res['numbered'] = True
             return res
 
         # 匹配：第1节 标题
@@ -40,23 +42,39 @@ def title_preprocess(title: str):
         if m is not None:
             res['text'] = f"{m.group(1)} {m.group(2)}"
             res['level'] = 2
+            res['numbered'] = True
             return res
         
         # 根据缩进匹配
         m = re.match("(\t*)\s*(.+)", title)
         res['text'] = f"{m.group(2)}".rstrip()
         res['level'] = len(m.group(1))+1
+        res['numbered'] = False
         return res
     except:
         logger.error(f"error for title: {title}")
         traceback.print_exc()
-        return {'level': 1, "text": title}
+        return {'level': 1, "text": title, 'numbered': False}
 
-def extract_title(input_path: str, lang: str = 'ch', use_double_columns: bool = False) -> list:
+def correct_toc_levels(toc: list) -> list:
+    """校正书签层级, 保证首项为1级且相邻层级跳跃不超过1(原地修改)
+    """
+    levels = [v[0] for v in toc]
+    diff = np.diff(levels)
+    indices = np.where(diff>1)[0]
+    for idx in indices:
+        toc[idx][0] = toc[idx+1][0]
+    prev = 0
+    for item in toc:
+        item[0] = max(1, min(item[0], prev+1))
+        prev = item[0]
+    return toc
+
+def extract_title(input_path: Union[str, np.ndarray], lang: str = 'ch', use_double_columns: bool = False) -> list:
     # TODO: 存在标题识别不全bug
-    ocr_engine = PaddleOCR(use_angle_cls=True, lang=lang, show_log=False) # need to run only once to download and load model into memory
-    img = cv2.imread(input_path)
-    result = ppstructure_analysis(input_path)
+    ocr_engine = get_ocr_engine(lang)
+    img = imread(input_path)
+    result = ppstructure_analysis(img)
     title_items = [v for v in result if v['type']=='title']       # 提取title项
     title_items = sorted(title_items, key=lambda x: x['bbox'][1]) # 从上往下排序
     if use_double_columns:
@@ -72,7 +90,8 @@ def extract_title(input_path: str, lang: str = 'ch', use_double_columns: bool =
     out = []
     for item in title_items:
         x1, y1, x2, y2 = item['bbox']
-        result = ocr_engine.ocr(img[y1-y_delta: y2+y_delta, x1-x_delta: x2+x_delta], cls=False)
+        with stage("ocr_engine.ocr"):
+            result = ocr_engine.ocr(img[y1-y_delta: y2+y_delta, x1-x_delta: x2+x_delta], cls=False)
         for idx in range(len(result)):
             res = result[idx]
             for line in res:
@@ -83,19 +102,14 @@ def extract_title(input_path: str, lang: str = 'ch', use_double_columns: bool =
                 out.append([new_pos, (title, prob)])
     return out
 
-def add_toc_from_ocr(doc_path: str, lang: str='ch', use_double_columns: bool = False, output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    tmp_dir = p.parent / 'tmp'
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    
+def add_toc_from_ocr(doc_path: PdfSource, lang: str='ch', use_double_columns: bool = False, output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path)
+
     toc = []
     for page in tqdm(doc, total=doc.page_count):
-        pix: fitz.Pixmap = page.get_pixmap()  # render page to an image
-        savepath = str(tmp_dir / f"page-{page.number+1}.png")
-        # pix.save(savepath)  # store image as a PNG
-        pix.pil_save(savepath, quality=100, dpi=(1800,1800))
-        result = extract_title(savepath, lang, use_double_columns)
+        with stage("page", page=page.number+1):
+            img = render_page(page)  # render page to an image
+            result = extract_title(img, lang, use_double_columns)
         for item in result:
             pos, (title, prob) = item
             # 书签格式：[|v|, title, page [, dest]]  (层级，标题，页码，高度)
@@ -104,20 +118,129 @@ def add_toc_from_ocr(doc_path: str, lang: str='ch', use_double_columns: bool = F
             height = pos[0][1] # 左上角点的y坐标
             toc.append([level, title, page.number+1, height])
     # 校正层级
-    levels = [v[0] for v in toc]
-    diff = np.diff(levels)
-    indices = np.where(diff>1)[0]
-    for idx in indices:
-        toc[idx][0] = toc[idx+1][0]
+    correct_toc_levels(toc)
 
     # 设置目录
     doc.set_toc(toc)
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-toc.pdf")
-    doc.save(output_path)
-    shutil.rmtree(tmp_dir)
+    return save_pdf(doc, doc_path, output_path, "-toc")
+
+def extract_title_from_fonts(doc: fitz.Document, roi_indices: list, max_level: int = 3, max_length: int = 80) -> list:
+    """根据文本层的字号和字重识别标题, 返回[[字体层级, 标题, 页码, 高度], ...]
+
+    只出现一次的样式(如封面书名)不参与层级排序, 同页紧邻的同样式行算作一次
+
+    Args:
+        doc (fitz.Document): pdf文档
+        roi_indices (list): 待识别页面索引
+        max_level (int, optional): 最多识别的标题层级数. Defaults to 3.
+        max_length (int, optional): 标题最大字符数, 超过则视为正文. Defaults to 80.
+    """
+    lines = []
+    char_count = {}  # 每种样式(字号, 是否加粗)的字符数
+    occurrences = {}  # 每种样式出现的次数, 紧邻的同样式行算作一次
+    for page_index in roi_indices:
+        page = doc[page_index]
+        with stage("get_text", page=page_index+1):
+            blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+        for block in blocks:
+            for line in block["lines"]:
+                spans = [v for v in line["spans"] if v["text"].strip()]
+                if not spans:
+                    continue
+                text = "".join(v["text"] for v in spans).strip()
+                # 以字符数最多的span作为该行样式
+                span = max(spans, key=lambda x: len(x["text"].strip()))
+                size = round(span["size"] * 2) / 2
+                bold = bool(span["flags"] & fitz.TEXT_FONT_BOLD) or "bold" in span["font"].lower()
+                style = (size, bold)
+                char_count[style] = char_count.get(style, 0) + len(text)
+                prev = lines[-1] if lines else None
+                if not (prev and prev[0] == style and prev[2] == page_index+1 and line["bbox"][1] - prev[4] < (line["bbox"][3] - line["bbox"][1])):
+                    occurrences[style] = occurrences.get(style, 0) + 1
+                lines.append([style, text, page_index+1, line["bbox"][1], line["bbox"][3]])
+    if not lines:
+        return []
+
+    # 字符数最多的样式视为正文, 比正文字号大(或同字号加粗)的样式视为标题
+    body_size, body_bold = max(char_count, key=char_count.get)
+    title_styles = [
+        style for style in char_count
+        if (style[0] > body_size or (style[0] == body_size and style[1] and not body_bold)) and occurrences[style] > 1
+    ]
+    title_styles = sorted(title_styles, key=lambda x: (-x[0], not x[1]))[:max_level]
+    style_levels = {style: idx+1 for idx, style in enumerate(title_styles)}
+
+    out = []
+    for style, text, pno, y0, y1 in lines:
+        if style not in style_levels or len(text) > max_length or re.fullmatch("[\d\s.\-]+", text):
+            continue
+        # 同页紧邻的同样式行视为跨行标题, 进行合并
+        if out and out[-1][0] == style_levels[style] and out[-1][2] == pno and y0 - out[-1][4] < (y1 - y0):
+            out[-1][1] = f"{out[-1][1]} {text}"
+            out[-1][4] = y1
+            continue
+        out.append([style_levels[style], text, pno, y0, y1])
+    return [v[:4] for v in out]
+
+def add_toc_from_fonts(doc_path: PdfSource, page_range: str = "all", max_level: int = 3, output_path: str = None):
+    """根据文本层字体信息自动生成目录书签(适用于非扫描件, 无需ocr)
+
+    Args:
+        doc_path (str): pdf文件路径
+        page_range (str, optional): 页面范围. Defaults to "all".
+        max_level (int, optional): 最多识别的标题层级数. Defaults to 3.
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    if page_range == "all":
+        roi_indices = list(range(len(doc)))
+    else:
+        roi_indices = parse_range(page_range)
+
+    toc = []
+    for font_level, title, pno, height in extract_title_from_fonts(doc, roi_indices, max_level):
+        res = title_preprocess(title)
+        # 有编号(如1.1.1, 第1章)时以编号为准, 没有编号的标题按字体层级
+        level = res['level'] if res['numbered'] else font_level
+        toc.append([level, res['text'], pno, height])
+    if toc:
+        # 校正层级
+        correct_toc_levels(toc)
+        doc.set_toc(toc)
+    else:
+        logger.warning("未从文本层识别到标题, 文档保持不变, 扫描件请使用from_ocr")
+    return save_pdf(doc, doc_path, output_path, "-toc")
 
-def add_toc_from_file(toc_path: str, doc_path: str, offset: int, output_path: str = None):
+def parse_toc_line(line: str, page_count: int) -> tuple:
+    """解析目录文件的一行, 返回(标题, 标注页码), 没有页码时页码为None
+
+    把最右侧的数字当作页码，如果解析的数字超过pdf总页数，就从左边依次删直到小于pdf总页数为止
+    """
+    m = re.search("(\d+)(?=\s*$)", line)
+    if m is None:
+        return line, None
+    digits = m.group(1)
+    while len(digits) > 1 and int(digits) > page_count:
+        digits = digits[1:]
+    return line[:m.span()[0]], int(digits)
+
+def clean_toc_line(line: str, is_add_indent: bool = True, is_remove_trailing_dots: bool = True, add_offset: int = 0) -> str:
+    """清洗目录文件的一行: 去除标题与页码之间的点线, 按编号规则添加缩进, 页码加偏移量"""
+    new_line = line
+    if is_remove_trailing_dots:
+        new_line = re.sub("(\.\s*)+(?=\d*\s*$)", " ", new_line)
+        new_line = new_line.rstrip() + "\n"
+    if is_add_indent:
+        res = title_preprocess(new_line)
+        new_line = (res['level']-1)*'\t' + res['text'] + "\n"
+    if add_offset:
+        m = re.search("(\d+)(?=\s*$)", new_line)
+        if m is not None:
+            pno = int(m.group(1))
+            pno = pno + add_offset
+            new_line = new_line[:m.span()[0]-1] + f" {pno}\n"
+    return new_line
+
+def add_toc_from_file(toc_path: str, doc_path: PdfSource, offset: int, output_path: str = None):
     """从目录文件中导入书签到pdf文件(若文件中存在行没指定页码则按1算)
 
     Args:
@@ -125,22 +248,14 @@ def add_toc_from_file(toc_path: str, doc_path: str, offset: int, output_path: st
         doc_path (str): pdf文件路径
         offset (int): 偏移量, 计算方式: “pdf文件实际页码” - “目录文件标注页码”
     """
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+    doc: fitz.Document = open_pdf(doc_path)
     toc_path = Path(toc_path)
     toc = []
     if toc_path.suffix == ".txt":
         with open(toc_path, "r", encoding="utf-8") as f:
             for line in f:
-                pno = 1
-                title = line
-                m = re.search("(\d+)(?=\s*$)", line) # 把最右侧的数字当作页码，如果解析的数字超过pdf总页数，就从左边依次删直到小于pdf总页数为止
-                if m is not None:
-                    pno = int(m.group(1))
-                    while pno > doc.page_count:
-                        pno = int(str(pno)[1:])
-                    title = line[:m.span()[0]]
-                pno = pno + offset
+                title, pno = parse_toc_line(line, doc.page_count)
+                pno = (pno or 1) + offset
                 if not title.strip(): # 标题为空跳过
                     continue
                 res = title_preprocess(title)
@@ -152,21 +267,144 @@ def add_toc_from_file(toc_path: str, doc_path: str, offset: int, output_path: st
     else:
         raise ValueError("不支持的toc文件格式!")
     # 校正层级
-    levels = [v[0] for v in toc]
-    diff = np.diff(levels)
-    indices = np.where(diff>1)[0]
-    for idx in indices:
-        toc[idx][0] = toc[idx+1][0]
+    correct_toc_levels(toc)
 
     doc.set_toc(toc)
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-toc.pdf")
-    doc.save(output_path)
+    return save_pdf(doc, doc_path, output_path, "-toc")
+
+def _page_lines(page: fitz.Page, lang: str = 'ch', dpi: int = 144, min_chars: int = 20) -> str:
+    """获取页面按行拼接的文本: 有文本层时按词的位置拼行, 否则ocr; 与ocr命令的输出格式一致"""
+    from pdf_toolbox.lib.ocr import format_ocr_result, ocr_image
+    words = page.get_text("words")
+    if sum(len(w[4]) for w in words) >= min_chars:
+        result = [[[[w[0], w[1]], [w[2], w[1]], [w[2], w[3]], [w[0], w[3]]], (w[4], 1.)] for w in words]
+        return format_ocr_result(result, offset=5)
+    with stage("page", page=page.number+1):
+        return format_ocr_result(ocr_image(render_page(page, dpi=dpi), lang), offset=5 * dpi / 72)
+
+# 目录页自身的标题, 不作为条目
+CONTENTS_TITLES = {"contents", "tableofcontents", "目录", "目次", "目錄"}
+
+def parse_contents(lines: list, page_count: int) -> list:
+    """按目录文件的清洗规则(clean_toc_line/title_preprocess)解析目录页文本, 返回[[层级, 标题, 标注页码], ...]
+
+    没有页码的行: 以章节编号开头的作为单独条目(页码取下一条目的页码), 否则视为上一行标题的换行, 与下一行合并.
+    "目录"/"Contents"等目录页标题, 以及第一个条目之前既无页码也没有章节编号的行(书名、页眉等)会被丢弃
+    """
+    heading = re.compile("\\s*((\\d+\\.?)+\\s|第.+[章编节])")
+    entries, pending = [], ""
+    for line in lines:
+        if not line.strip():
+            continue
+        line = clean_toc_line(line, is_add_indent=False)
+        title, pno = parse_toc_line(line, page_count)
+        if pno is None and _normalize(title) in CONTENTS_TITLES:
+            continue
+        if pno is None and not entries and not pending and not heading.match(title):
+            continue  # 第一个条目之前没有页码、也不是章节编号的行不是目录条目
+        if pending and heading.match(title):
+            entries.append([pending, None])
+            pending = ""
+        title = f"{pending} {title.strip()}".strip()
+        if pno is None:
+            pending = title
+        else:
+            entries.append([title, pno])
+            pending = ""
+    if pending:
+        entries.append([pending, None])
+
+    toc = []
+    next_pno = None
+    for title, pno in reversed(entries):
+        next_pno = pno if pno is not None else next_pno
+        res = title_preprocess(title)
+        if res['text'].strip():
+            toc.append([res['level'], res['text'].strip(), next_pno or 1])
+    return toc[::-1]
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[\W_]+", "", text).lower()
+
+def detect_page_offset(doc: fitz.Document, toc: list, start: int, lang: str = 'ch', window: int = 30, samples: int = 3, min_length: int = 4):
+    """在目录页之后查找标题所在页面, 推断偏移量(实际页码 - 标注页码), 找不到时返回None
+
+    依次以各个样本标题为锚点, 候选偏移量按从小到大尝试, 只读取(或ocr)验证所需的页面: 锚点标题出现在候选页面中时,
+    再验证其余样本, 过半命中即采用; 锚点在窗口内都找不到时换下一个样本. 同时包含多个标题的页面视为目录页(如目录范围
+    没有给全), 不参与匹配
+
+    Args:
+        start (int): 正文起始页序号(目录页之后, 从0开始)
+        window (int, optional): 锚点条目最多在其标注页码之后多少页. Defaults to 30.
+        samples (int, optional): 用于验证的条目数(均匀分布在目录中). Defaults to 3.
+    """
+    # 去掉编号, 取标题文字的前若干字符匹配, 编号和空白在页面中的形式常与目录不同
+    keys = [(pno, _normalize(re.sub("^\\s*((\\d+\\.?)+|第.+?[章编节])", "", title))[:12]) for _, title, pno in toc]
+    keys = [v for v in keys if len(v[1]) >= min_length and v[1] not in CONTENTS_TITLES]
+    if not keys:
+        return None
+    picked = [keys[0]] + [keys[round(i * (len(keys) - 1) / max(samples - 1, 1))] for i in range(1, samples)]
+    picked = list(dict.fromkeys(picked))
+    all_keys = {key for _, key in keys}
+    texts = {}
+
+    def hit(pno: int, key: str, offset: int) -> bool:
+        index = pno + offset - 1
+        if not start <= index < doc.page_count:
+            return False
+        if index not in texts:
+            text = _normalize(_page_lines(doc[index], lang))
+            is_contents = len(all_keys) >= 3 and sum(k in text for k in all_keys) >= 3
+            texts[index] = None if is_contents else text
+        return texts[index] is not None and key in texts[index]
+
+    for anchor_pno, anchor_key in picked:
+        others = [v for v in picked if v != (anchor_pno, anchor_key)]
+        for offset in range(start + 1 - anchor_pno, start + 1 - anchor_pno + window):
+            if not hit(anchor_pno, anchor_key, offset):
+                continue
+            results = [hit(pno, key, offset) for pno, key in others]
+            if not results or sum(results) * 2 >= len(results):
+                return offset
+    return None
+
+def add_toc_from_contents(doc_path: PdfSource, page_range: str, offset: int = None, lang: str = 'ch', dpi: int = 144, output_path: str = None):
+    """根据pdf自身的目录页生成书签: 只读取(或ocr)目录页, 按目录文件的清洗规则解析, 自动推断页码偏移量
+
+    Args:
+        page_range (str): 目录页范围, 例如: '3-7'
+        offset (int, optional): 偏移量(实际页码 - 标注页码). Defaults to None(在目录页之后匹配标题自动推断).
+        dpi (int, optional): 目录页无文本层时的ocr渲染分辨率. Defaults to 144.
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    roi_indices = parse_range(page_range)
+    lines = []
+    for page_index in tqdm(roi_indices):
+        lines.extend(_page_lines(doc[page_index], lang, dpi).splitlines())
+    toc = parse_contents(lines, doc.page_count)
+    if not toc:
+        raise ValueError("未能从目录页中解析出目录!")
+    if offset is None:
+        offset = detect_page_offset(doc, toc, max(roi_indices) + 1, lang)
+        if offset is None:
+            offset = max(roi_indices) + 2 - toc[0][2]
+            logger.warning(f"未能自动推断页码偏移量, 假设第一个条目位于目录页之后的第一页(offset={offset})")
+        else:
+            logger.info(f"offset: {offset}")
+    toc = [[level, title, min(max(pno + offset, 1), doc.page_count)] for level, title, pno in toc]
+    correct_toc_levels(toc)
+    logger.info(f"{len(toc)} entries")
+
+    doc.set_toc(toc)
+    return save_pdf(doc, doc_path, output_path, "-toc")
 
-def extract_toc(doc_path: str, format: str = "txt", output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+def extract_toc(doc_path: PdfSource, format: str = "txt", output_path: str = None):
+    """导出目录书签; 未指定output_path且输入不是文件路径时不落盘, 直接返回书签列表"""
+    doc: fitz.Document = open_pdf(doc_path)
     toc = doc.get_toc(simple=False)
+    if output_path is None and not is_path(doc_path):
+        return [line[:3] for line in toc] if format == "txt" else [line[:3] + [line[3].get('to', fitz.Point()).y] for line in toc]
+    p = Path(output_path if output_path is not None else doc_path)
     if format == "txt":
         if output_path is None:
             output_path = str(p.parent / f"{p.stem}-toc.txt")
@@ -184,6 +422,7 @@ def extract_toc(doc_path: str, format: str = "txt", output_path: str = None):
                 toc[i][-1] = 0
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(toc, f)
+    return output_path
 
 def transform_toc_file(toc_path: str, is_add_indent: bool = True, is_remove_trailing_dots: bool = True, add_offset: int = 0, output_path: str = None):
     if output_path is None:
@@ -191,17 +430,4 @@ def transform_toc_file(toc_path: str, is_add_indent: bool = True, is_remove_trai
         output_path = str(p.parent / f"{p.stem}-toc-clean.txt")
     with open(toc_path, "r", encoding="utf-8") as f, open(output_path, "w", encoding="utf-8") as f2:
         for line in f:
-            new_line = line
-            if is_remove_trailing_dots:
-                new_line = re.sub("(\.\s*)+(?=\d*\s*$)", " ", new_line)
-                new_line = new_line.rstrip() + "\n"
-            if is_add_indent:
-                res = title_preprocess(new_line)
-                new_line = (res['level']-1)*'\t' + res['text'] + "\n"
-            if add_offset:
-                m = re.search("(\d+)(?=\s*$)", new_line)
-                if m is not None:
-                    pno = int(m.group(1))
-                    pno = pno + add_offset
-                    new_line = new_line[:m.span()[0]-1] + f" {pno}\n"
-            f2.write(new_line)
+            f2.write(clean_toc_line(line, is_add_indent, is_remove_trailing_dots, add_offset))
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import fitz
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf, save_pdf
+from pdf_toolbox.utils.profiler import stage
+
+
+def collect_images(doc: fitz.Document) -> dict:
+    """遍历所有页面, 统计每个图片xref的像素尺寸和最大显示尺寸(pt)
+
+    Returns:
+        dict: {xref: {'width', 'height', 'display': (宽, 高)}}, 同一图片多处引用时取最大显示尺寸
+    """
+    images = {}
+    for page in doc:
+        for info in page.get_image_info(xrefs=True):
+            xref = info['xref']
+            if xref <= 0:  # 内联图片
+                continue
+            rect = fitz.Rect(info['bbox'])
+            item = images.setdefault(xref, {'width': info['width'], 'height': info['height'], 'display': (0., 0.)})
+            item['display'] = (max(item['display'][0], rect.width), max(item['display'][1], rect.height))
+    return images
+
+def effective_dpi(item: dict) -> float:
+    """图片在页面上的实际分辨率, 显示尺寸为0时返回0"""
+    w, h = item['display']
+    if w <= 0 or h <= 0:
+        return 0.
+    return min(item['width'] / (w / 72), item['height'] / (h / 72))
+
+def _skip_reason(doc: fitz.Document, xref: int) -> str:
+    if doc.xref_get_key(xref, "ImageMask")[1] == "true":
+        return "mask"
+    if doc.xref_get_key(xref, "SMask")[0] != "null" or doc.xref_get_key(xref, "Mask")[0] != "null":
+        return "mask"
+    if doc.xref_get_key(xref, "BitsPerComponent")[1] == "1":
+        return "bitonal"
+    return None
+
+def is_bitonal(gray: np.ndarray, ratio: float = 0.97, margin: int = 48) -> bool:
+    """接近黑白二值的扫描图: 绝大部分像素接近纯黑或纯白"""
+    extreme = np.count_nonzero((gray < margin) | (gray > 255 - margin))
+    return extreme >= gray.size * ratio
+
+def recompress_image(samples: bytes, width: int, height: int, n: int, scale: float = 1., quality: int = 75, bitonal: bool = True) -> tuple:
+    """重新压缩图片像素(在工作线程中执行, opencv计算时释放GIL)
+
+    Args:
+        samples (bytes): RGB或灰度像素
+        n (int): 通道数, 1或3
+        scale (float, optional): 缩放比例. Defaults to 1..
+
+    Returns:
+        tuple: (类型'jpeg'/'bitonal', 图片字典, 压缩后数据)
+    """
+    img = np.frombuffer(samples, dtype=np.uint8).reshape(height, width, n)
+    gray = img[:, :, 0] if n == 1 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    # 在原始分辨率上判断, 降采样会在笔画边缘产生大量灰色像素
+    bitonal = bitonal and (n == 1 or np.abs(img.astype(np.int16) - gray[:, :, None]).max() < 32) and is_bitonal(gray)
+    if scale < 1:
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA).reshape(size[1], size[0], n)
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    height, width = img.shape[:2]
+    if bitonal:
+        _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        data = zlib.compress(np.packbits(binary, axis=1).tobytes(), 9)  # 1位灰度: 0为黑, 1为白
+        head = (f"<</Type/XObject/Subtype/Image/Width {width}/Height {height}"
+                f"/ColorSpace/DeviceGray/BitsPerComponent 1>>")
+        return "bitonal", head, data
+    if n == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    _, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    colorspace = "DeviceRGB" if n == 3 else "DeviceGray"
+    head = (f"<</Type/XObject/Subtype/Image/Width {width}/Height {height}"
+            f"/ColorSpace/{colorspace}/BitsPerComponent 8>>")
+    return "jpeg", head, buf.tobytes()
+
+def _read_pixels(doc: fitz.Document, xref: int) -> tuple:
+    pix = fitz.Pixmap(doc, xref)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return pix.samples, pix.width, pix.height, pix.n
+
+def compress_pdf(doc_path: PdfSource, dpi: int = 150, quality: int = 75, bitonal: bool = True, min_ratio: float = 0.9,
+                 workers: int = None, max_pending: int = None, output_path: str = None):
+    """压缩扫描件pdf: 降采样分辨率过高的图片, 重新编码为jpeg, 接近黑白的扫描页转为1位图, 相同图片只保留一份
+
+    只遍历一次图片xref, 相同图片(原始数据相同)只处理一次; 图片在多个线程中并行重新编码, 结果原地替换xref的数据流,
+    保存时合并重复对象. 带透明蒙版的图片和已经是1位的图片不处理.
+
+    Args:
+        dpi (int, optional): 目标分辨率, 按图片在页面上的显示尺寸计算, 超过的降采样到该分辨率. Defaults to 150.
+        quality (int, optional): jpeg质量(1-100). Defaults to 75.
+        bitonal (bool, optional): 是否将接近黑白的图片转为1位图. Defaults to True.
+        min_ratio (float, optional): 重新编码后小于原大小的该比例才替换. Defaults to 0.9.
+        workers (int, optional): 线程数. Defaults to None(cpu核数).
+        max_pending (int, optional): 同时在内存中的最大图片数. Defaults to None(线程数的2倍).
+    """
+    if not 1 <= quality <= 100:
+        raise ValueError("jpeg质量必须在1-100之间!")
+    doc: fitz.Document = open_pdf(doc_path)
+    before = os.path.getsize(doc_path) if is_path(doc_path) else len(doc.tobytes())
+    with stage("collect_images"):
+        images = collect_images(doc)
+
+    stats = {"images": len(images), "duplicate": 0, "skipped": 0, "downsampled": 0, "jpeg": 0, "bitonal": 0, "unchanged": 0}
+    groups = {}  # 原始数据摘要 -> [xref, ...]
+    for xref in images:
+        digest = hashlib.md5(doc.xref_stream_raw(xref)).digest()
+        groups.setdefault(digest, []).append(xref)
+    stats["duplicate"] = len(images) - len(groups)
+
+    def apply(xrefs: list, raw_size: int, scale: float, result: tuple):
+        kind, head, data = result
+        filter = "/FlateDecode" if kind == "bitonal" else "/DCTDecode"
+        if len(data) >= raw_size * min_ratio:
+            stats["unchanged"] += 1
+            return
+        for xref in xrefs:  # 相同图片写入相同数据, 保存时garbage=4会合并为同一对象
+            doc.update_object(xref, head)
+            doc.update_stream(xref, data, compress=False)
+            doc.xref_set_key(xref, "Filter", filter)  # update_stream会移除/Filter
+        stats[kind] += 1
+        stats["downsampled"] += scale < 1
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    pending = deque()
+    with ThreadPoolExecutor(workers) as executor:
+        for xrefs in tqdm(groups.values()):
+            xref = xrefs[0]
+            if _skip_reason(doc, xref) is not None:
+                stats["skipped"] += 1
+                continue
+            # 多处引用时按最大显示尺寸计算, 保证每处的分辨率都不低于目标
+            display = max((images[v]['display'] for v in xrefs), key=lambda v: v[0] * v[1])
+            current = effective_dpi({**images[xref], 'display': display})
+            scale = dpi / current if current > dpi * 1.05 else 1.
+            with stage("read_pixels"):
+                samples, width, height, n = _read_pixels(doc, xref)
+            raw_size = len(doc.xref_stream_raw(xref))
+            future = executor.submit(recompress_image, samples, width, height, n, scale, quality, bitonal)
+            pending.append((xrefs, raw_size, scale, future))
+            while len(pending) > max_pending:
+                xrefs_, raw_size_, scale_, future_ = pending.popleft()
+                apply(xrefs_, raw_size_, scale_, future_.result())
+        while pending:
+            xrefs_, raw_size_, scale_, future_ = pending.popleft()
+            apply(xrefs_, raw_size_, scale_, future_.result())
+
+    result = save_pdf(doc, doc_path, output_path, "-compressed", garbage=4, deflate=True)
+    if isinstance(result, str):
+        after = os.path.getsize(result)
+    elif isinstance(result, bytes):
+        after = len(result)
+    else:
+        after = len(result.tobytes(garbage=4, deflate=True))
+    logger.info(", ".join(f"{k}: {v}" for k, v in stats.items()))
+    logger.info(f"size: {before/1024/1024:.2f}MB -> {after/1024/1024:.2f}MB ({after/before:.1%})")
+    return result
@@ -5,19 +5,21 @@ from pathlib import Path
 import fitz
 from tqdm import tqdm
 
-from pdf_toolbox.utils import parse_range
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf, parse_range
 
 
-def convert_pdf_to_images(doc_path: str, page_range: str = 'all', output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+def convert_pdf_to_images(doc_path: PdfSource, page_range: str = 'all', output_path: str = None):
+    """pdf转图片, 未指定output_path且输入不是文件路径时不落盘, 返回每页png图片的bytes列表"""
+    doc: fitz.Document = open_pdf(doc_path)
     if page_range=="all":
         roi_indices = list(range(len(doc)))
     else:
         roi_indices = parse_range(page_range)
 
+    if output_path is None and not is_path(doc_path):
+        return [doc[page_index].get_pixmap().tobytes("png") for page_index in roi_indices]
     if output_path is None:
-        output_dir = p.parent / "images"
+        output_dir = Path(doc_path).parent / "images"
     else:
         output_dir = Path(output_path)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -27,6 +29,7 @@ def convert_pdf_to_images(doc_path: str, page_range: str = 'all', output_path: s
         savepath = str(output_dir / f"page-{page.number+1}.png")
         # pix.save(savepath)  # store image as a PNG
         pix.pil_save(savepath, quality=100, dpi=(1800,1800))
+    return str(output_dir)
 
 def convert_images_to_pdf(input_path: str, format_list=["png", "jpg"], output_path: str = None):
     if output_path is None:
@@ -58,3 +61,4 @@ def convert_images_to_pdf(input_path: str, format_list=["png", "jpg"], output_pa
                         height = rect.height)  # pic dimension
         page.show_pdf_page(rect, imgPDF, 0)  # image fills the page
     doc.save(output_path)
+    return output_path
@@ -0,0 +1,141 @@
+import hashlib
+import re
+from typing import List
+
+import cv2
+import fitz
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf, save_pdf
+
+
+def dhash(page: fitz.Page, dpi: int = 20, hash_size: int = 8) -> int:
+    """低分辨率灰度渲染后计算差值哈希(dHash), 只用于筛选近似重复的候选页面, 不能单独作为判断依据"""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    img = cv2.resize(img, (hash_size+1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (img[:, 1:] > img[:, :-1]).flatten()
+    return int("".join("1" if v else "0" for v in bits), 2)
+
+def page_fingerprint(page: fitz.Page, dpi: int = 20) -> tuple:
+    """计算页面指纹, 返回(类型, 内容摘要, dHash)
+
+    - 内容摘要: 归一化内容流 + 文本 + 引用的图片/表单原始数据的sha1, 相同即视为完全重复
+    - 含图片且无文本的页面(扫描件)类型为"image", 额外计算dHash用于查找近似重复的候选; 其余页面类型为"content", dHash为None
+    """
+    contents = re.sub(rb"\s+", b" ", page.read_contents()).strip()
+    text = page.get_text()
+    h = hashlib.sha1(contents)
+    h.update(text.encode("utf-8"))
+    images = page.get_images()
+    for xref in sorted({v[0] for v in images} | {v[0] for v in page.get_xobjects()}):
+        h.update(hashlib.sha1(page.parent.xref_stream_raw(xref) or b"").digest())
+    if images and not text.strip():
+        return ("image", h.hexdigest(), dhash(page, dpi))
+    return ("content", h.hexdigest(), None)
+
+def pages_match(page1: fitz.Page, page2: fitz.Page, dpi: int = 72, threshold: int = 48, max_ratio: float = 0.002) -> bool:
+    """直接比较两页确认是否重复: 页面尺寸和文本相同, 且渲染后差异明显的像素不超过max_ratio"""
+    if abs(page1.rect.width - page2.rect.width) > 1 or abs(page1.rect.height - page2.rect.height) > 1:
+        return False
+    if " ".join(page1.get_text().split()) != " ".join(page2.get_text().split()):
+        return False
+    imgs = []
+    for page in (page1, page2):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, annots=True)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+        imgs.append(cv2.GaussianBlur(img, (3, 3), 0))  # 平滑扫描噪点
+    if imgs[0].shape != imgs[1].shape:
+        imgs[1] = cv2.resize(imgs[1], imgs[0].shape[::-1], interpolation=cv2.INTER_AREA)
+    diff = np.count_nonzero(cv2.absdiff(imgs[0], imgs[1]) > threshold)
+    return diff <= imgs[0].size * max_ratio
+
+def group_duplicates(fingerprints: list, max_distance: int = 0, verify=None, hash_bits: int = 64) -> List[List[int]]:
+    """根据指纹将重复页面分组, 返回[[页面序号, ...], ...](每组至少2页, 组内按序号排序, 第一页为保留的代表页)
+
+    内容摘要相同的页面直接归为一组. max_distance>0时再查找近似重复的扫描页: 每页只与已有分组的代表页比较,
+    不会通过中间页传递合并; dHash汉明距离不超过max_distance的代表页只是候选, 必须再经verify(代表页, 页面)确认.
+    候选查找使用分段索引: 将哈希分成max_distance+1段, 汉明距离不超过max_distance的两个哈希至少有一段完全相同.
+
+    Args:
+        max_distance (int, optional): dHash允许的最大汉明距离, 0表示只查找完全相同的页面. Defaults to 0.
+        verify (callable, optional): verify(i, j) -> bool, 确认两页确实重复, max_distance>0时必须提供. Defaults to None.
+    """
+    if max_distance > 0 and verify is None:
+        raise ValueError("查找近似重复页面时必须提供确认函数!")
+    bands = max_distance + 1
+    width = -(-hash_bits // bands)
+    exact = {}    # 内容摘要 -> 代表页
+    buckets = {}  # (段序号, 段值) -> [代表页, ...]
+    groups = {}   # 代表页 -> [页面序号, ...]
+    for i, (kind, digest, value) in enumerate(fingerprints):
+        if digest in exact:
+            groups[exact[digest]].append(i)
+            continue
+        rep = None
+        if max_distance > 0 and kind == "image":
+            keys = [(b, (value >> (b * width)) & ((1 << width) - 1)) for b in range(bands)]
+            candidates = {j for key in keys for j in buckets.get(key, [])}
+            candidates = sorted((bin(fingerprints[j][2] ^ value).count("1"), j) for j in candidates)
+            for distance, j in candidates:
+                if distance <= max_distance and verify(j, i):
+                    rep = j
+                    break
+        if rep is not None:
+            groups[rep].append(i)
+            exact[digest] = rep
+            continue
+        exact[digest] = i
+        groups[i] = [i]
+        if max_distance > 0 and kind == "image":
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+    return [v for v in groups.values() if len(v) > 1]
+
+def find_duplicate_pages(doc: fitz.Document, max_distance: int = 0, dpi: int = 20) -> List[List[int]]:
+    """查找文档中的重复页面, 返回重复分组(页面序号从0开始), 近似重复的页面经过逐像素比较确认"""
+    fingerprints = [page_fingerprint(page, dpi) for page in tqdm(doc, total=doc.page_count)]
+    return group_duplicates(fingerprints, max_distance, verify=lambda i, j: pages_match(doc[i], doc[j]))
+
+def remove_duplicate_pages(doc: fitz.Document, max_distance: int = 0, dpi: int = 20) -> list:
+    """删除文档中的重复页面(保留每组的第一页), 返回重复分组(页面序号从0开始)
+
+    默认只删除完全相同的页面; max_distance>0时同时删除经确认的近似重复扫描页
+    """
+    groups = find_duplicate_pages(doc, max_distance, dpi)
+    duplicates = sorted(i for group in groups for i in group[1:])
+    if duplicates:
+        doc.delete_pages(duplicates)
+    return groups
+
+def dedupe_pdf(doc_path_list: List[PdfSource], max_distance: int = 0, dpi: int = 20, dry_run: bool = False, output_path: str = None):
+    """检测一个或多个pdf中的重复页面, 合并后删除重复页
+
+    Args:
+        doc_path_list (List[PdfSource]): pdf列表, 多个文件时按顺序合并
+        max_distance (int, optional): 扫描页dHash允许的最大汉明距离, 大于0时查找近似重复的扫描页(逐像素比较确认后才删除),
+            0表示仅删除完全相同的页面. Defaults to 0.
+        dpi (int, optional): 计算扫描页哈希时的渲染分辨率. Defaults to 20.
+        dry_run (bool, optional): 只报告重复页面, 不删除. Defaults to False.
+    """
+    doc = open_pdf(doc_path_list[0])
+    sources = [(0, i+1) for i in range(doc.page_count)]  # 每页来源(文件序号, 页码), 用于报告
+    for idx, doc_path in enumerate(doc_path_list[1:], start=1):
+        doc_temp = open_pdf(doc_path)
+        sources.extend((idx, i+1) for i in range(doc_temp.page_count))
+        doc.insert_pdf(doc_temp)
+    names = [str(v) if is_path(v) else f"#{i}" for i, v in enumerate(doc_path_list)]
+
+    if dry_run:
+        groups = find_duplicate_pages(doc, max_distance, dpi)
+    else:
+        groups = remove_duplicate_pages(doc, max_distance, dpi)
+    report = [[(names[sources[i][0]], sources[i][1]) for i in group] for group in groups]
+    for group in report:
+        logger.info("duplicate pages: " + ", ".join(f"{name}:{pno}" for name, pno in group))
+    logger.info(f"found {len(groups)} duplicate groups, {sum(len(v)-1 for v in groups)} redundant pages")
+    if dry_run:
+        return report
+    return save_pdf(doc, doc_path_list[0], output_path, "-dedupe")
@@ -0,0 +1,263 @@
+import difflib
+import hashlib
+import json
+import re
+from collections import deque
+from pathlib import Path
+
+import cv2
+import fitz
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from pdf_toolbox.lib.dedupe import dhash
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf
+from pdf_toolbox.utils.profiler import stage
+
+
+class PageFingerprints:
+    """按需计算的分级页面指纹: 内容流哈希 -> 文本哈希 -> 低分辨率渲染哈希, 后两者只在需要时计算并缓存"""
+
+    def __init__(self, doc: fitz.Document, render_dpi: int = 30):
+        self.doc = doc
+        self.render_dpi = render_dpi
+        self._text = {}
+        self._render = {}
+        with stage("content_hash"):
+            self.content = [self._content_hash(page) for page in doc]
+
+    def _content_hash(self, page: fitz.Page) -> str:
+        """归一化内容流 + 引用的图片/表单原始数据, 完全相同时页面必然相同"""
+        h = hashlib.sha1(re.sub(rb"\s+", b" ", page.read_contents()).strip())
+        for xref in sorted({v[0] for v in page.get_images()} | {v[0] for v in page.get_xobjects()}):
+            h.update(self.doc.xref_stream_raw(xref) or b"")
+        return h.hexdigest()
+
+    def text(self, i: int) -> str:
+        """归一化文本的哈希, 无文本时为None"""
+        if i not in self._text:
+            text = " ".join(self.doc[i].get_text().split())
+            self._text[i] = hashlib.sha1(text.encode("utf-8")).hexdigest() if text else None
+        return self._text[i]
+
+    def words(self, i: int) -> list:
+        return self.doc[i].get_text().split()
+
+    def render(self, i: int) -> int:
+        if i not in self._render:
+            with stage("render_hash"):
+                self._render[i] = dhash(self.doc[i], self.render_dpi, hash_size=16)
+        return self._render[i]
+
+    def key(self, i: int, other_contents: set) -> tuple:
+        """用于对齐的键: 内容流在另一文档中出现时直接使用, 否则退化为文本哈希, 无文本时使用渲染哈希"""
+        if self.content[i] in other_contents:
+            return ("content", self.content[i])
+        text = self.text(i)
+        if text is not None:
+            return ("text", text)
+        return ("render", self.render(i))
+
+def _pair_block(rest1: list, rest2: list, similarity=None, threshold: float = 0.5, max_size: int = 400) -> dict:
+    """在replace区间内配对修改的页面, 返回{新页面序号: 旧页面序号}
+
+    两边页数相同或未提供相似度函数时按位置配对; 否则按顺序贪心选择相似度最高且不低于threshold的页面,
+    区间过大时退化为按位置配对
+    """
+    if similarity is None or len(rest1) == len(rest2) or len(rest1) * len(rest2) > max_size:
+        return dict(zip(rest2, rest1))
+    paired, start = {}, 0
+    for i in rest1:
+        scores = [(similarity(i, j), k) for k, j in enumerate(rest2[start:], start)]
+        if not scores:
+            break
+        score, k = max(scores)
+        if score >= threshold:
+            paired[rest2[k]] = i
+            start = k + 1
+    return paired
+
+def align_pages(keys1: list, keys2: list, similarity=None) -> list:
+    """对齐两个文档的页面, 返回[(状态, 页面序号1, 页面序号2), ...], 状态为equal/modified/removed/inserted/moved
+
+    基于哈希键的SequenceMatcher, 页面键大多唯一时接近线性时间; 未对齐的页面中键相同的配对为moved,
+    其余在同一个replace区间内配对为modified(见_pair_block), 多余的页面为removed/inserted
+
+    Args:
+        similarity (callable, optional): similarity(旧页面序号, 新页面序号) -> 0~1, 用于区间内配对. Defaults to None.
+    """
+    opcodes = difflib.SequenceMatcher(None, keys1, keys2, autojunk=False).get_opcodes()
+    unmatched = {}
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != "equal":
+            for i in range(i1, i2):
+                unmatched.setdefault(keys1[i], deque()).append(i)
+    moved = {}  # 新页面序号 -> 旧页面序号
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != "equal":
+            for j in range(j1, j2):
+                if unmatched.get(keys2[j]):
+                    moved[j] = unmatched[keys2[j]].popleft()
+    moved_from = set(moved.values())
+
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            result.extend(("equal", i, j) for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+        rest1 = [i for i in range(i1, i2) if i not in moved_from]
+        rest2 = [j for j in range(j1, j2) if j not in moved]
+        paired = _pair_block(rest1, rest2, similarity)
+        for j in range(j1, j2):
+            if j in moved:
+                result.append(("moved", moved[j], j))
+            elif j in paired:
+                result.append(("modified", paired[j], j))
+            else:
+                result.append(("inserted", None, j))
+        paired_from = set(paired.values())
+        result.extend(("removed", i, None) for i in rest1 if i not in paired_from)
+    return result
+
+def _word_regions(page1: fitz.Page, page2: fitz.Page) -> tuple:
+    """逐词比较文本, 返回(删除的词区域列表, 新增/修改的词区域列表, 删除的文本)"""
+    words1, words2 = page1.get_text("words"), page2.get_text("words")
+    matcher = difflib.SequenceMatcher(None, [w[4] for w in words1], [w[4] for w in words2], autojunk=False)
+    regions1, regions2, deleted = [], [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        regions1.extend(fitz.Rect(w[:4]) for w in words1[i1:i2])
+        regions2.extend(fitz.Rect(w[:4]) for w in words2[j1:j2])
+        if i2 > i1:
+            deleted.append(" ".join(w[4] for w in words1[i1:i2]))
+    return regions1, regions2, deleted
+
+def _pixel_regions(page1: fitz.Page, page2: fitz.Page, dpi: int = 50, threshold: int = 48) -> list:
+    """渲染后逐像素比较, 返回第二页中变化区域(未旋转页面坐标), 页面尺寸不同时返回整页"""
+    if page1.rect != page2.rect:
+        return [page2.rect * page2.derotation_matrix]
+    imgs = []
+    for page in (page1, page2):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        imgs.append(np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width))
+    mask = (cv2.absdiff(imgs[0], imgs[1]) > threshold).astype(np.uint8)
+    mask = cv2.dilate(mask, np.ones((9, 9), np.uint8))  # 合并相邻的变化像素
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    scale = 72 / dpi
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        regions.append(fitz.Rect(x, y, x + w, y + h) * scale * page2.derotation_matrix)
+    return regions
+
+def _rect(r: fitz.Rect) -> list:
+    return [round(v, 2) for v in r]
+
+def compare_pages(page1: fitz.Page, page2: fitz.Page, dpi: int = 50) -> dict:
+    """比较一对页面的差异, 有文本层时逐词比较, 否则逐像素比较"""
+    with stage("compare", page=page2.number+1):
+        if page1.get_text().strip() or page2.get_text().strip():
+            regions1, regions2, deleted = _word_regions(page1, page2)
+            if regions1 or regions2:
+                return {"reason": "text", "regions_a": regions1, "regions_b": regions2, "deleted": deleted}
+        return {"reason": "render", "regions_a": [], "regions_b": _pixel_regions(page1, page2, dpi), "deleted": []}
+
+def _highlight(doc1: fitz.Document, doc2: fitz.Document, pages: list) -> fitz.Document:
+    """在新版本上标注差异: 修改处高亮, 新增页和移动页加边框, 删除的页面从旧版本插入到对应位置并加红框"""
+    out = fitz.open()
+    out.insert_pdf(doc2)
+    n2 = out.page_count
+    out.insert_pdf(doc1)  # 旧版本页面追加在后面, 通过select插入到删除的位置
+
+    colors = {"inserted": (0, 0.6, 0), "moved": (0, 0.4, 1), "removed": (1, 0, 0)}
+    order = []
+    for item in pages:
+        if item["status"] == "removed":
+            index = n2 + item["a"] - 1
+        else:
+            index = item["b"] - 1
+        page = out[index]
+        if item["status"] == "modified":
+            for rect in item["regions_b"]:
+                annot = page.add_highlight_annot(fitz.Rect(rect)) if item["reason"] == "text" else page.add_rect_annot(fitz.Rect(rect))
+                if item["reason"] != "text":
+                    annot.set_colors(stroke=(1, 0.5, 0))
+                    annot.update()
+            if item["deleted"]:
+                page.add_text_annot(fitz.Point(page.rect.x0 + 10, page.rect.y0 + 10) * page.derotation_matrix, "删除: " + "\n".join(item["deleted"]))
+        elif item["status"] in colors:
+            annot = page.add_rect_annot((page.rect + (2, 2, -2, -2)) * page.derotation_matrix)
+            annot.set_colors(stroke=colors[item["status"]])
+            annot.set_border(width=3)
+            annot.update()
+            label = {"inserted": "新增页", "moved": f"由第{item['a']}页移动", "removed": f"已删除(原第{item['a']}页)"}[item["status"]]
+            page.add_text_annot(fitz.Point(page.rect.x0 + 10, page.rect.y0 + 10) * page.derotation_matrix, label)
+        order.append(index)
+    out.select(order)
+    return out
+
+def diff_pdf(doc_path1: PdfSource, doc_path2: PdfSource, output_path: str = None, highlight_path: str = None, dpi: int = 50, render_dpi: int = 30):
+    """比较同一文档的两个版本, 找出新增、删除、移动和修改的页面
+
+    先用内容流哈希对齐, 内容流不同的页面再用文本哈希, 无文本的页面才渲染低分辨率图片计算哈希;
+    只对修改的页面逐词(有文本层)或逐像素(扫描页)比较变化区域
+
+    Args:
+        doc_path1 (PdfSource): 旧版本
+        doc_path2 (PdfSource): 新版本
+        output_path (str, optional): json报告保存路径. Defaults to None(输入为文件路径时保存到新版本旁边, 文件名加-diff).
+        highlight_path (str, optional): 标注差异的pdf保存路径. Defaults to None(不生成).
+        dpi (int, optional): 扫描页逐像素比较时的渲染分辨率. Defaults to 50.
+        render_dpi (int, optional): 计算渲染哈希时的分辨率. Defaults to 30.
+
+    Returns:
+        dict: {'summary': {状态: 页数}, 'pages': [{'status', 'a', 'b', ...}, ...]}, 页码从1开始, 写入文件时返回保存路径
+    """
+    doc1, doc2 = open_pdf(doc_path1), open_pdf(doc_path2)
+    fp1, fp2 = PageFingerprints(doc1, render_dpi), PageFingerprints(doc2, render_dpi)
+    contents1, contents2 = set(fp1.content), set(fp2.content)
+    keys1 = [fp1.key(i, contents2) for i in range(doc1.page_count)]
+    keys2 = [fp2.key(j, contents1) for j in range(doc2.page_count)]
+
+    def similarity(i: int, j: int) -> float:
+        if keys1[i][0] == "render" or keys2[j][0] == "render":
+            return 1 - bin(fp1.render(i) ^ fp2.render(j)).count("1") / 256
+        return difflib.SequenceMatcher(None, fp1.words(i), fp2.words(j), autojunk=False).ratio()
+
+    pages = []
+    for status, i, j in tqdm(align_pages(keys1, keys2, similarity)):
+        item = {"status": status, "a": None if i is None else i + 1, "b": None if j is None else j + 1}
+        if status in ("equal", "moved") and keys1[i][0] == "text" and fp1.content[i] != fp2.content[j]:
+            # 文本相同但内容流不同, 渲染比较外观
+            if fp1.render(i) != fp2.render(j):
+                item["status"] = "modified" if status == "equal" else "moved"
+                item.update(compare_pages(doc1[i], doc2[j], dpi))
+        elif status == "modified":
+            item.update(compare_pages(doc1[i], doc2[j], dpi))
+        if item["status"] == "equal":
+            item["status"] = "unchanged"
+        pages.append(item)
+
+    summary = {k: 0 for k in ("unchanged", "modified", "moved", "inserted", "removed")}
+    for item in pages:
+        summary[item["status"]] += 1
+    logger.info(", ".join(f"{k}: {v}" for k, v in summary.items()))
+
+    if highlight_path is not None:
+        _highlight(doc1, doc2, [{"regions_b": [], "deleted": [], "reason": None, **v} for v in pages]).save(highlight_path, garbage=3, deflate=True)
+    for item in pages:
+        for k in ("regions_a", "regions_b"):
+            if k in item:
+                item[k] = [_rect(v) for v in item[k]]
+    report = {"a": str(doc_path1) if is_path(doc_path1) else None, "b": str(doc_path2) if is_path(doc_path2) else None,
+              "pages_a": doc1.page_count, "pages_b": doc2.page_count, "summary": summary, "pages": pages}
+    if output_path is None and is_path(doc_path2):
+        p = Path(doc_path2)
+        output_path = str(p.parent / f"{p.stem}-diff.json")
+    if output_path is None:
+        return report
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return output_path
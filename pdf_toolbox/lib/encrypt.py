@@ -1,36 +1,184 @@
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Union
 
 import fitz
+from loguru import logger
+from tqdm import tqdm
 
+from pdf_toolbox.utils import PdfSource, open_pdf, save_pdf
 
-def encrypt_pdf(doc_path: str, user_password: str, owner_password: str = None, output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    perm = int(
-        fitz.PDF_PERM_ACCESSIBILITY # always use this
-        | fitz.PDF_PERM_PRINT # permit printing
-        | fitz.PDF_PERM_COPY # permit copying
-        | fitz.PDF_PERM_ANNOTATE # permit annotations
-    )
+PERMISSIONS = {
+    "print":         fitz.PDF_PERM_PRINT,          # 打印
+    "print-hq":      fitz.PDF_PERM_PRINT_HQ,       # 高质量打印
+    "copy":          fitz.PDF_PERM_COPY,           # 复制内容
+    "annotate":      fitz.PDF_PERM_ANNOTATE,       # 添加注释
+    "modify":        fitz.PDF_PERM_MODIFY,         # 修改内容
+    "form":          fitz.PDF_PERM_FORM,           # 填写表单
+    "assemble":      fitz.PDF_PERM_ASSEMBLE,       # 插入/删除/旋转页面
+}
+DEFAULT_PERMISSIONS = "print,copy,annotate"
+
+
+def parse_permissions(permissions: Union[str, int] = DEFAULT_PERMISSIONS) -> int:
+    """解析权限: 整数, 或逗号分隔的权限名(见PERMISSIONS), 'all'表示全部, 'none'表示仅允许辅助功能"""
+    if isinstance(permissions, int):
+        return permissions
+    perm = fitz.PDF_PERM_ACCESSIBILITY  # always use this
+    for name in permissions.replace(" ", "").lower().split(","):
+        if name in ("", "none"):
+            continue
+        if name == "all":
+            for v in PERMISSIONS.values():
+                perm |= v
+        elif name.lstrip("-").isdigit():
+            perm |= int(name)
+        elif name in PERMISSIONS:
+            perm |= PERMISSIONS[name]
+        else:
+            raise ValueError(f"未知的权限: {name}, 可选: {', '.join(PERMISSIONS)}, all, none!")
+    return int(perm)
+
+def encrypt_pdf(doc_path: PdfSource, user_password: str, owner_password: str = None, output_path: str = None, permissions: Union[str, int] = DEFAULT_PERMISSIONS):
+    """加密pdf, 输入为fitz.Document时必须指定output_path(加密只在保存时生效)
+
+    Args:
+        permissions (Union[str, int], optional): 权限, 如"print,copy", 见parse_permissions. Defaults to "print,copy,annotate".
+    """
+    doc: fitz.Document = open_pdf(doc_path)
     encrypt_meth = fitz.PDF_ENCRYPT_AES_256 # strongest algorithm
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-encrypt.pdf")
-    doc.save(
-        output_path,
+    return save_pdf(
+        doc, doc_path, output_path, "-encrypt",
         encryption=encrypt_meth, # set the encryption method
         owner_pw=owner_password, # set the owner password
         user_pw=user_password, # set the user password
-        permissions=perm, # set permissions
+        permissions=parse_permissions(permissions), # set permissions
     )
 
-def decrypt_pdf(doc_path: str, password: str, output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    if doc.isEncrypted:
-        doc.authenticate(password)
-        n = doc.page_count
-        doc.select(range(n))
-    if output_path is None:
-        output_path = str(p.parent / f"{p.stem}-decrypt.pdf")
-    doc.save(output_path)
+def decrypt_pdf(doc_path: PdfSource, password: str, output_path: str = None):
+    doc: fitz.Document = open_pdf(doc_path)
+    if doc.is_encrypted and not doc.authenticate(password):
+        raise ValueError("密码错误!")
+    # 认证后直接保存即不带加密, 无需select重建页面树
+    return save_pdf(doc, doc_path, output_path, "-decrypt")
+
+
+def _output_suffix(decrypt: bool) -> str:
+    return "-decrypt" if decrypt else "-encrypt"
+
+def load_jobs(input_path: str, user_password: str = None, owner_password: str = None, permissions: str = DEFAULT_PERMISSIONS, output_dir: str = None, decrypt: bool = False) -> list:
+    """生成批量任务列表
+
+    - 目录: 递归查找*.pdf, 所有文件使用相同的密码和权限; 未指定output_dir时结果保存在输入文件旁边,
+      此时跳过之前生成的*-encrypt.pdf(解密时为*-decrypt.pdf); 指定output_dir时跳过其中的文件
+    - csv文件: 表头为path,user_pw,owner_pw,permissions(仅path必填), 空值使用命令行指定的值, 相对路径相对于csv所在目录
+
+    指定output_dir时保持相对(目录或csv所在目录)的目录结构; 多个任务的输出路径相同时报错
+    """
+    jobs = []
+    if os.path.isdir(input_path):
+        root = os.path.abspath(input_path)
+        exclude = os.path.abspath(output_dir) + os.sep if output_dir is not None else None
+        for path in sorted(glob.glob(os.path.join(root, "**", "*.pdf"), recursive=True)):
+            if exclude is not None and path.startswith(exclude):
+                continue
+            if output_dir is None and Path(path).stem.endswith(_output_suffix(decrypt)):
+                continue  # 之前运行生成的结果
+            jobs.append({"path": path, "user_pw": user_password, "owner_pw": owner_password, "permissions": permissions,
+                         "rel": os.path.relpath(path, root)})
+    elif input_path.lower().endswith(".csv"):
+        root = os.path.dirname(os.path.abspath(input_path))
+        with open(input_path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or "path" not in reader.fieldnames:
+                raise ValueError("csv文件缺少path列!")
+            for row in reader:
+                path = (row.get("path") or "").strip()
+                if not path:
+                    continue
+                path = os.path.abspath(os.path.join(root, path))
+                rel = os.path.relpath(path, root)
+                if rel.startswith(os.pardir):
+                    rel = os.path.splitdrive(path)[1].lstrip(os.sep)  # csv所在目录之外的文件按绝对路径保持目录结构
+                jobs.append({"path": path,
+                             "user_pw": row.get("user_pw") or user_password,
+                             "owner_pw": row.get("owner_pw") or owner_password,
+                             "permissions": row.get("permissions") or permissions,
+                             "rel": rel})
+    else:
+        raise ValueError("批量模式的输入应为目录或csv文件!")
+    outputs = {}
+    for job in jobs:
+        if output_dir is not None:
+            job["output"] = str(Path(output_dir) / job["rel"])
+        else:
+            p = Path(job["path"])
+            job["output"] = str(p.parent / f"{p.stem}{_output_suffix(decrypt)}.pdf")
+        job["decrypt"] = decrypt
+        key = os.path.normcase(os.path.abspath(job["output"]))
+        if key in outputs:
+            raise ValueError(f"输出路径重复: {outputs[key]} 和 {job['path']} 都将保存到 {job['output']}!")
+        outputs[key] = job["path"]
+    return jobs
+
+def _run_job(job: dict) -> dict:
+    start = time.perf_counter()
+    result = {"path": job["path"], "output": job["output"], "status": "ok", "error": ""}
+    try:
+        Path(job["output"]).parent.mkdir(parents=True, exist_ok=True)
+        if job["decrypt"]:
+            password = job["user_pw"] or job["owner_pw"]
+            decrypt_pdf(job["path"], password, job["output"])
+        else:
+            if not job["user_pw"] and not job["owner_pw"]:
+                raise ValueError("未指定密码!")
+            encrypt_pdf(job["path"], job["user_pw"], job["owner_pw"], job["output"], job["permissions"])
+    except Exception as e:
+        result.update(status="failed", output="", error=str(e))
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+def bulk_encrypt_pdf(input_path: str, user_password: str = None, owner_password: str = None, permissions: str = DEFAULT_PERMISSIONS,
+                     output_dir: str = None, decrypt: bool = False, workers: int = None, report_path: str = None) -> list:
+    """批量加/解密, 多进程处理, 结束后输出每个文件的结果报告
+
+    Args:
+        input_path (str): 目录或csv文件, 见load_jobs
+        output_dir (str, optional): 结果保存目录. Defaults to None(保存到输入文件旁边).
+        decrypt (bool, optional): 是否解密, 解密时使用user_pw(为空则使用owner_pw)作为密码. Defaults to False.
+        workers (int, optional): 进程数. Defaults to None(cpu核数).
+        report_path (str, optional): 报告保存路径(csv). Defaults to None(output_dir或输入所在目录下的crypt-report.csv).
+    """
+    jobs = load_jobs(input_path, user_password, owner_password, permissions, output_dir, decrypt)
+    if not decrypt:
+        for job in jobs:
+            parse_permissions(job["permissions"])  # 提前检查权限写法, 避免提交后才失败
+    results = []
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if workers <= 1:
+        results = [_run_job(job) for job in tqdm(jobs)]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_run_job, job) for job in jobs]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                results.append(future.result())
+        order = {job["path"]: i for i, job in enumerate(jobs)}
+        results.sort(key=lambda v: order[v["path"]])
 
+    if report_path is None:
+        report_dir = output_dir or (input_path if os.path.isdir(input_path) else os.path.dirname(os.path.abspath(input_path)))
+        report_path = os.path.join(report_dir, "crypt-report.csv")
+    Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["path", "output", "status", "error", "seconds"])
+        writer.writeheader()
+        writer.writerows(results)
+    failed = [v for v in results if v["status"] != "ok"]
+    for v in failed:
+        logger.error(f"{v['path']}: {v['error']}")
+    logger.info(f"total: {len(results)}, ok: {len(results)-len(failed)}, failed: {len(failed)}, report: {report_path}")
+    return results
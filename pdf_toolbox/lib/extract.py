@@ -1,35 +1,50 @@
-import shutil
+import csv
+import html
+import json
+import re
 from pathlib import Path
+from typing import Union
 
 import cv2
 import fitz
+import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
-from pdf_toolbox.utils import parse_range, ppstructure_analysis
+from pdf_toolbox.lib.header_footer import detect_headers_footers, strip_headers_footers
+from pdf_toolbox.utils import (PdfSource, get_table_engine, imread, is_path, open_pdf, parse_range, ppstructure_analysis,
+                               render_page, table_structure)
+from pdf_toolbox.utils.memory import BackgroundWriter, MemoryBudget
+from pdf_toolbox.utils.profiler import stage
 
 
-def plot_roi_region(input_path, type: str = 'title', output_path: str = None):
-    img = cv2.imread(input_path)
-    result = ppstructure_analysis(input_path)
+def plot_roi_region(input_path: Union[str, np.ndarray], type: str = 'title', output_path: str = None):
+    img = imread(input_path).copy()
+    result = ppstructure_analysis(img)
     for item in result:
         if item['type'] == type:
             x1, y1, x2, y2 = item['bbox']
             cv2.rectangle(img, (x1, y1), (x2, y2), color=(255, 0, 0), thickness=2)
     if output_path is None:
+        if isinstance(input_path, np.ndarray):
+            return img
         p = Path(input_path)
         savedir = p.parent / type
         savedir.mkdir(exist_ok=True, parents=True)
         output_path = str(savedir / p.name)
     cv2.imwrite(output_path, img)
+    return output_path
 
-def extract_images_from_pdf(doc_path: str, page_range: str = 'all', output_dir: str = None):
+def extract_images_from_pdf(doc_path: PdfSource, page_range: str = 'all', output_dir: str = None):
     # TODO: 提取的图片显示不全
-    doc = fitz.open(doc_path) # open a document
-    if output_dir is None:
+    doc = open_pdf(doc_path) # open a document
+    if output_dir is None and is_path(doc_path):
         p = Path(doc_path)
         output_dir = p.parent / f"{p.stem}-images"
-    output_dir.mkdir(parents=True, exist_ok=True)
+    if output_dir is not None:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+    images = []  # 不落盘时返回[(页码, 序号, png bytes), ...]
     if page_range=="all":
         roi_indices = list(range(len(doc)))
     else:
@@ -49,72 +64,250 @@ def extract_images_from_pdf(doc_path: str, page_range: str = 'all', output_dir:
             pix = fitz.Pixmap(doc, xref) # create a Pixmap
             if pix.n - pix.alpha > 3: # CMYK: convert to RGB first
                 pix = fitz.Pixmap(fitz.csRGB, pix)
+            if output_dir is None:
+                images.append((page_index, image_index, pix.tobytes("png")))
+                continue
             savepath = str(output_dir / f"page_{page_index}-image_{image_index}.png")
             # pix.save(savepath) # save the image as png
             pix.pil_save(savepath, quality=100, dpi=(1800,1800))
             pix = None
+    return images if output_dir is None else str(output_dir)
 
 
-def extract_text_from_pdf(doc_path: str, output_path: str = None):
-    doc = fitz.open(doc_path)  # open document
+def extract_text_from_pdf(doc_path: PdfSource, output_path: str = None, strip_headers: bool = False):
+    """提取文本, 页与页之间以换页符(0x0C)分隔; 未指定output_path且输入不是文件路径时直接返回文本
+
+    Args:
+        strip_headers (bool, optional): 是否去除页眉页脚(见detect_headers_footers). Defaults to False.
+    """
+    doc = open_pdf(doc_path)  # open document
+    texts = [page.get_text() for page in doc]
+    if strip_headers:
+        texts = strip_headers_footers(texts, detect_headers_footers(doc))
+    text = "".join(v + chr(12) for v in texts)  # write page delimiter (form feed 0x0C)
     if output_path is None:
+        if not is_path(doc_path):
+            return text
         p = Path(doc_path)
         output_path = p.parent / f'{p.stem}-text.txt'
-    with open(output_path, "wb", encoding="utf-8") as f:  # open text output
-        for page in doc:  # iterate the document pages
-            text = page.get_text().encode("utf8")  # get plain text (is in UTF-8)
-            f.write(text)  # write text of page
-            f.write(bytes((12,)))  # write page delimiter (form feed 0x0C)
-
-def extract_item_from_pdf(doc_path: str, page_range: str = 'all', type: str = "figure", output_dir: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    tmp_dir = p.parent / 'tmp'
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    if output_dir is None:
-        output_dir = p.parent / type
-    else:
+    with open(output_path, "w", encoding="utf-8") as f:  # open text output
+        f.write(text)
+    return str(output_path)
+
+def extract_item_from_pdf(doc_path: PdfSource, page_range: str = 'all', type: str = "figure", output_dir: str = None, max_memory: float = None):
+    """提取图片、表格、公式等区域; 未指定output_dir且输入不是文件路径时不落盘,
+    返回[{'page': 页码, 'bbox': 区域, 'img': 图片数组}, ...]
+
+    逐页处理, 版面分析结果写入后即释放, max_memory(MB)指定内存预算, 超出时释放缓存
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    if output_dir is None and is_path(doc_path):
+        output_dir = Path(doc_path).parent / type
+    elif output_dir is not None:
         output_dir = Path(output_dir) / type
-    output_dir.mkdir(parents=True, exist_ok=True)
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
     if page_range=="all":
         roi_indices = list(range(len(doc)))
     else:
         roi_indices = parse_range(page_range)
-    for page_index in tqdm(roi_indices, total=len(roi_indices)):
-        page = doc[page_index] # get the page
-        pix = page.get_pixmap()  # render page to an image
-        savepath = str(tmp_dir / f"page-{page.number+1}.png")
-        # pix.save(savepath)  # store image as a PNG
-        pix.pil_save(savepath, quality=100, dpi=(1800,1800))
-        result = ppstructure_analysis(savepath)
-        result = [v for v in result if v['type']==type]
-        
-        idx = 1
-        for item in result:
-            im_show = Image.fromarray(item['img'])
-            im_show.save(str(output_dir / f"page-{page.number+1}-{type}-{idx}.png"))
-            idx += 1
-
-
-def debug_item_from_pdf(doc_path: str, page_range: str = 'all', type: str = "figure", output_dir: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    tmp_dir = p.parent / 'tmp'
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    if output_dir is None:
-        output_dir = p.parent / type
+    items = []
+    budget = MemoryBudget(max_memory)
+    with BackgroundWriter() as writer:
+        for page_index in tqdm(roi_indices, total=len(roi_indices)):
+            with stage("page", page=page_index+1):
+                page = doc[page_index] # get the page
+                img = render_page(page)  # render page to an image
+                page = None
+                result = ppstructure_analysis(img)
+                del img
+                result = [v for v in result if v['type']==type]
+
+                if output_dir is None:
+                    items.extend({'page': page_index+1, 'bbox': v['bbox'], 'img': v['img']} for v in result)
+                else:
+                    for idx, item in enumerate(result, start=1):
+                        writer.submit(_save_image, item['img'], str(output_dir / f"page-{page_index+1}-{type}-{idx}.png"))
+                del result
+            budget.check()
+    return items if output_dir is None else str(output_dir)
+
+def _save_image(img: np.ndarray, savepath: str):
+    with stage("write_result"):
+        Image.fromarray(img).save(savepath)
+
+
+def parse_table_structure(tokens: list, boxes: list) -> list:
+    """将表格结构识别输出的html标记序列解析为单元格列表, 第i个<td>对应第i个单元格框
+
+    tokens可以是完整的标签(如'<td colspan="2">'), 也可以是结构识别模型输出的拆分形式('<td', ' colspan="2"', '>')
+
+    Returns:
+        list: [{'row': 行号, 'col': 列号, 'rowspan': 跨行数, 'colspan': 跨列数, 'bbox': (x0, y0, x1, y1)}, ...]
+    """
+    cells = []
+    row = -1
+    for token in tokens:
+        if token == "<tr>":
+            row += 1
+        elif token.startswith("<td"):
+            box = boxes[len(cells)] if len(cells) < len(boxes) else [0, 0, 0, 0]
+            xs, ys = box[0::2], box[1::2]  # 4点或8点坐标
+            cells.append({'row': max(row, 0), 'col': 0, 'rowspan': 1, 'colspan': 1, 'bbox': (min(xs), min(ys), max(xs), max(ys))})
+            for key in ("colspan", "rowspan"):
+                m = re.search(key + r'="?(\d+)', token)
+                if m:
+                    cells[-1][key] = int(m.group(1))
+        elif cells and ("colspan" in token or "rowspan" in token):
+            cells[-1]["colspan" if "colspan" in token else "rowspan"] = int(re.sub(r"\D", "", token) or 1)
+    # 按跨行跨列占位计算列号
+    taken = set()
+    for cell in cells:
+        col = 0
+        while (cell['row'], col) in taken:
+            col += 1
+        cell['col'] = col
+        taken.update((cell['row']+i, col+j) for i in range(cell['rowspan']) for j in range(cell['colspan']))
+    return cells
+
+def fill_table_cells(cells: list, items: list) -> list:
+    """将文本(词或ocr文本行)按中心点分配到单元格, 返回二维表格(跨行跨列的单元格只在左上角填写)
+
+    Args:
+        cells (list): parse_table_structure的结果
+        items (list): [(x0, y0, x1, y1, 文本), ...], 与单元格坐标在同一坐标系下, 按阅读顺序排列
+    """
+    if not cells:
+        return []
+    rects = np.array([cell['bbox'] for cell in cells], dtype=np.float32)
+    tolerance = max(5., float(np.median(rects[:, 3] - rects[:, 1])) / 2)
+    texts = [[] for _ in cells]
+    for x0, y0, x1, y1, text in items:
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        dx = np.maximum(np.maximum(rects[:, 0] - cx, cx - rects[:, 2]), 0)
+        dy = np.maximum(np.maximum(rects[:, 1] - cy, cy - rects[:, 3]), 0)
+        dist = np.hypot(dx, dy)
+        idx = int(dist.argmin())
+        if dist[idx] <= tolerance:
+            texts[idx].append(text)
+    n_rows = max(cell['row'] + cell['rowspan'] for cell in cells)
+    n_cols = max(cell['col'] + cell['colspan'] for cell in cells)
+    table = [["" for _ in range(n_cols)] for _ in range(n_rows)]
+    for cell, words in zip(cells, texts):
+        table[cell['row']][cell['col']] = " ".join(words)
+    return table
+
+def recognize_table(page: fitz.Page, rect: fitz.Rect, lang: str = 'ch', dpi: int = 200, min_words: int = 1) -> list:
+    """识别页面上指定区域的表格, 返回二维表格
+
+    只对表格区域以较高分辨率渲染. 区域内有文本层时只运行结构识别模型, 用文本层的词填充单元格, 不做任何ocr;
+    否则由lang对应的表格引擎同时识别结构和单元格文本, 区域只识别一次
+    """
+    scale = dpi / 72
+    img = render_page(page, dpi=dpi, clip=rect)
+    words = page.get_text("words", clip=rect, sort=True)
+    if len(words) >= min_words:
+        with stage("table_structure"):
+            tokens, boxes = table_structure(img, lang)
+        cells = parse_table_structure(tokens, np.asarray(boxes).tolist())
+        items = [((x0-rect.x0)*scale, (y0-rect.y0)*scale, (x1-rect.x0)*scale, (y1-rect.y0)*scale, text)
+                 for x0, y0, x1, y1, text, *_ in words]
+        return fill_table_cells(cells, items)
+
+    with stage("table_ocr"):
+        result = get_table_engine(lang)(img)
+    res = result[0].get("res", {}) if result else {}
+    table_html = res.get("html", "") if isinstance(res, dict) else ""
+    boxes = res.get("cell_bbox", []) if isinstance(res, dict) else []
+    cells = parse_table_structure(re.findall(r"<tr>|<td[^>]*>", table_html), np.asarray(boxes).tolist())
+    texts = [html.unescape(re.sub(r"<[^>]+>", "", v)).strip() for v in re.findall(r"<td[^>]*>(.*?)</td>", table_html, re.S)]
+    return fill_table_cells(cells, [(*cell['bbox'], text) for cell, text in zip(cells, texts) if text])
+
+def save_table(table: list, savepath: str, format: str = "csv", meta: dict = None):
+    """保存表格, format: csv/xlsx/json"""
+    with stage("write_result"):
+        if format == "csv":
+            with open(savepath, "w", encoding="utf-8-sig", newline="") as f:
+                csv.writer(f).writerows(table)
+        elif format == "json":
+            with open(savepath, "w", encoding="utf-8") as f:
+                json.dump({**(meta or {}), "rows": table}, f, ensure_ascii=False, indent=2)
+        elif format == "xlsx":
+            try:
+                from openpyxl import Workbook
+            except ImportError:
+                raise ImportError("导出xlsx需要安装openpyxl: pip install openpyxl")
+            wb = Workbook()
+            for row in table:
+                wb.active.append(row)
+            wb.save(savepath)
+        else:
+            raise ValueError(f"不支持的表格格式: {format}!")
+
+def extract_tables_from_pdf(doc_path: PdfSource, page_range: str = 'all', format: str = "csv", output_dir: str = None,
+                            lang: str = 'ch', dpi: int = 200, max_memory: float = None):
+    """提取表格内容, 每个表格保存为一个csv/xlsx/json文件; 未指定output_dir且输入不是文件路径时不落盘,
+    返回[{'page': 页码, 'index': 序号, 'bbox': 区域, 'rows': 二维表格}, ...]
+
+    每页只做一次版面分析, 表格结构识别(及扫描页的ocr)只在检测到的表格区域上进行
+
+    Args:
+        format (str, optional): 保存格式, csv/xlsx/json. Defaults to "csv".
+        dpi (int, optional): 表格区域的渲染分辨率. Defaults to 200.
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    if output_dir is None and is_path(doc_path):
+        output_dir = Path(doc_path).parent / "table"
+    elif output_dir is not None:
+        output_dir = Path(output_dir) / "table"
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    if page_range=="all":
+        roi_indices = list(range(len(doc)))
     else:
+        roi_indices = parse_range(page_range)
+    tables = []
+    budget = MemoryBudget(max_memory)
+    with BackgroundWriter() as writer:
+        for page_index in tqdm(roi_indices, total=len(roi_indices)):
+            with stage("page", page=page_index+1):
+                page = doc[page_index]
+                img = render_page(page)  # 72dpi, 版面坐标即pdf坐标
+                regions = [v['bbox'] for v in ppstructure_analysis(img) if v['type'] == 'table']
+                del img
+                for idx, bbox in enumerate(regions, start=1):
+                    rect = fitz.Rect(bbox) & page.rect
+                    table = recognize_table(page, rect, lang, dpi)
+                    item = {'page': page_index+1, 'index': idx, 'bbox': list(rect), 'rows': table}
+                    if output_dir is None:
+                        tables.append(item)
+                    else:
+                        savepath = str(output_dir / f"page-{page_index+1}-table-{idx}.{format}")
+                        writer.submit(save_table, table, savepath, format, {k: item[k] for k in ('page', 'index', 'bbox')})
+            budget.check()
+    return tables if output_dir is None else str(output_dir)
+
+
+def debug_item_from_pdf(doc_path: PdfSource, page_range: str = 'all', type: str = "figure", output_dir: str = None):
+    """在页面上框出检测到的指定类型区域; 未指定output_dir且输入不是文件路径时不落盘, 返回[(页码, 图片数组), ...]"""
+    doc: fitz.Document = open_pdf(doc_path)
+    if output_dir is None and is_path(doc_path):
+        output_dir = Path(doc_path).parent / type
+    elif output_dir is not None:
         output_dir = Path(output_dir) / type
-    output_dir.mkdir(parents=True, exist_ok=True)
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
     if page_range=="all":
         roi_indices = list(range(len(doc)))
     else:
         roi_indices = parse_range(page_range)
+    pages = []
     for page_index in tqdm(roi_indices, total=len(roi_indices)):
-        page = doc[page_index] # get the page
-        pix = page.get_pixmap()  # render page to an image
-        savepath = str(tmp_dir / f"page-{page.number+1}.png")
-        # pix.save(savepath)  # store image as a PNG
-        pix.pil_save(savepath, quality=100, dpi=(1800,1800))
-        plot_roi_region(savepath, type, str(output_dir / f"page-{page.number+1}-{type}.png"))
-    shutil.rmtree(tmp_dir)
\ No newline at end of file
+        with stage("page", page=page_index+1):
+            page = doc[page_index] # get the page
+            img = render_page(page)  # render page to an image
+            if output_dir is None:
+                pages.append((page.number+1, plot_roi_region(img, type)))
+            else:
+                plot_roi_region(img, type, str(output_dir / f"page-{page.number+1}-{type}.png"))
+    return pages if output_dir is None else str(output_dir)
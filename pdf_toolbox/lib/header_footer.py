@@ -0,0 +1,208 @@
+import csv
+import json
+import re
+from pathlib import Path
+
+import cv2
+import fitz
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf, parse_range, render_page, save_pdf
+from pdf_toolbox.utils.profiler import stage
+
+
+ROMAN_NUMERAL = re.compile(r"(?=[MDCLXVI])M{0,3}(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})")
+PAGE_WORDS = {"page", "p", "pp"}
+
+def _is_roman_page(tokens: list, index: int) -> bool:
+    """tokens[index]是否为罗马数字页码: 全大写或全小写的合法罗马数字, 且是行内唯一的单词, 或紧邻数字/page"""
+    token = tokens[index]
+    if not (token.isupper() or token.islower()) or ROMAN_NUMERAL.fullmatch(token.upper()) is None:
+        return False
+    if sum(v.isalpha() for v in tokens) == 1:  # 行内除数字外只有这一个单词
+        return True
+    neighbours = tokens[max(0, index-1):index] + tokens[index+1:index+2]
+    return any(v.isdigit() or v.lower() in PAGE_WORDS for v in neighbours)
+
+def normalize_line(text: str) -> str:
+    """归一化文本行用于跨页比较: 数字(页码等)及罗马数字页码替换为#, 去掉空白"""
+    tokens = re.findall(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]+", text)
+    is_word = [re.fullmatch(r"[A-Za-z]+|\d+", v) is not None for v in tokens]
+    words = [v for v, w in zip(tokens, is_word) if w]  # 判断相邻关系时忽略标点和中文
+    out, k = [], 0
+    for v, w in zip(tokens, is_word):
+        if w:
+            if v.isdigit() or (v.isalpha() and _is_roman_page(words, k)):
+                v = "#"
+            k += 1
+        out.append(v)
+    return "".join(out).lower()
+
+def _band_lines(page: fitz.Page, band: float) -> list:
+    """返回页面顶部/底部区域内的文本行[(类型, 文本, bbox), ...], 只解析这两个区域"""
+    rect = page.rect
+    lines = []
+    for kind, clip in (("header", fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height*band)),
+                       ("footer", fitz.Rect(rect.x0, rect.y1 - rect.height*band, rect.x1, rect.y1))):
+        for block in page.get_text("dict", clip=clip, flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+            for line in block.get("lines", []):
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if text:
+                    lines.append((kind, text, tuple(line["bbox"])))
+    return lines
+
+def _cached_ocr_lines(doc_path: PdfSource, page_number: int, n: int = 2) -> list:
+    """无文本层时使用ocr命令已有的识别结果, 无坐标, 取前/后n行分别作为页眉/页脚候选"""
+    if not is_path(doc_path):
+        return []
+    p = Path(doc_path)
+    cached = p.parent / f"{p.stem}_ocr_result" / f"page-{page_number}-ocr.txt"
+    if not cached.exists():
+        return []
+    texts = [v.strip() for v in cached.read_text(encoding="utf-8").splitlines() if v.strip()]
+    head, tail = texts[:n], texts[max(n, len(texts)-n):]
+    return [("header", v, None) for v in head] + [("footer", v, None) for v in tail]
+
+def detect_headers_footers(doc_path: PdfSource, page_range: str = 'all', band: float = 0.08, min_pages: int = 3, tolerance: float = 0.02) -> list:
+    """根据跨页重复统计检测页眉页脚, 不使用版面分析模型
+
+    顶部/底部区域内的文本行归一化(页码等数字不参与比较)后, 在不少于min_pages个页面中重复出现,
+    且纵向位置与该组的中位数相差不超过tolerance(页面高度的比例)的, 认为是页眉/页脚
+
+    Args:
+        band (float, optional): 顶部/底部区域占页面高度的比例. Defaults to 0.08.
+        min_pages (int, optional): 至少在多少个页面中重复出现. Defaults to 3.
+        tolerance (float, optional): 纵向位置允许的偏差(页面高度的比例). Defaults to 0.02.
+
+    Returns:
+        list: [{'page': 页码, 'type': 'header'/'footer', 'text': 文本, 'bbox': 区域(来自ocr结果时为None)}, ...]
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    if page_range == "all":
+        roi_indices = list(range(len(doc)))
+    else:
+        roi_indices = parse_range(page_range)
+
+    lines, keys, pages, ys = [], [], [], []
+    key_ids = {}
+    with stage("collect_band_lines"):
+        for page_index in roi_indices:
+            page = doc[page_index]
+            candidates = _band_lines(page, band) or _cached_ocr_lines(doc_path, page_index+1)
+            for kind, text, bbox in candidates:
+                key = key_ids.setdefault((kind, normalize_line(text)), len(key_ids))
+                lines.append({'page': page_index+1, 'type': kind, 'text': text, 'bbox': list(bbox) if bbox else None})
+                keys.append(key)
+                pages.append(page_index)
+                ys.append((bbox[1] + bbox[3]) / 2 / page.rect.height if bbox else np.nan)
+    if not lines:
+        return []
+
+    keys, pages, ys = np.array(keys), np.array(pages), np.array(ys, dtype=np.float64)
+    # 每组在多少个不同页面中出现(同一页重复出现只算一次)
+    uniq = np.unique(np.stack([keys, pages]), axis=1)
+    page_counts = np.bincount(uniq[0], minlength=len(key_ids))
+    selected = page_counts[keys] >= min_pages
+    # 位置一致性: 与同组纵向位置中位数的偏差
+    for key in np.unique(keys[selected]):
+        mask = keys == key
+        if np.isnan(ys[mask]).all():
+            continue
+        median = np.nanmedian(ys[mask])
+        selected[mask] &= np.isnan(ys[mask]) | (np.abs(ys[mask] - median) <= tolerance)
+    result = [lines[i] for i in np.flatnonzero(selected)]
+    logger.info(f"found {sum(v['type']=='header' for v in result)} header lines, {sum(v['type']=='footer' for v in result)} footer lines")
+    return result
+
+def _filter_type(items: list, type: str = None) -> list:
+    return [v for v in items if type in (None, "all") or v['type'] == type]
+
+def extract_headers_footers(doc_path: PdfSource, page_range: str = 'all', type: str = None, format: str = "json", output_path: str = None, **kwargs):
+    """导出页眉/页脚; 未指定output_path且输入不是文件路径时直接返回列表
+
+    Args:
+        type (str, optional): header/footer, None表示都导出. Defaults to None.
+        format (str, optional): 保存格式, json/csv. Defaults to "json".
+    """
+    items = _filter_type(detect_headers_footers(doc_path, page_range, **kwargs), type)
+    if output_path is None:
+        if not is_path(doc_path):
+            return items
+        p = Path(doc_path)
+        output_path = str(p.parent / f"{p.stem}-{type or 'header_footer'}.{format}")
+    if format == "json":
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+    elif format == "csv":
+        with open(output_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["page", "type", "text", "x0", "y0", "x1", "y1"])
+            for v in items:
+                writer.writerow([v['page'], v['type'], v['text'], *(v['bbox'] or ["", "", "", ""])])
+    else:
+        raise ValueError(f"不支持的格式: {format}!")
+    return output_path
+
+def strip_headers_footers(texts: list, items: list) -> list:
+    """从每页文本中删除检测到的页眉页脚行
+
+    Args:
+        texts (list): 每页文本(page.get_text()), 与页码一一对应, 第i项为第i+1页
+        items (list): detect_headers_footers的结果
+    """
+    by_page = {}
+    for v in items:
+        by_page.setdefault(v['page'], []).append(v['text'])
+    result = []
+    for i, text in enumerate(texts):
+        remove = by_page.get(i+1, [])
+        if not remove:
+            result.append(text)
+            continue
+        page_lines = text.split("\n")
+        for line_text in remove:
+            for j, line in enumerate(page_lines):
+                if line is not None and line.strip() == line_text:
+                    page_lines[j] = None
+                    break
+        result.append("\n".join(v for v in page_lines if v is not None))
+    return result
+
+def redact_headers_footers(doc_path: PdfSource, page_range: str = 'all', type: str = None, output_path: str = None, **kwargs):
+    """从pdf中涂除页眉/页脚(删除文字内容, 不影响图片)"""
+    doc: fitz.Document = open_pdf(doc_path)
+    items = [v for v in _filter_type(detect_headers_footers(doc, page_range, **kwargs), type) if v['bbox']]
+    pages = set()
+    for v in items:
+        doc[v['page']-1].add_redact_annot(fitz.Rect(v['bbox']))
+        pages.add(v['page']-1)
+    for page_index in sorted(pages):
+        doc[page_index].apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE)
+    return save_pdf(doc, doc_path, output_path, "-redacted", garbage=3, deflate=True)
+
+def debug_headers_footers(doc_path: PdfSource, page_range: str = 'all', type: str = None, output_dir: str = None, **kwargs):
+    """在页面上框出检测到的页眉/页脚; 未指定output_dir且输入不是文件路径时不落盘, 返回[(页码, 图片数组), ...]"""
+    doc: fitz.Document = open_pdf(doc_path)
+    name = type or "header_footer"
+    if output_dir is None and is_path(doc_path):
+        output_dir = Path(doc_path).parent / name
+    elif output_dir is not None:
+        output_dir = Path(output_dir) / name
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    by_page = {}
+    for v in _filter_type(detect_headers_footers(doc, page_range, **kwargs), type):
+        if v['bbox']:
+            by_page.setdefault(v['page'], []).append(v['bbox'])
+    pages = []
+    for page_number in tqdm(sorted(by_page)):
+        img = render_page(doc[page_number-1]).copy()
+        for x1, y1, x2, y2 in by_page[page_number]:
+            cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), color=(255, 0, 0), thickness=2)
+        if output_dir is None:
+            pages.append((page_number, img))
+        else:
+            cv2.imwrite(str(output_dir / f"page-{page_number}-{name}.png"), img)
+    return pages if output_dir is None else str(output_dir)
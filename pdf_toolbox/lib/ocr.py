@@ -1,23 +1,32 @@
-import os
+import functools
 import glob
-import shutil
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Union
 
 import cv2
 import fitz
-from paddleocr import PaddleOCR, draw_ocr
+import numpy as np
+from loguru import logger
+from paddleocr import draw_ocr
 from PIL import Image
 from tqdm import tqdm
-import re
 
 from pdf_toolbox.lib.bookmark import transform_toc_file
-from pdf_toolbox.utils import parse_range
+from pdf_toolbox.utils import PdfSource, get_ocr_engine, imread, is_path, open_pdf, parse_range, render_page
+from pdf_toolbox.utils.memory import BackgroundWriter, MemoryBudget
+from pdf_toolbox.utils.profiler import stage
 
 
 def center_y(elem):
     return (elem[0][0][1]+elem[0][3][1])/2
 
-def write_ocr_result(ocr_results, output_path: str, offset: int = 5):
+def format_ocr_result(ocr_results, offset: float = 5) -> str:
+    """将ocr结果按行拼接为文本"""
+    if not ocr_results:
+        return ""
     # 按照 y中点 坐标排序
     sorted_by_y = sorted(ocr_results, key=lambda x: center_y(x))
     results = []
@@ -35,70 +44,221 @@ def write_ocr_result(ocr_results, output_path: str, offset: int = 5):
     # 将最后一行的元素添加到结果列表中
     temp_row = sorted(temp_row, key=lambda x: x[0][0])
     results.append(temp_row)
+    text = ""
+    for row in results:
+        line = ""
+        for item in row:
+            pos, (txt, prob) = item
+            line += f"{txt} "
+        line = line.rstrip()
+        text += f"{line}\n"
+    return text
+
+def write_ocr_result(ocr_results, output_path: str, offset: int = 5):
     with open(output_path, "w", encoding="utf-8") as f:
-        for row in results:
-            line = ""
-            for item in row:
-                pos, (text, prob) = item
-                line += f"{text} "
-            line = line.rstrip()
-            f.write(f"{line}\n")
-
-def ocr_from_image(input_path: str, lang: str = 'ch', output_path: str = None, offset: float = 5., show_log: bool = False):
-    ocr_engine = PaddleOCR(use_angle_cls=True, lang=lang, show_log=show_log) # need to run only once to download and load model into memory
-    img = cv2.imread(input_path)
-    result = ocr_engine.ocr(img, cls=False)[0]
-
-    image  = Image.open(input_path).convert('RGB')
+        f.write(format_ocr_result(ocr_results, offset))
+
+def ocr_image(img: np.ndarray, lang: str = 'ch', show_log: bool = False) -> list:
+    """识别BGR格式的图片数组, 返回[[文本框坐标, (文本, 置信度)], ...]"""
+    ocr_engine = get_ocr_engine(lang, show_log)
+    with stage("ocr_engine.ocr"):
+        return ocr_engine.ocr(img, cls=False)[0] or []
+
+def draw_ocr_result(img: np.ndarray, result: list) -> Image.Image:
+    image  = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
     boxes  = [line[0] for line in result]
     txts   = [line[1][0] for line in result]
     scores = [line[1][1] for line in result]
     fontpath = str((Path(__file__).parent.parent / "assets" / "SIMKAI.TTF").absolute())
-    im_show = draw_ocr(image, boxes, txts, scores, font_path=fontpath)
-    im_show = Image.fromarray(im_show)
+    with stage("draw_ocr"):
+        im_show = draw_ocr(image, boxes, txts, scores, font_path=fontpath)
+        return Image.fromarray(im_show)
+
+def save_ocr_result(img: np.ndarray, result: list, output_dir: Path, stem: str, offset: float = 5.):
+    with stage("write_result"):
+        draw_ocr_result(img, result).save(str(output_dir / f"{stem}-ocr.png"))
+        write_ocr_result(result, str(output_dir / f"{stem}-ocr.txt"), offset)
+
+def ocr_from_image(input_path: Union[str, np.ndarray], lang: str = 'ch', output_path: str = None, offset: float = 5., show_log: bool = False):
+    """识别图片, 输入为图片路径或BGR图片数组; 输入为数组且未指定output_path时不落盘, 直接返回识别文本"""
+    img = imread(input_path)
+    result = ocr_image(img, lang, show_log)
+    if isinstance(input_path, np.ndarray):
+        if output_path is None:
+            return format_ocr_result(result, offset)
+        stem = "image"
+    else:
+        stem = Path(input_path).stem
 
-    p = Path(input_path)
     if output_path is None:
-        output_dir = p.parent / "ocr_result"
+        output_dir = Path(input_path).parent / "ocr_result"
     else:
-        output_dir = Path(output_path)    
+        output_dir = Path(output_path)
     output_dir.mkdir(parents=True, exist_ok=True)
-    img_output_path = str(output_dir / f"{p.stem}-ocr.png")
-    text_output_path = str(output_dir / f"{p.stem}-ocr.txt")
+    save_ocr_result(img, result, output_dir, stem, offset)
+    return str(output_dir)
 
-    im_show.save(img_output_path)
-    write_ocr_result(result, text_output_path, offset)
+def ocr_from_pdf(doc_path: PdfSource, page_range: str = 'all', lang: str = 'ch', output_path: str = None, offset: float = 5., show_log: bool = False, max_memory: float = None):
+    """识别pdf, 每页的识别结果及合并后的merged.txt保存到output_path目录;
+    未指定output_path且输入不是文件路径时不落盘, 返回每页识别文本的列表
 
-def ocr_from_pdf(doc_path: str, page_range: str = 'all', lang: str = 'ch', output_path: str = None, offset: float = 5., show_log: bool = False):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    tmp_dir = p.parent / 'tmp'
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    if output_path is None:
+    逐页处理, 每页的图片和识别结果处理完即释放, 结果由后台线程写入(写入跟不上时阻塞识别),
+    max_memory(MB)指定内存预算, 超出时释放缓存
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    if output_path is None and is_path(doc_path):
+        p = Path(doc_path)
         output_path = p.parent / f"{p.stem}_ocr_result"
-    else:
+    if output_path is not None:
         output_path = Path(output_path)
-    output_path.mkdir(parents=True, exist_ok=True)
+        output_path.mkdir(parents=True, exist_ok=True)
     if page_range == "all":
         roi_indices = list(range(len(doc)))
     else:
         roi_indices = parse_range(page_range)
+    if output_path is None:
+        return [text for _, text in _iter_ocr_pages(doc, roi_indices, lang, offset, show_log, max_memory)]
+    merged_path = output_path / "merged.txt"
+    with open(merged_path, "w", encoding="utf-8") as f, BackgroundWriter() as writer:
+        for page_number, text, img, result in _iter_ocr_pages(doc, roi_indices, lang, offset, show_log, max_memory, keep_image=True):
+            f.write(text)
+            writer.submit(save_ocr_result, img, result, output_path, f"page-{page_number}", offset)
+            del img, result
+    return str(output_path)
+
+def _iter_ocr_pages(doc: fitz.Document, roi_indices: list, lang: str, offset: float, show_log: bool, max_memory: float = None, keep_image: bool = False):
+    """逐页识别, 产出(页码, 文本)或(页码, 文本, 图片, 识别结果)"""
+    budget = MemoryBudget(max_memory)
     for page_index in tqdm(roi_indices): # iterate over pdf pages
-        page = doc[page_index] # get the page
-        pix: fitz.Pixmap = page.get_pixmap()  # render page to an image
-        savepath = str(tmp_dir / f"page-{page.number+1}.png")
-        pix.pil_save(savepath, quality=100, dpi=(1800,1800))
-        ocr_from_image(savepath, lang, output_path=str(output_path), offset=offset, show_log=show_log)
+        with stage("page", page=page_index+1):
+            page = doc[page_index] # get the page
+            img = render_page(page)  # render page to an image
+            page = None
+            result = ocr_image(img, lang, show_log)
+            text = format_ocr_result(result, offset)
+        if keep_image:
+            yield page_index+1, text, img, result
+        else:
+            yield page_index+1, text
+        del img, result
+        budget.check()
+
+def load_template(template_path: str) -> dict:
+    """读取区域模板(json)
+
+    格式:
+        {
+            "dpi": 300,
+            "fields": [
+                {"name": "invoice_no", "page": 1, "rect": [x0, y0, x1, y1]},
+                {"name": "address", "page": 1, "rect": [...], "multiline": true}
+            ]
+        }
+    rect为pdf坐标(pt, 左上角为原点, 与PyMuPDF一致), page从1开始, 负数表示倒数第几页;
+    单行字段跳过检测直接批量识别, multiline字段在区域内先检测再识别
+    """
+    with open(template_path, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    names = set()
+    for field in template.get("fields", []):
+        if field.get("name") is None or field.get("rect") is None or len(field["rect"]) != 4:
+            raise ValueError(f"模板字段缺少name或rect: {field}!")
+        if field["name"] in names:
+            raise ValueError(f"模板字段重名: {field['name']}!")
+        names.add(field["name"])
+    if not names:
+        raise ValueError("模板中没有字段!")
+    return template
+
+def ocr_zones(doc_path: PdfSource, template: dict, lang: str = 'ch', dpi: int = None, use_text_layer: bool = True) -> dict:
+    """按模板只渲染并识别指定区域, 返回一条记录: {'file': 文件名, 'fields': {字段: 文本}, 'scores': {字段: 置信度}}
+
+    区域内有文本层时直接读取文本层(置信度记为1); 单行字段的区域图片跳过检测, 一次批量送入识别模型
+
+    Args:
+        template (dict): 区域模板, 见load_template
+        lang (str, optional): ocr语言. Defaults to 'ch'.
+        dpi (int, optional): 区域渲染分辨率. Defaults to None(模板中的dpi, 默认300).
+        use_text_layer (bool, optional): 是否优先使用文本层. Defaults to True.
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    dpi = dpi or template.get("dpi", 300)
+    fields, scores = {}, {}
+    crops, crop_names = [], []
+    for field in template["fields"]:
+        name, page_number = field["name"], field.get("page", 1)
+        index = page_number - 1 if page_number > 0 else doc.page_count + page_number
+        if not 0 <= index < doc.page_count:
+            fields[name], scores[name] = None, 0.
+            continue
+        page = doc[index]
+        rect = fitz.Rect(field["rect"]) & page.rect
+        if use_text_layer:
+            text = page.get_textbox(rect).strip()
+            if text:
+                fields[name], scores[name] = text if field.get("multiline") else " ".join(text.split()), 1.
+                continue
+        with stage("page", page=index+1):
+            img = render_page(page, clip=rect, dpi=dpi)
+        if field.get("multiline"):
+            result = ocr_image(img, lang)
+            fields[name] = format_ocr_result(result, dpi / 72 * 5).rstrip("\n")
+            scores[name] = float(np.mean([v[1][1] for v in result])) if result else 0.
+        else:
+            crops.append(img)
+            crop_names.append(name)
+    if crops:
+        ocr_engine = get_ocr_engine(lang)
+        with stage("text_recognizer"):
+            rec_res, _ = ocr_engine.text_recognizer(crops)
+        for name, (text, score) in zip(crop_names, rec_res):
+            fields[name], scores[name] = text, float(score)
+    name = str(doc_path) if is_path(doc_path) else None
+    names = [v["name"] for v in template["fields"]]
+    return {"file": name, "fields": {k: fields[k] for k in names}, "scores": {k: scores[k] for k in names}}
+
+def _ocr_zones_chunk(paths: list, template: dict, lang: str, dpi: int, use_text_layer: bool) -> list:
+    records = []
+    for path in paths:
+        try:
+            records.append(ocr_zones(path, template, lang, dpi, use_text_layer))
+        except Exception as e:
+            logger.error(f"{path}: {e!r}")
+            records.append({"file": path, "error": repr(e)})
+    return records
+
+def ocr_forms(input_path: str, template_path: str, output_path: str = None, lang: str = 'ch', dpi: int = None,
+              use_text_layer: bool = True, workers: int = 1, chunk_size: int = 16) -> str:
+    """按模板批量识别版式相同的表单(发票、申请表等), 每个文档输出一行json记录
+
+    Args:
+        input_path (str): pdf文件或目录(递归查找*.pdf)
+        template_path (str): 区域模板路径, 见load_template
+        output_path (str, optional): 结果保存路径(jsonl). Defaults to None(文件输入为同名-fields.jsonl, 目录输入为目录下的fields.jsonl).
+        workers (int, optional): 进程数, 每个进程加载一份识别模型. Defaults to 1.
+    """
+    template = load_template(template_path)
+    p = Path(input_path)
+    if p.is_dir():
+        path_list = sorted(glob.glob(os.path.join(input_path, "**", "*.pdf"), recursive=True))
+        output_path = output_path or str(p / "fields.jsonl")
+    else:
+        path_list = [input_path]
+        output_path = output_path or str(p.parent / f"{p.stem}-fields.jsonl")
+    chunks = [path_list[i:i+chunk_size] for i in range(0, len(path_list), chunk_size)]
+    func = functools.partial(_ocr_zones_chunk, template=template, lang=lang, dpi=dpi, use_text_layer=use_text_layer)
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        with open(output_path, "w", encoding="utf-8") as f, tqdm(total=len(path_list)) as bar:
+            for records in (executor.map(func, chunks) if executor else map(func, chunks)):
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                bar.update(len(records))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return output_path
 
-    path_list = sorted(list(filter(lambda x: x.endswith(".txt"), os.listdir(output_path))), key=lambda x: int(re.search("(\d+)", x).group(1)))
-    merged_path = output_path / "merged.txt"
-    with open(merged_path, "a", encoding="utf-8") as f:
-        for path in path_list:
-            abs_path = os.path.join(output_path, path)
-            with open(abs_path, "r", encoding="utf-8") as f2:
-                for line in f2:
-                    f.write(line)
-    shutil.rmtree(tmp_dir)
 
 if __name__ == "__main__":
     input_path = "/home/likai/code/pdf_tocgen/assets/toc2.png"
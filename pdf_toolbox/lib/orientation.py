@@ -0,0 +1,226 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import fitz
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from pdf_toolbox.utils import PdfSource, get_ocr_engine, is_path, open_pdf, parse_range, save_pdf
+from pdf_toolbox.utils.profiler import stage
+
+
+def text_orientation(page: fitz.Page, min_chars: int = 20, max_skew: float = 5.) -> tuple:
+    """根据文本层中文本行的方向判断页面方向
+
+    Returns:
+        tuple: (使文字正向所需的/Rotate值, 倾斜角度), 文本过少时返回(None, 0)
+    """
+    weights = {}
+    skews = []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        for line in block.get("lines", []):
+            n = sum(len(span["text"].strip()) for span in line["spans"])
+            if n == 0:
+                continue
+            theta = math.degrees(math.atan2(line["dir"][1], line["dir"][0]))  # 未旋转页面坐标系, y轴向下
+            base = round(theta / 90) * 90
+            weights[base % 360] = weights.get(base % 360, 0) + n
+            if abs(theta - base) <= max_skew:
+                skews.extend([theta - base] * n)
+    if sum(weights.values()) < min_chars:
+        return None, 0.
+    direction = max(weights, key=weights.get)
+    skew = float(np.median(skews)) if skews else 0.
+    return (-direction) % 360, skew  # y轴向下时角度为正表示顺时针倾斜, 需逆时针转回
+
+def _binarize(gray: np.ndarray) -> np.ndarray:
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return ink
+
+def _profile_score(profile: np.ndarray) -> float:
+    """投影曲线的起伏程度(变异系数的平方): 文本行方向与投影方向垂直时, 行与行间隙交替出现, 得分高"""
+    profile = profile.astype(np.float64)
+    if profile.sum() == 0:
+        return 0.
+    return float(profile.var() / np.square(profile.mean()))
+
+def _line_bands(ink: np.ndarray, min_height: int = 4) -> list:
+    rows = ink.sum(axis=1)
+    mask = rows > max(rows.max() * 0.05, 1)
+    bands, start = [], None
+    for i, v in enumerate(np.append(mask, False)):
+        if v and start is None:
+            start = i
+        elif not v and start is not None:
+            if i - start >= min_height:
+                bands.append((start, i))
+            start = None
+    return bands
+
+def _ascender_score(ink: np.ndarray) -> float:
+    """拉丁文字上伸部(b,d,h,k,l,t及大写)多于下伸部(g,p,q,y), 正向时行内主体以上的墨迹多于以下
+    返回(上-下)/(上+下), 倒置时为负, 中文等接近0"""
+    above = below = 0
+    for y0, y1 in _line_bands(ink):
+        rows = ink[y0:y1].sum(axis=1).astype(np.int64)
+        core = np.flatnonzero(rows >= rows.max() * 0.5)
+        above += rows[:core[0]].sum()
+        below += rows[core[-1]+1:].sum()
+    return float(above - below) / (above + below) if above + below else 0.
+
+def _cls_upside_down(img: np.ndarray, ink: np.ndarray, lang: str = 'ch', max_lines: int = 20) -> float:
+    """使用paddleocr方向分类模型对文本行投票, 返回倒置(180)所占的加权比例-0.5, >0表示倒置"""
+    crops = []
+    for y0, y1 in _line_bands(ink)[:max_lines]:
+        cols = np.flatnonzero(ink[y0:y1].sum(axis=0))
+        if len(cols) == 0:
+            continue
+        crops.append(img[y0:y1, cols[0]:cols[-1]+1])
+    if not crops:
+        return 0.
+    engine = get_ocr_engine(lang)
+    with stage("text_classifier"):
+        _, cls_res, _ = engine.text_classifier(crops)
+    votes = np.array([score if label == "180" else -score for label, score in cls_res])
+    return float(votes.mean()) / 2
+
+def estimate_skew(ink: np.ndarray, max_skew: float = 5., step: float = 0.25) -> tuple:
+    """投影法估计倾斜角度, 返回(角度, 得分); 角度逆时针为正, 即将图片逆时针旋转该角度后文本行水平"""
+    scale = min(1., 800 / max(ink.shape))
+    small = cv2.resize(ink, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else ink
+    h, w = small.shape
+    best, best_score = 0., -1.
+    for angle in np.arange(-max_skew, max_skew + step / 2, step):
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.)
+        rotated = cv2.warpAffine(small, M, (w, h), flags=cv2.INTER_NEAREST)
+        score = _profile_score(rotated.sum(axis=1))
+        if score > best_score:
+            best, best_score = float(angle), score
+    return best, best_score
+
+def image_orientation(page: fitz.Page, dpi: int = 100, max_skew: float = 5., use_cls: bool = False,
+                      lang: str = 'ch', ratio: float = 1.2, threshold: float = 0.1) -> tuple:
+    """低分辨率灰度渲染后用投影法判断页面方向(无文本层时使用)
+
+    横排/竖排分别在±max_skew范围内搜索使行投影起伏最大的角度, 比较两者得分判断文本行方向(同时得到倾斜角度),
+    纠正倾斜后再根据上伸/下伸部墨迹分布判断是否倒置
+
+    Returns:
+        tuple: (使文字正向所需的/Rotate值, 倾斜角度), 无法判断时/Rotate为None
+    """
+    with stage("get_pixmap"):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    ink = _binarize(gray)
+    if ink.sum() == 0:
+        return None, 0.
+    candidates = [estimate_skew(np.ascontiguousarray(np.rot90(ink, k)), max_skew) for k in (0, 1)]
+    (h_skew, h_score), (v_skew, v_score) = candidates
+    if v_score > h_score * ratio:
+        k, skew = 1, v_skew   # 文本行竖直, 逆时针转90度后水平
+    elif h_score > v_score * ratio:
+        k, skew = 0, h_skew
+    else:
+        return None, 0.
+    ink, gray = np.ascontiguousarray(np.rot90(ink, k)), np.ascontiguousarray(np.rot90(gray, k))
+    if skew:
+        h, w = ink.shape
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), skew, 1.)
+        ink = cv2.warpAffine(ink, M, (w, h), flags=cv2.INTER_NEAREST)
+        gray = cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+    upside_down = -_ascender_score(ink)
+    if abs(upside_down) < threshold and use_cls:
+        upside_down = _cls_upside_down(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), ink, lang)
+    if k == 1 and abs(upside_down) < threshold:
+        return None, 0.  # 无法区分90与270时保持不变
+    correction = 270 * k  # np.rot90逆时针90度 = 顺时针270度
+    if upside_down >= threshold:
+        correction += 180
+    return (page.rotation + correction) % 360, skew
+
+def detect_orientation(page: fitz.Page, dpi: int = 100, deskew: bool = False, max_skew: float = 5., use_cls: bool = False, lang: str = 'ch') -> dict:
+    """判断页面方向, 优先使用文本层, 没有文本层时使用低分辨率渲染
+
+    Returns:
+        dict: {'page': 页码, 'rotation': 新的/Rotate值(无法判断时为原值), 'skew': 倾斜角度, 'source': 'text'/'image'/None}
+    """
+    with stage("page", page=page.number+1):
+        rotation, skew = text_orientation(page, max_skew=max_skew)
+        source = "text"
+        if rotation is None:
+            rotation, skew = image_orientation(page, dpi, max_skew, use_cls, lang)
+            source = "image" if rotation is not None else None
+    return {'page': page.number+1, 'rotation': page.rotation if rotation is None else rotation,
+            'skew': skew if deskew else 0., 'source': source}
+
+def deskew_page(page: fitz.Page, angle: float):
+    """将页面内容绕页面中心逆时针旋转angle度(在内容流外包一层变换矩阵, 不重新栅格化)"""
+    doc = page.parent
+    rect = page.mediabox
+    cx, cy = (rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    e, f = cx - c * cx + s * cy, cy - s * cx - c * cy
+    page.wrap_contents()
+    xrefs = []
+    for data in (f"q {c:.6f} {s:.6f} {-s:.6f} {c:.6f} {e:.4f} {f:.4f} cm\n".encode(), b"\nQ"):
+        xref = doc.get_new_xref()
+        doc.update_object(xref, "<<>>")
+        doc.update_stream(xref, data)
+        xrefs.append(xref)
+    contents = " ".join(f"{v} 0 R" for v in [xrefs[0], *page.get_contents(), xrefs[1]])
+    doc.xref_set_key(page.xref, "Contents", f"[{contents}]")
+
+def _detect_chunk(src, page_indices: list, kwargs: dict) -> list:
+    doc = fitz.open(src) if isinstance(src, str) else fitz.open("pdf", src)
+    return [detect_orientation(doc[i], **kwargs) for i in page_indices]
+
+def auto_rotate_pdf(doc_path: PdfSource, page_range: str = "all", deskew: bool = False, max_skew: float = 5., min_skew: float = 0.2,
+                    dpi: int = 100, use_cls: bool = False, lang: str = 'ch', workers: int = None, output_path: str = None):
+    """自动判断每页方向并设置/Rotate, 可选纠正小角度倾斜, 不对页面重新栅格化
+
+    有文本层的页面根据文本行方向判断; 扫描页低分辨率灰度渲染后用投影法判断横竖,
+    用上伸/下伸部墨迹分布(或paddleocr方向分类模型)判断是否倒置. 多进程并行分析页面.
+
+    Args:
+        deskew (bool, optional): 是否纠正倾斜. Defaults to False.
+        max_skew (float, optional): 纠正的最大倾斜角度. Defaults to 5..
+        min_skew (float, optional): 小于该角度的倾斜不纠正. Defaults to 0.2.
+        dpi (int, optional): 扫描页分析时的渲染分辨率. Defaults to 100.
+        use_cls (bool, optional): 投影法无法判断是否倒置时使用方向分类模型. Defaults to False.
+        workers (int, optional): 进程数. Defaults to None(cpu核数).
+    """
+    doc: fitz.Document = open_pdf(doc_path)
+    if page_range == "all":
+        roi_indices = list(range(len(doc)))
+    else:
+        roi_indices = parse_range(page_range)
+    kwargs = {"dpi": dpi, "deskew": deskew, "max_skew": max_skew, "use_cls": use_cls, "lang": lang}
+    workers = min(workers or os.cpu_count() or 1, max(len(roi_indices) // 8, 1))
+    if workers <= 1:
+        results = [detect_orientation(doc[i], **kwargs) for i in tqdm(roi_indices)]
+    else:
+        src = str(doc_path) if is_path(doc_path) else doc.tobytes()
+        chunks = [roi_indices[i::workers*4] for i in range(workers*4)]
+        results = []
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_detect_chunk, src, chunk, kwargs) for chunk in chunks if chunk]
+            for future in tqdm(futures):
+                results.extend(future.result())
+
+    rotated = skewed = undecided = 0
+    for res in results:
+        page = doc[res['page']-1]
+        if res['source'] is None:
+            undecided += 1
+        if res['rotation'] != page.rotation:
+            page.set_rotation(res['rotation'])
+            rotated += 1
+        if deskew and abs(res['skew']) >= min_skew:
+            deskew_page(page, res['skew'])
+            skewed += 1
+    logger.info(f"rotated: {rotated}, deskewed: {skewed}, undecided: {undecided}, total: {len(results)}")
+    return save_pdf(doc, doc_path, output_path, "-rotated")
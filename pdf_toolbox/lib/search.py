@@ -0,0 +1,180 @@
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import List
+
+import fitz
+from loguru import logger
+from tqdm import tqdm
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id         INTEGER PRIMARY KEY,
+    path       TEXT UNIQUE NOT NULL,
+    size       INTEGER,
+    mtime      REAL,
+    hash       TEXT,
+    page_count INTEGER,
+    indexed_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(text, doc_id UNINDEXED, page UNINDEXED, tokenize='{tokenize}');
+"""
+# pages的rowid = doc_id * PAGE_STRIDE + 页码, 每个文档的页面占据一段连续的rowid,
+# 按rowid范围删除可以直接定位, 而按UNINDEXED列doc_id过滤需要扫描整个索引
+PAGE_STRIDE = 1 << 24
+
+
+def connect_index(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # trigram分词支持中文等无空格语言的子串检索(需sqlite>=3.34), 否则退回unicode61
+    tokenize = "trigram" if sqlite3.sqlite_version_info >= (3, 34, 0) else "unicode61"
+    conn.executescript(SCHEMA.format(tokenize=tokenize))
+    return conn
+
+def open_index(db_path: str) -> sqlite3.Connection:
+    """以只读方式打开已有索引, 不存在或不是索引文件时报错"""
+    if not os.path.isfile(db_path):
+        raise ValueError(f"索引文件不存在: {db_path}, 请先使用index命令建立索引!")
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        conn.execute("SELECT 1 FROM documents JOIN pages LIMIT 1")
+    except sqlite3.DatabaseError:
+        conn.close()
+        raise ValueError(f"不是有效的索引文件: {db_path}!")
+    return conn
+
+def _delete_pages(conn: sqlite3.Connection, doc_id: int):
+    conn.execute("DELETE FROM pages WHERE rowid BETWEEN ? AND ?", (doc_id * PAGE_STRIDE, (doc_id + 1) * PAGE_STRIDE - 1))
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _page_texts(doc_path: str, use_ocr: bool = False, lang: str = 'ch', min_chars: int = 10) -> List[str]:
+    """获取每页文本: 优先使用文本层, 其次使用已有的ocr结果(ocr命令的默认输出目录), 最后按需实时ocr"""
+    doc: fitz.Document = fitz.open(doc_path)
+    p = Path(doc_path)
+    ocr_dir = p.parent / f"{p.stem}_ocr_result"
+    texts = []
+    for page in doc:
+        text = page.get_text()
+        if len(text.strip()) < min_chars:
+            cached = ocr_dir / f"page-{page.number+1}-ocr.txt"
+            if cached.exists():
+                text = cached.read_text(encoding="utf-8")
+            elif use_ocr:
+                from pdf_toolbox.lib.ocr import format_ocr_result, ocr_image
+                from pdf_toolbox.utils import render_page
+                text = format_ocr_result(ocr_image(render_page(page), lang))
+        texts.append(text)
+    return texts
+
+def build_index(input_paths: List[str], db_path: str = "pdf_index.db", use_ocr: bool = False, lang: str = 'ch', prune: bool = True):
+    """建立/增量更新页面级全文索引
+
+    文件大小和修改时间未变的直接跳过; 变化的再计算内容哈希, 哈希未变的只更新元数据, 否则重新提取文本
+
+    Args:
+        input_paths (List[str]): pdf文件或目录(递归查找*.pdf)
+        db_path (str, optional): 索引数据库路径. Defaults to "pdf_index.db".
+        use_ocr (bool, optional): 无文本层且无已有ocr结果的页面是否实时ocr. Defaults to False.
+        lang (str, optional): ocr语言. Defaults to 'ch'.
+        prune (bool, optional): 是否删除输入目录下已不存在的文件的索引. Defaults to True.
+    """
+    conn = connect_index(db_path)
+    path_list = []
+    for input_path in input_paths:
+        if os.path.isdir(input_path):
+            path_list.extend(glob.glob(os.path.join(input_path, "**", "*.pdf"), recursive=True))
+        else:
+            path_list.append(input_path)
+    path_list = sorted(set(os.path.abspath(v) for v in path_list))
+
+    stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    for path in tqdm(path_list):
+        try:
+            st = os.stat(path)
+            row = conn.execute("SELECT id, size, mtime, hash FROM documents WHERE path = ?", (path,)).fetchone()
+            if row is not None and row[1] == st.st_size and row[2] == st.st_mtime:
+                stats["unchanged"] += 1
+                continue
+            digest = file_hash(path)
+            if row is not None and row[3] == digest:
+                with conn:
+                    conn.execute("UPDATE documents SET size = ?, mtime = ? WHERE id = ?", (st.st_size, st.st_mtime, row[0]))
+                stats["unchanged"] += 1
+                continue
+            texts = _page_texts(path, use_ocr, lang)
+        except Exception as e:
+            # 扫描过程中文件被删除/移动或无法解析时跳过该文件, 不中断整个索引过程
+            logger.error(f"{path}: {e}")
+            stats["failed"] += 1
+            continue
+        if len(texts) >= PAGE_STRIDE:
+            logger.error(f"{path}: 页数超过{PAGE_STRIDE - 1}, 跳过")
+            stats["failed"] += 1
+            continue
+        with conn:
+            if row is not None:
+                doc_id = row[0]
+                _delete_pages(conn, doc_id)
+                conn.execute("UPDATE documents SET size = ?, mtime = ?, hash = ?, page_count = ?, indexed_at = ? WHERE id = ?",
+                             (st.st_size, st.st_mtime, digest, len(texts), time.time(), doc_id))
+                stats["updated"] += 1
+            else:
+                cur = conn.execute("INSERT INTO documents (path, size, mtime, hash, page_count, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                   (path, st.st_size, st.st_mtime, digest, len(texts), time.time()))
+                doc_id = cur.lastrowid
+                stats["added"] += 1
+            conn.executemany("INSERT INTO pages (rowid, text, doc_id, page) VALUES (?, ?, ?, ?)",
+                             [(doc_id * PAGE_STRIDE + i + 1, text, doc_id, i+1) for i, text in enumerate(texts)])
+
+    if prune:
+        seen = set(path_list)
+        roots = [os.path.abspath(v) for v in input_paths if os.path.isdir(v)]
+        for doc_id, path in conn.execute("SELECT id, path FROM documents").fetchall():
+            if path not in seen and any(path.startswith(root + os.sep) for root in roots) and not os.path.exists(path):
+                with conn:
+                    _delete_pages(conn, doc_id)
+                    conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+                stats["removed"] += 1
+    conn.close()
+    logger.info(", ".join(f"{k}: {v}" for k, v in stats.items()))
+    return stats
+
+def _make_snippet(text: str, query: str, width: int = 30) -> str:
+    idx = text.lower().find(query.lower())
+    start, end = max(0, idx - width), min(len(text), idx + len(query) + width)
+    snippet = text[start:idx] + f"[{text[idx:idx+len(query)]}]" + text[idx+len(query):end]
+    return ("..." if start > 0 else "") + snippet.replace("\n", " ") + ("..." if end < len(text) else "")
+
+def search_index(query: str, db_path: str = "pdf_index.db", limit: int = 20, raw: bool = False) -> list:
+    """检索索引, 返回[(文件路径, 页码, 摘要), ...], 按相关度排序
+
+    Args:
+        query (str): 检索词, 默认按短语匹配
+        raw (bool, optional): 是否直接使用fts5查询语法(AND/OR/NEAR等). Defaults to False.
+    """
+    conn = open_index(db_path)
+    if not raw and len(query) < 3:
+        # trigram分词无法匹配少于3个字符的检索词, 退化为LIKE扫描
+        rows = conn.execute(
+            "SELECT d.path, p.page, p.text FROM pages p JOIN documents d ON d.id = p.doc_id WHERE p.text LIKE ? LIMIT ?",
+            (f"%{query}%", limit)).fetchall()
+        results = [(path, page, _make_snippet(text, query)) for path, page, text in rows]
+    else:
+        match = query if raw else '"' + query.replace('"', '""') + '"'
+        rows = conn.execute(
+            "SELECT d.path, pages.page, snippet(pages, 0, '[', ']', '...', 64) FROM pages JOIN documents d ON d.id = pages.doc_id "
+            "WHERE pages MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit)).fetchall()
+        results = [(path, page, snippet.replace("\n", " ")) for path, page, snippet in rows]
+    conn.close()
+    return results
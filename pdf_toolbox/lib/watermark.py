@@ -1,16 +1,17 @@
 # partial adapted from: https://github.com/2Dou/watermarker/blob/master/marker.py
+import io
 import math
-import shutil
 from itertools import product
 from pathlib import Path
 from typing import Tuple, Union
 
 import fitz
-import matplotlib.pyplot as plt
 import numpy as np
 from PIL import Image, ImageChops, ImageDraw, ImageEnhance, ImageFont, ImageOps
 
-from pdf_toolbox.lib.convert import convert_images_to_pdf
+from pdf_toolbox.utils import PdfSource, is_path, open_pdf, save_pdf
+from pdf_toolbox.utils.memory import MemoryBudget, flush_pdf
+from pdf_toolbox.utils.profiler import stage
 
 fontpath = str((Path(__file__).parent.parent / "assets" / "SIMKAI.TTF").absolute())
 
@@ -132,30 +133,26 @@ def add_mark_to_image(img_path, mark_text: str, quality: int = 80, output_path:
         output_path = p.parent / f"{p.stem}-watermarked{p.suffix}"
     image.save(output_path, quality=quality)
 
-def add_mark_to_pdf(doc_path: str, mark_text: str, quality: int = 80, output_path: str = None, **mark_args):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
-    tmp_dir = p.parent / 'tmp'
-    tmp_dir.mkdir(parents=True, exist_ok=True)
+def add_mark_to_pdf(doc_path: PdfSource, mark_text: str, quality: int = 80, output_path: str = None, **mark_args):
+    doc: fitz.Document = open_pdf(doc_path)
     page = doc.load_page(0)
 
-    blank = np.ones((int(page.rect[3]), int(page.rect[2]), 3))
-    blank_savepath = tmp_dir / "blank.png"
-    plt.imsave(blank_savepath, blank)
-    mark_savepath = tmp_dir / "watermark.png"
-    add_mark_to_image(blank_savepath, mark_text, quality=quality, output_path=mark_savepath, **mark_args)
+    # 在与首页同尺寸的白色图片上生成水印, 直接在内存中编码后插入
+    blank = Image.new("RGBA", (int(page.rect[2]), int(page.rect[3])), (255, 255, 255, 255))
+    mark_func = gen_mark(mark_text, **mark_args)
+    buffer = io.BytesIO()
+    mark_func(blank).save(buffer, format="png", quality=quality)
+    mark_stream = buffer.getvalue()
 
     for page_index in range(doc.page_count):
         page = doc[page_index]
-        page.insert_image(
-            page.rect,                  # where to place the image (rect-like)
-            filename=mark_savepath,     # image in a file
-            overlay=False,          # put in foreground
-        )
-    if output_path is None:
-        p = Path(doc_path)
-        output_path = p.parent / f"{p.stem}-watermarked{p.suffix}"
-    doc.save(output_path)
+        with stage("insert_image", page=page_index+1):
+            page.insert_image(
+                page.rect,                  # where to place the image (rect-like)
+                stream=mark_stream,         # image in memory
+                overlay=False,          # put in foreground
+            )
+    return save_pdf(doc, doc_path, output_path, "-watermarked")
 
 def color_to_rgb(color):
     import re
@@ -194,25 +191,37 @@ def remove_mark_from_image(img_path: str, water_mark_color: Union[str, Tuple[int
         output_path = p.parent / f"{p.stem}-remove-watermark{p.suffix}"
     img.save(output_path, quality=100, dpi=(1800,1800))
 
-def remove_mark_from_pdf(doc_path: str, water_mark_color: Union[str, Tuple[int, int, int], Tuple[int, int, int, float]], output_path: str = None):
-    doc: fitz.Document = fitz.open(doc_path)
-    p = Path(doc_path)
+def remove_mark_from_pdf(doc_path: PdfSource, water_mark_color: Union[str, Tuple[int, int, int], Tuple[int, int, int, float]], output_path: str = None, max_memory: float = None, window: int = 50):
+    """去除水印, 输出到文件时每window页(或超出内存预算max_memory(MB)时)将已处理页面写入磁盘, 内存占用与总页数无关"""
+    doc: fitz.Document = open_pdf(doc_path)
     threshold = sum(np.array(color_to_rgb(water_mark_color))*255)
-    tmp_dir = p.parent / 'tmp'
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    for page_index in range(doc.page_count):
-        page = doc[page_index]
-        pix = page.get_pixmap()
-        #遍历图片中的宽和高，如果像素的rgb值总和大于510，就认为是水印，转换成255，255,255-->即白色
-        for pos in product(range(pix.width), range(pix.height)):
-            if sum(pix.pixel(pos[0], pos[1])) >= threshold:
-                pix.set_pixel(pos[0], pos[1], (255, 255, 255))
-        savepath = tmp_dir / f"{page.number+1}.png"
-        pix.pil_save(savepath, quality=100, dpi=(page.rect[3], page.rect[2]))
-
-    if output_path is None:
+    if output_path is None and is_path(doc_path):
         p = Path(doc_path)
-        output_path = p.parent / f"{p.stem}-remove-watermark{p.suffix}"
-    convert_images_to_pdf(tmp_dir, ['png'], output_path)
-    shutil.rmtree(tmp_dir)
+        output_path = str(p.parent / f"{p.stem}-remove-watermark.pdf")
+    budget = MemoryBudget(max_memory)
+    out: fitz.Document = fitz.open()
+    flushed = False
+    for page_index in range(doc.page_count):
+        with stage("page", page=page_index+1):
+            page = doc[page_index]
+            with stage("get_pixmap"):
+                pix = page.get_pixmap()
+            #遍历图片中的宽和高，如果像素的rgb值总和大于510，就认为是水印，转换成255，255,255-->即白色
+            with stage("remove_pixels"):
+                for pos in product(range(pix.width), range(pix.height)):
+                    if sum(pix.pixel(pos[0], pos[1])) >= threshold:
+                        pix.set_pixel(pos[0], pos[1], (255, 255, 255))
+            # 处理后的图片直接作为新页面插入, 保持原页面尺寸
+            with stage("insert_image"):
+                new_page = out.new_page(width=page.rect.width, height=page.rect.height)
+                new_page.insert_image(new_page.rect, stream=pix.tobytes("png"))
+            pix = page = new_page = None
+        if output_path is not None and ((page_index+1) % window == 0 or budget.check()):
+            out = flush_pdf(out, output_path, flushed)
+            flushed = True
+
+    if flushed:
+        out.save(output_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+        return output_path
+    return save_pdf(out, doc_path, output_path, "-remove-watermark", garbage=3, deflate=True)
 
@@ -0,0 +1,353 @@
+"""常驻服务模式: 通过本地HTTP或Unix socket接口调用lib中的操作, 模型在工作进程中预加载并常驻内存
+
+接口:
+    POST /jobs          提交任务, body: {"op": "merge", "args": {...}}, 返回 {"id": ...}
+    GET  /jobs/<id>     查询任务状态及结果
+    GET  /health        健康检查
+    GET  /metrics       队列长度、吞吐量、延迟分位数等指标
+"""
+import http.server
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+from loguru import logger
+
+from pdf_toolbox.lib.basic import delete_pdf, insert_pdf, merge_pdf, rotate_pdf, slice_pdf, split_pdf
+from pdf_toolbox.lib.bookmark import (add_toc_from_contents, add_toc_from_file, add_toc_from_fonts, add_toc_from_ocr,
+                                      extract_toc, transform_toc_file)
+from pdf_toolbox.lib.compress import compress_pdf
+from pdf_toolbox.lib.convert import convert_images_to_pdf, convert_pdf_to_images
+from pdf_toolbox.lib.diff import diff_pdf
+from pdf_toolbox.lib.encrypt import decrypt_pdf, encrypt_pdf
+from pdf_toolbox.lib.extract import debug_item_from_pdf, extract_item_from_pdf, extract_tables_from_pdf, extract_text_from_pdf
+from pdf_toolbox.lib.header_footer import extract_headers_footers, redact_headers_footers
+from pdf_toolbox.lib.ocr import ocr_forms, ocr_from_image, ocr_from_pdf, ocr_zones
+from pdf_toolbox.lib.orientation import auto_rotate_pdf
+from pdf_toolbox.lib.watermark import add_mark_to_image, add_mark_to_pdf, remove_mark_from_image, remove_mark_from_pdf
+from pdf_toolbox.utils.models import warmup_engines
+
+# 操作名称 -> lib函数, 任务参数(args)以关键字参数形式传入
+OPERATIONS = {
+    "merge": merge_pdf,
+    "split": split_pdf,
+    "slice": slice_pdf,
+    "insert": insert_pdf,
+    "remove": delete_pdf,
+    "rotate": rotate_pdf,
+    "auto_rotate": auto_rotate_pdf,
+    "encrypt": encrypt_pdf,
+    "decrypt": decrypt_pdf,
+    "compress": compress_pdf,
+    "diff": diff_pdf,
+    "bookmark_add_ocr": add_toc_from_ocr,
+    "bookmark_add_file": add_toc_from_file,
+    "bookmark_add_fonts": add_toc_from_fonts,
+    "bookmark_add_contents": add_toc_from_contents,
+    "bookmark_extract": extract_toc,
+    "bookmark_clean": transform_toc_file,
+    "watermark_add_pdf": add_mark_to_pdf,
+    "watermark_add_image": add_mark_to_image,
+    "watermark_remove_pdf": remove_mark_from_pdf,
+    "watermark_remove_image": remove_mark_from_image,
+    "extract_item": extract_item_from_pdf,
+    "extract_text": extract_text_from_pdf,
+    "extract_tables": extract_tables_from_pdf,
+    "extract_headers": extract_headers_footers,
+    "redact_headers": redact_headers_footers,
+    "debug": debug_item_from_pdf,
+    "pdf_to_images": convert_pdf_to_images,
+    "images_to_pdf": convert_images_to_pdf,
+    "ocr_image": ocr_from_image,
+    "ocr_pdf": ocr_from_pdf,
+    "ocr_zones": ocr_zones,
+    "ocr_forms": ocr_forms,
+}
+
+
+def summarize_result(result, max_size: int = 1 << 20):
+    """将任务结果转换为可json序列化的小对象后保存, 不持有bytes/Document等大对象
+
+    bytes和Document只保留大小/页数(需要内容时在args中指定output_path), 序列化后超过max_size的结果只保留大小
+    """
+    def convert(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {"type": "bytes", "size": len(value)}
+        if isinstance(value, fitz.Document):
+            return {"type": "document", "pages": value.page_count}
+        if isinstance(value, dict):
+            return {str(k): convert(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [convert(v) for v in value]
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return str(value)
+
+    result = convert(result)
+    size = len(json.dumps(result, ensure_ascii=False))
+    if size > max_size:
+        return {"type": "truncated", "size": size}
+    return result
+
+
+def _preload(langs: list, structure: bool) -> int:
+    # 在工作进程中加载模型并各运行一次推理, 避免首个任务承担初始化开销; 引擎缓存在该进程中常驻
+    warmup_engines(langs, structure)
+    return os.getpid()
+
+def _run_op(op: str, args: dict):
+    # 在工作进程中执行, 结果在子进程内转换为小对象后再传回(Document不能跨进程传递)
+    return summarize_result(OPERATIONS[op](**args))
+
+
+class JobManager:
+    """有界任务队列 + 固定数量的工作进程, 每个工作进程持有自己的预加载模型
+
+    PyMuPDF不支持在同一进程的多个线程中并发使用, 因此任务在独立的工作进程中执行(每个进程同一时间只执行一个任务),
+    主进程中每个工作进程对应一个调度线程, 只负责取任务、等待结果和记录状态. 工作进程崩溃时只有当前任务失败,
+    调度线程会重新启动该进程并重新预加载模型.
+    """
+
+    def __init__(self, concurrency: int = 1, queue_size: int = 100, preload_langs: list = None,
+                 preload_structure: bool = False, max_finished: int = 10000, window: int = 1000, rate_window: float = 60.):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_finished = max_finished
+        self.latencies = deque(maxlen=window)   # 最近完成任务的耗时
+        self.rate_window = rate_window
+        self.finish_times = deque()             # 最近rate_window秒内完成任务的时间, 按时间而不是数量裁剪
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self.running = 0
+        self.start_time = time.time()
+        self.accepting = True
+        self.preload_langs = preload_langs or []
+        self.preload_structure = preload_structure
+        # spawn启动的子进程不继承主进程中的线程和PyMuPDF状态
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.executors = [self._start_process() for _ in range(concurrency)]
+        try:
+            # 各进程并行预加载, 任一失败则启动失败, 而不是在没有模型的情况下继续服务
+            for future in [executor.submit(_preload, self.preload_langs, self.preload_structure) for executor in self.executors]:
+                future.result()
+        except Exception as e:
+            logger.error(f"preload failed:\n{traceback.format_exc()}")
+            self.accepting = False
+            for executor in self.executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise RuntimeError(f"模型预加载失败: {type(e).__name__}: {e}")
+        self.workers = [threading.Thread(target=self._worker, args=(i,), name=f"worker-{i}", daemon=True) for i in range(concurrency)]
+        for worker in self.workers:
+            worker.start()
+
+    def _start_process(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(1, mp_context=self.mp_context)
+
+    def _worker(self, index: int):
+        while True:
+            job_id = self.queue.get()
+            if job_id is None:
+                break
+            with self.lock:
+                job = self.jobs[job_id]
+                self.running += 1
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            try:
+                result = self.executors[index].submit(_run_op, job["op"], job["args"]).result()
+                update = {"status": "done", "result": result}
+            except BrokenProcessPool as e:
+                update = {"status": "failed", "error": f"worker process crashed: {e}"}
+                logger.error(f"job {job_id}: worker process crashed, restarting")
+                self._restart(index)
+            except Exception as e:
+                update = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                logger.error(f"job {job_id} failed:\n{traceback.format_exc()}")
+            with self.lock:
+                job.update(update, finished_at=time.time())
+                self.running -= 1
+                self.counts["completed" if job["status"] == "done" else "failed"] += 1
+                self.latencies.append(job["finished_at"] - job["submitted_at"])
+                self.finish_times.append(job["finished_at"])
+                self._prune_rate(job["finished_at"])
+            self.queue.task_done()
+        self.executors[index].shutdown(wait=True)
+
+    def _restart(self, index: int):
+        self.executors[index].shutdown(wait=False, cancel_futures=True)
+        self.executors[index] = self._start_process()
+        try:
+            self.executors[index].submit(_preload, self.preload_langs, self.preload_structure).result()
+        except Exception:
+            logger.error(f"preload failed after restart:\n{traceback.format_exc()}")
+
+    def _prune_rate(self, now: float):
+        while self.finish_times and now - self.finish_times[0] > self.rate_window:
+            self.finish_times.popleft()
+
+    def submit(self, op: str, args: dict) -> str:
+        if op not in OPERATIONS:
+            raise ValueError(f"不支持的操作: {op}")
+        if not self.accepting:
+            raise RuntimeError("服务正在关闭")
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {"id": job_id, "op": op, "args": args, "status": "queued", "submitted_at": time.time()}
+            self._prune()
+        try:
+            self.queue.put_nowait(job_id)
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job_id]
+                self.counts["rejected"] += 1
+            raise
+        with self.lock:
+            self.counts["submitted"] += 1
+        return job_id
+
+    def _prune(self):
+        # 只保留最近max_finished个已结束的任务记录
+        finished = [k for k, v in self.jobs.items() if v["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> dict:
+        """返回任务状态的快照(在锁内复制), 调度线程之后的修改不影响返回值"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def metrics(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            now = time.time()
+            self._prune_rate(now)
+            res = {
+                "queue_depth": self.queue.qsize(),
+                "running": self.running,
+                "workers": len(self.workers),
+                "uptime": now - self.start_time,
+                "jobs_per_sec": len(self.finish_times) / min(self.rate_window, max(now - self.start_time, 1e-6)),
+                **self.counts,
+            }
+        for name, q in (("p50", 0.5), ("p99", 0.99)):
+            res[f"latency_{name}"] = latencies[min(len(latencies)-1, int(q * len(latencies)))] if latencies else None
+        return res
+
+    def shutdown(self, wait: bool = True):
+        """停止接收新任务, 等待已排队和运行中的任务完成后退出工作进程"""
+        self.accepting = False
+        if wait:
+            self.queue.join()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    manager: JobManager = None
+
+    def _send_json(self, code: int, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok" if self.manager.accepting else "shutting_down"})
+        elif self.path == "/metrics":
+            self._send_json(200, self.manager.metrics())
+        elif self.path.startswith("/jobs/"):
+            job = self.manager.get(self.path[len("/jobs/"):])
+            if job is None:
+                self._send_json(404, {"error": "job not found"})
+            else:
+                self._send_json(200, job)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length) or b"{}")
+            job_id = self.manager.submit(data.get("op"), data.get("args", {}))
+        except queue.Full:
+            self._send_json(503, {"error": "queue full"})
+        except RuntimeError as e:
+            self._send_json(503, {"error": str(e)})
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+        else:
+            self._send_json(202, {"id": job_id})
+
+    def address_string(self):
+        # unix socket的client_address为空字符串
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None, concurrency: int = 1,
+          queue_size: int = 100, preload_langs: list = None, preload_structure: bool = False):
+    """启动常驻服务, 收到SIGINT/SIGTERM后停止接收新任务, 处理完队列中的任务再退出
+
+    Args:
+        host (str, optional): 监听地址. Defaults to "127.0.0.1".
+        port (int, optional): 监听端口. Defaults to 8765.
+        unix_socket (str, optional): 指定后改为监听该unix socket路径. Defaults to None.
+        concurrency (int, optional): 工作进程数(PyMuPDF不支持多线程并发, 每个进程同一时间执行一个任务). Defaults to 1.
+        queue_size (int, optional): 最大排队任务数, 队列满时返回503. Defaults to 100.
+        preload_langs (list, optional): 预加载ocr模型的语言列表. Defaults to None.
+        preload_structure (bool, optional): 是否预加载版面分析模型. Defaults to False.
+    """
+    logger.info(f"starting {concurrency} workers, preloading models: {preload_langs or []}{' + layout' if preload_structure else ''}")
+    manager = JobManager(concurrency, queue_size, preload_langs, preload_structure)
+    handler = type("Handler", (RequestHandler,), {"manager": manager})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, handler)
+        logger.info(f"listening on unix:{unix_socket}")
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), handler)
+        logger.info(f"listening on http://{host}:{server.server_address[1]}")
+
+    def handle_signal(signum, frame):
+        logger.info("shutting down, waiting for queued jobs...")
+        manager.accepting = False
+        # shutdown()会阻塞到serve_forever退出, 不能在主线程的信号处理函数中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        manager.shutdown()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        logger.info("server stopped")
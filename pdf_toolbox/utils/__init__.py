@@ -1,14 +1,131 @@
+import threading
+from pathlib import Path
+from typing import BinaryIO, Union
+
 import cv2
-from paddleocr import PPStructure
+import fitz
+import numpy as np
+from paddleocr import PaddleOCR, PPStructure
+
+from .inference import get_inference_config
+from .models import ensure_models
+from .profiler import stage
+
+# 模型加载较慢, 按线程缓存引擎(paddle推理引擎非线程安全), 同一线程内重复调用时复用
+_local = threading.local()
+
+
+def _engine_cache() -> dict:
+    if not hasattr(_local, "engines"):
+        _local.engines = {}
+    return _local.engines
+
+def get_ocr_engine(lang: str = 'ch', show_log: bool = False) -> PaddleOCR:
+    cache = _engine_cache()
+    config = get_inference_config()
+    key = ("ocr", lang, show_log, config.key())
+    if key not in cache:
+        ensure_models([lang])
+        with stage("PaddleOCR.init"):
+            cache[key] = PaddleOCR(use_angle_cls=True, lang=lang, show_log=show_log, **config.ocr_kwargs(lang)) # need to run only once to download and load model into memory
+    return cache[key]
+
+def get_structure_engine() -> PPStructure:
+    cache = _engine_cache()
+    config = get_inference_config()
+    key = ("structure", config.key())
+    if key not in cache:
+        ensure_models(structure=True)
+        with stage("PPStructure.init"):
+            cache[key] = PPStructure(table=False, ocr=False, show_log=False, **config.structure_kwargs())
+    return cache[key]
+
+def get_table_engine(lang: str = 'ch') -> PPStructure:
+    """表格识别引擎(不做版面分析), 输入为裁剪好的表格区域, 输出[{"type": "table", "res": {"html": ..., "cell_bbox": [...]}}]
+
+    单元格文本由引擎内部按lang对应的检测/识别模型ocr得到, 只需要结构时使用table_structure
+    """
+    cache = _engine_cache()
+    config = get_inference_config()
+    key = ("table", lang, config.key())
+    if key not in cache:
+        ensure_models([lang], structure=True)
+        with stage("PPStructure.init"):
+            cache[key] = PPStructure(layout=False, table=True, ocr=False, lang=lang, show_log=False, **config.structure_kwargs(lang))
+    return cache[key]
 
+def table_structure(img: np.ndarray, lang: str = 'ch') -> tuple:
+    """只运行表格结构识别模型(不做文本检测和识别), 返回(html标记序列, 单元格框)"""
+    structurer = getattr(getattr(get_table_engine(lang), "table_system", None), "table_structurer", None)
+    if structurer is None:
+        raise ImportError("当前paddleocr版本的PPStructure没有table_system.table_structurer, 请使用2.6~2.x版本!")
+    (tokens, boxes), _ = structurer(img)
+    return tokens, boxes
 
-def ppstructure_analysis(input_path: str):
-    img = cv2.imread(input_path)
-    structure_engine = PPStructure(table=False, ocr=False, show_log=False)
-    result = structure_engine(img)
+def ppstructure_analysis(input_path: Union[str, np.ndarray]):
+    """版面分析, 输入为图片路径或BGR格式的图片数组"""
+    img = imread(input_path)
+    structure_engine = get_structure_engine()
+    with stage("PPStructure"):
+        result = structure_engine(img)
     return result
 
 
+def imread(input_path: Union[str, np.ndarray]) -> np.ndarray:
+    if isinstance(input_path, np.ndarray):
+        return input_path
+    with stage("cv2.imread"):
+        return cv2.imread(str(input_path))
+
+def render_page(page: fitz.Page, **kwargs) -> np.ndarray:
+    """将页面渲染为BGR格式的图片数组(与cv2.imread读取的png一致), 无需落盘"""
+    with stage("get_pixmap"):
+        pix: fitz.Pixmap = page.get_pixmap(**kwargs)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR if pix.alpha else cv2.COLOR_RGB2BGR)
+
+
+# pdf输入: 文件路径、bytes、文件对象或已打开的fitz.Document
+PdfSource = Union[str, Path, bytes, BinaryIO, fitz.Document]
+
+def is_path(src: PdfSource) -> bool:
+    return isinstance(src, (str, Path))
+
+def open_pdf(src: PdfSource) -> fitz.Document:
+    """打开pdf, 已打开的fitz.Document原样返回(不复制, 后续操作会直接修改该文档, 见save_pdf)"""
+    if isinstance(src, fitz.Document):
+        return src
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(src), filetype="pdf")
+    if hasattr(src, "read"):
+        return fitz.open(stream=src.read(), filetype="pdf")
+    return fitz.open(src)
+
+def save_pdf(doc: fitz.Document, src: PdfSource, output_path: str = None, suffix: str = "", **save_args):
+    """保存处理结果, lib中所有生成pdf的操作都遵循同一约定, 返回值类型只取决于输入类型和是否指定output_path:
+
+    - 指定了output_path, 或输入为文件路径(默认保存到输入文件旁边, 文件名加suffix)时写入文件, 返回保存路径(str)
+    - 否则不产生任何文件:
+        - 输入为fitz.Document时返回结果fitz.Document. 输入文档会被原地修改(通常返回的就是它本身),
+          需要保留原文档时请传入副本或doc.tobytes(). 加密只在序列化时生效, 此时必须指定output_path
+        - 输入为bytes或文件对象时返回bytes, 不修改调用方的数据
+    - 生成多个pdf的操作(split/slice -m)按同样规则返回列表
+    """
+    if output_path is None and is_path(src):
+        p = Path(src)
+        output_path = str(p.parent / f"{p.stem}{suffix}.pdf")
+    if output_path is not None:
+        doc.save(output_path, **save_args)
+        return output_path
+    if isinstance(src, fitz.Document):
+        if "encryption" in save_args:
+            raise ValueError("加密只在保存时生效, 输入为fitz.Document时请指定output_path, 或传入doc.tobytes()!")
+        return doc
+    return doc.tobytes(**save_args)
+
+
 def parse_range(page_range: str, is_multiple: bool = False):
     # e.g.: "1-3,5-6,7-10", "1,4-5"
     page_range = page_range.strip()
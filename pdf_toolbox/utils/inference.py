@@ -0,0 +1,161 @@
+"""推理配置: 后端、cpu线程数、MKL-DNN、模型目录、精度, 所有ocr/版面分析引擎的构造都经过这里
+
+优先级: 命令行参数 > 环境变量 > 默认值
+    PDF_TOOLBOX_BACKEND      paddle/onnx
+    PDF_TOOLBOX_CPU_THREADS  cpu线程数
+    PDF_TOOLBOX_MKLDNN       1/0
+    PDF_TOOLBOX_MODEL_DIR    模型目录, 目录结构与~/.paddleocr相同
+    PDF_TOOLBOX_PRECISION    fp32/fp16/int8
+"""
+import importlib
+import os
+import re
+
+BACKENDS = ("paddle", "onnx")
+PRECISIONS = ("fp32", "fp16", "int8")
+# 模型目录功能使用paddleocr.paddleocr模块中的get_model_config/parse_lang/maybe_download, 它们不是公开接口,
+# 只在验证过的版本范围[最低, 最高)内使用
+PADDLEOCR_VERSIONS = ((2, 6), (3, 0))
+
+ENV_VARS = {
+    "backend": "PDF_TOOLBOX_BACKEND",
+    "cpu_threads": "PDF_TOOLBOX_CPU_THREADS",
+    "enable_mkldnn": "PDF_TOOLBOX_MKLDNN",
+    "model_dir": "PDF_TOOLBOX_MODEL_DIR",
+    "precision": "PDF_TOOLBOX_PRECISION",
+}
+
+
+class InferenceConfig:
+    """推理配置
+
+    Args:
+        backend (str, optional): 推理后端, paddle或onnx(onnxruntime, 需要模型目录下有model.onnx). Defaults to "paddle".
+        cpu_threads (int, optional): cpu线程数(paddle后端仅在开启MKL-DNN时生效). Defaults to None(paddleocr默认10).
+        enable_mkldnn (bool, optional): 是否开启MKL-DNN加速. Defaults to False.
+        model_dir (str, optional): 模型目录, 目录结构与~/.paddleocr相同(whl/det/ch/..., whl/layout/...), 可放置量化/裁剪模型. Defaults to None.
+        precision (str, optional): 推理精度, fp16在cpu上对应MKL-DNN的bfloat16, int8需配合量化模型使用. Defaults to "fp32".
+    """
+
+    def __init__(self, backend: str = "paddle", cpu_threads: int = None, enable_mkldnn: bool = False, model_dir: str = None, precision: str = "fp32"):
+        if backend not in BACKENDS:
+            raise ValueError(f"不支持的推理后端: {backend}, 可选: {', '.join(BACKENDS)}!")
+        if precision not in PRECISIONS:
+            raise ValueError(f"不支持的推理精度: {precision}, 可选: {', '.join(PRECISIONS)}!")
+        if backend == "onnx" and model_dir is None:
+            raise ValueError("onnx后端需要指定模型目录!")
+        self.backend = backend
+        self.cpu_threads = cpu_threads
+        self.enable_mkldnn = enable_mkldnn
+        self.model_dir = model_dir
+        self.precision = precision
+
+    @classmethod
+    def from_env(cls, **overrides) -> "InferenceConfig":
+        """从环境变量读取配置, overrides中不为None的项优先"""
+        values = {
+            "backend": os.environ.get(ENV_VARS["backend"]) or "paddle",
+            "cpu_threads": int(os.environ[ENV_VARS["cpu_threads"]]) if os.environ.get(ENV_VARS["cpu_threads"]) else None,
+            "enable_mkldnn": os.environ.get(ENV_VARS["enable_mkldnn"], "0").lower() in ("1", "true", "yes", "on"),
+            "model_dir": os.environ.get(ENV_VARS["model_dir"]) or None,
+            "precision": os.environ.get(ENV_VARS["precision"]) or "fp32",
+        }
+        values.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**values)
+
+    def to_env(self):
+        """写入环境变量, 使子进程(进程池、基准测试等)使用相同配置"""
+        for name, env in ENV_VARS.items():
+            value = getattr(self, name)
+            if value is None:
+                os.environ.pop(env, None)
+            else:
+                os.environ[env] = str(int(value) if isinstance(value, bool) else value)
+
+    def key(self) -> tuple:
+        """用于引擎缓存, 配置变化后重新构造引擎"""
+        return (self.backend, self.cpu_threads, self.enable_mkldnn, self.model_dir, self.precision)
+
+    def __repr__(self):
+        return f"InferenceConfig(backend={self.backend!r}, cpu_threads={self.cpu_threads}, enable_mkldnn={self.enable_mkldnn}, model_dir={self.model_dir!r}, precision={self.precision!r})"
+
+    def _common_kwargs(self) -> dict:
+        kwargs = {"use_gpu": False, "enable_mkldnn": self.enable_mkldnn, "precision": self.precision,
+                  "use_onnx": self.backend == "onnx"}
+        if self.cpu_threads is not None:
+            kwargs["cpu_threads"] = self.cpu_threads
+        return kwargs
+
+    def _model_path(self, type: str, model_type: str, lang: str = None) -> str:
+        path = resolve_model_dir(self.model_dir, type, model_type, lang)
+        return os.path.join(path, "model.onnx") if self.backend == "onnx" else path
+
+    def ocr_kwargs(self, lang: str = 'ch') -> dict:
+        """PaddleOCR的构造参数"""
+        kwargs = self._common_kwargs()
+        if self.model_dir is not None:
+            lang, det_lang = paddleocr_internal().parse_lang(lang)
+            kwargs["det_model_dir"] = self._model_path("OCR", "det", det_lang)
+            kwargs["rec_model_dir"] = self._model_path("OCR", "rec", lang)
+            kwargs["cls_model_dir"] = self._model_path("OCR", "cls", "ch")
+        return kwargs
+
+    def structure_kwargs(self, lang: str = 'ch') -> dict:
+        """PPStructure的构造参数"""
+        kwargs = self._common_kwargs()
+        if self.model_dir is not None:
+            lang, det_lang = paddleocr_internal().parse_lang(lang)
+            kwargs["det_model_dir"] = self._model_path("OCR", "det", det_lang)
+            kwargs["rec_model_dir"] = self._model_path("OCR", "rec", lang)
+            kwargs["table_model_dir"] = self._model_path("STRUCTURE", "table", "ch" if lang == "ch" else "en")
+            kwargs["layout_model_dir"] = self._model_path("STRUCTURE", "layout", lang)
+        return kwargs
+
+
+def paddleocr_internal():
+    """返回paddleocr.paddleocr模块(内部接口), 版本不在PADDLEOCR_VERSIONS范围内时报错, 避免接口变化后静默得到错误的模型路径"""
+    import paddleocr
+    version = getattr(paddleocr, "__version__", "")
+    parts = tuple(int(v) for v in re.findall(r"\d+", version)[:2])
+    low, high = PADDLEOCR_VERSIONS
+    if not low <= parts < high:
+        raise ImportError(f"模型目录功能依赖paddleocr {low[0]}.{low[1]}~{high[0]-1}.x的内部接口, 当前版本: {version or '未知'}!")
+    return importlib.import_module("paddleocr.paddleocr")
+
+def get_model_url(type: str, model_type: str, lang: str = None) -> str:
+    """paddleocr中模型的下载地址, 参数同resolve_model_dir"""
+    config = paddleocr_internal().get_model_config(type, None, model_type, lang)
+    if not isinstance(config, dict) or "url" not in config:
+        raise ImportError(f"无法从paddleocr获取模型地址: {type}/{model_type}/{lang}!")
+    return config["url"]
+
+def resolve_model_dir(model_dir: str, type: str, model_type: str, lang: str = None) -> str:
+    """按paddleocr默认的缓存目录结构(~/.paddleocr/whl/...)在model_dir下定位模型目录
+
+    Args:
+        type (str): OCR或STRUCTURE
+        model_type (str): det/rec/cls/table/layout
+        lang (str, optional): det为检测语言(parse_lang的第二个返回值), 其余为识别语言. Defaults to None.
+    """
+    url = get_model_url(type, model_type, lang)
+    parts = [model_dir, "whl", model_type]
+    if model_type in ("det", "rec"):
+        parts.append(lang)
+    parts.append(url.split("/")[-1][:-4])  # 去掉.tar
+    return os.path.join(*parts)
+
+
+_config: InferenceConfig = None
+
+def get_inference_config() -> InferenceConfig:
+    global _config
+    if _config is None:
+        _config = InferenceConfig.from_env()
+    return _config
+
+def set_inference_config(config: InferenceConfig = None, **kwargs) -> InferenceConfig:
+    """设置全局推理配置, 可直接传入InferenceConfig, 或以关键字参数覆盖环境变量中的配置; 同时写入环境变量供子进程使用"""
+    global _config
+    _config = config or InferenceConfig.from_env(**kwargs)
+    _config.to_env()
+    return _config
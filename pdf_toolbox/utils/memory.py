@@ -0,0 +1,103 @@
+"""大文档逐页处理时控制内存: 内存预算检查与有界的后台写入队列
+"""
+import gc
+import os
+import queue
+import threading
+
+import fitz
+from loguru import logger
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存(MB), 无法获取时返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryBudget:
+    """每处理完一页调用check(), 超出预算时释放MuPDF缓存并触发gc
+
+    Args:
+        max_memory (float, optional): 内存预算(MB), None表示不限制(仍会每页释放MuPDF缓存). Defaults to None.
+    """
+
+    def __init__(self, max_memory: float = None):
+        self.max_memory = max_memory
+        if max_memory is not None and current_rss_mb() is None:
+            logger.warning("当前平台无法获取内存占用, --max-memory 将不生效")
+            self.max_memory = None
+
+    def release(self):
+        fitz.TOOLS.store_shrink(100)  # 清空MuPDF的对象/图片缓存
+        gc.collect()
+
+    def check(self) -> bool:
+        """返回释放缓存后是否仍超出预算"""
+        if self.max_memory is None:
+            fitz.TOOLS.store_shrink(50)
+            return False
+        if current_rss_mb() <= self.max_memory:
+            return False
+        self.release()
+        return current_rss_mb() > self.max_memory
+
+
+def flush_pdf(doc: fitz.Document, output_path: str, appended: bool = False) -> fitz.Document:
+    """将正在生成的文档写入磁盘(已写过则增量追加)后关闭并重新打开, 已写入的页面不再占用内存"""
+    if appended:
+        doc.save(output_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+    else:
+        doc.save(output_path, garbage=3, deflate=True)
+    doc.close()
+    return fitz.open(output_path)
+
+
+class BackgroundWriter:
+    """在后台线程中执行写文件等任务, 队列满时submit阻塞(背压), 避免写入跟不上时待写数据无限堆积
+
+    用法:
+        with BackgroundWriter(max_pending=2) as writer:
+            writer.submit(im.save, path)
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self.queue = queue.Queue(maxsize=max(1, max_pending))
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            func, args, kwargs = task
+            try:
+                if self.error is None:
+                    func(*args, **kwargs)
+            except Exception as e:
+                self.error = e
+            finally:
+                del task, func, args, kwargs  # 尽快释放待写数据
+
+    def submit(self, func, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((func, args, kwargs))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
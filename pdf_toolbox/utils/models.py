@@ -0,0 +1,154 @@
+"""离线模型包管理: 预下载/拷贝、校验、列出模型, 以及引擎预热
+
+模型包目录结构与paddleocr的默认缓存目录(~/.paddleocr)相同:
+    whl/det/{ch,en,ml}/<模型名>/inference.pdmodel
+    whl/rec/<语言>/<模型名>/...
+    whl/cls/<模型名>/...
+    whl/layout/<模型名>/...
+    whl/table/<模型名>/...
+    manifest.json   各文件的sha256, 由preload生成, verify时校验
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from .inference import get_inference_config, get_model_url, paddleocr_internal, resolve_model_dir
+from .profiler import stage
+
+LANGS = ['ch', 'en', 'fr', 'german', 'it', 'japan', 'korean', 'ru', 'chinese_cht']
+DEFAULT_BUNDLE_DIR = str(Path.home() / ".paddleocr")
+MANIFEST = "manifest.json"
+
+
+def bundle_dir(model_dir: str = None) -> str:
+    """模型包目录: 参数 > 推理配置中的model_dir > ~/.paddleocr"""
+    return model_dir or get_inference_config().model_dir or DEFAULT_BUNDLE_DIR
+
+def required_models(langs: list = (), structure: bool = False) -> list:
+    """列出所需模型, 返回[(名称, 类型, 模型类型, 语言), ...], 已去重
+
+    Args:
+        langs (list, optional): ocr语言, 每种语言需要检测、识别、方向分类模型. Defaults to ().
+        structure (bool, optional): 是否需要版面分析/表格模型(PPStructure构造时同时需要中文检测、识别模型). Defaults to False.
+    """
+    models = []
+    for lang in langs:
+        rec_lang, det_lang = paddleocr_internal().parse_lang(lang)
+        models += [(f"det/{det_lang}", "OCR", "det", det_lang),
+                   (f"rec/{rec_lang}", "OCR", "rec", rec_lang),
+                   ("cls", "OCR", "cls", "ch")]
+    if structure:
+        models += [("det/ch", "OCR", "det", "ch"),
+                   ("rec/ch", "OCR", "rec", "ch"),
+                   ("layout", "STRUCTURE", "layout", "ch"),
+                   ("table", "STRUCTURE", "table", "ch")]
+    return list(dict.fromkeys(models))
+
+def _model_files(path: str, backend: str = "paddle") -> list:
+    if backend == "onnx":
+        return [os.path.join(path, "model.onnx")]
+    return [os.path.join(path, "inference.pdmodel"), os.path.join(path, "inference.pdiparams")]
+
+def model_status(langs: list = (), structure: bool = False, model_dir: str = None) -> list:
+    """返回[{'name', 'path', 'exists', 'size'}, ...]"""
+    root = bundle_dir(model_dir)
+    backend = get_inference_config().backend
+    status = []
+    for name, type, model_type, lang in required_models(langs, structure):
+        path = resolve_model_dir(root, type, model_type, lang)
+        files = _model_files(path, backend)
+        exists = all(os.path.exists(v) for v in files)
+        size = sum(os.path.getsize(v) for v in files if os.path.exists(v))
+        status.append({'name': name, 'path': path, 'exists': exists, 'size': size})
+    return status
+
+def ensure_models(langs: list = (), structure: bool = False):
+    """推理配置指定了模型目录时, 在构造引擎前检查所需模型是否齐全, 避免在无网络环境下尝试下载"""
+    if get_inference_config().model_dir is None:
+        return
+    missing = [v['name'] for v in model_status(langs, structure) if not v['exists']]
+    if missing:
+        raise ValueError(f"模型目录{bundle_dir()}中缺少模型: {', '.join(missing)}, 请先运行 pdf_toolbox models preload!")
+
+def _sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def write_manifest(model_dir: str = None) -> str:
+    root = Path(bundle_dir(model_dir))
+    manifest = {str(p.relative_to(root)): _sha256(str(p)) for p in sorted((root / "whl").rglob("*")) if p.is_file()}
+    manifest_path = root / MANIFEST
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return str(manifest_path)
+
+def preload_models(langs: list = (), structure: bool = False, model_dir: str = None, source: str = None) -> list:
+    """将所需模型放入模型包目录(已存在的跳过), 完成后更新manifest.json
+
+    Args:
+        source (str, optional): 从另一个模型包目录(如有网络的机器上的~/.paddleocr)拷贝, 不指定则从网络下载. Defaults to None.
+    """
+    root = bundle_dir(model_dir)
+    for name, type, model_type, lang in required_models(langs, structure):
+        path = resolve_model_dir(root, type, model_type, lang)
+        if all(os.path.exists(v) for v in _model_files(path)):
+            logger.info(f"{name}: exists")
+            continue
+        if source is not None:
+            src = resolve_model_dir(source, type, model_type, lang)
+            if not all(os.path.exists(v) for v in _model_files(src)):
+                raise ValueError(f"{source}中缺少模型: {name}!")
+            shutil.copytree(src, path, dirs_exist_ok=True)
+            logger.info(f"{name}: copied from {src}")
+        else:
+            paddleocr_internal().maybe_download(path, get_model_url(type, model_type, lang))
+            logger.info(f"{name}: downloaded")
+    write_manifest(root)
+    return model_status(langs, structure, root)
+
+def verify_models(langs: list = (), structure: bool = False, model_dir: str = None) -> list:
+    """检查所需模型是否齐全, 并按manifest.json校验模型包内所有文件的sha256, 返回问题列表"""
+    root = Path(bundle_dir(model_dir))
+    problems = [f"missing: {v['name']} ({v['path']})" for v in model_status(langs, structure, str(root)) if not v['exists']]
+    manifest_path = root / MANIFEST
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        for relpath, digest in manifest.items():
+            path = root / relpath
+            if not path.exists():
+                problems.append(f"missing: {relpath}")
+            elif _sha256(str(path)) != digest:
+                problems.append(f"checksum mismatch: {relpath}")
+    else:
+        logger.warning(f"{manifest_path}不存在, 跳过校验和检查")
+    return problems
+
+
+def _dummy_image() -> np.ndarray:
+    img = np.full((64, 320, 3), 255, dtype=np.uint8)
+    cv2.putText(img, "warm up 123", (10, 44), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    return img
+
+def warmup_engines(langs: list = (), structure: bool = False, table: bool = False):
+    """在当前线程中加载引擎并各运行一次推理, 使首个真实页面不再承担初始化和首次推理的开销"""
+    from . import get_ocr_engine, get_structure_engine, get_table_engine
+    img = _dummy_image()
+    for lang in langs:
+        with stage("warmup"):
+            get_ocr_engine(lang).ocr(img, cls=False)
+    if structure:
+        with stage("warmup"):
+            get_structure_engine()(img)
+    if table:
+        with stage("warmup"):
+            get_table_engine()(img)
@@ -0,0 +1,97 @@
+"""轻量级分阶段计时, 未启用时stage()直接返回共享的空上下文, 几乎没有开销
+
+用法:
+    with stage("get_pixmap"):
+        pix = page.get_pixmap()
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+_local = threading.local()
+_null = nullcontext()
+_start_ns = time.perf_counter_ns()
+
+
+class _Stage:
+    __slots__ = ("name", "page", "start")
+
+    def __init__(self, name: str, page: int = None):
+        if page is None:
+            page = getattr(_local, "page", None)
+        self.name = name
+        self.page = page
+
+    def __enter__(self):
+        if self.name == "page":
+            _local.page = self.page
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        if self.name == "page":
+            _local.page = None
+        event = {
+            "name": self.name,
+            "ph": "X",
+            "ts": (self.start - _start_ns) / 1000,  # 单位: 微秒
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"page": self.page},
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def enable_profile(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+def is_profile_enabled() -> bool:
+    return _enabled
+
+def stage(name: str, page: int = None):
+    """记录一个阶段的耗时, 名称为"page"时设置当前页码, 其内部的阶段会自动关联该页码"""
+    if not _enabled:
+        return _null
+    return _Stage(name, page)
+
+def get_summary() -> dict:
+    """按阶段汇总: {阶段: {count, total, mean, max}}, 时间单位为秒"""
+    summary = {}
+    with _lock:
+        events = list(_events)
+    for event in events:
+        item = summary.setdefault(event["name"], {"count": 0, "total": 0., "max": 0.})
+        dur = event["dur"] / 1e6
+        item["count"] += 1
+        item["total"] += dur
+        item["max"] = max(item["max"], dur)
+    for item in summary.values():
+        item["mean"] = item["total"] / item["count"]
+    return summary
+
+def print_summary():
+    summary = get_summary()
+    print(f"{'stage':<24}{'count':>8}{'total(s)':>12}{'mean(ms)':>12}{'max(ms)':>12}")
+    for name, item in sorted(summary.items(), key=lambda x: -x[1]["total"]):
+        print(f"{name:<24}{item['count']:>8}{item['total']:>12.3f}{item['mean']*1000:>12.2f}{item['max']*1000:>12.2f}")
+
+def save_profile(output_path: str):
+    """保存记录的事件, 后缀为.jsonl时每行一个事件, 否则保存为Chrome trace-event格式(可用chrome://tracing查看)"""
+    with _lock:
+        events = list(_events)
+    with open(output_path, "w", encoding="utf-8") as f:
+        if str(output_path).endswith(".jsonl"):
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        else:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
@@ -0,0 +1,250 @@
+"""监视目录模式: 轮询输入目录, 对新增或变化的pdf依次执行配置的操作链, 结果原子地移动到输出目录
+
+状态保存在本地sqlite数据库中(文件大小、修改时间、内容哈希、操作链), 重启后已完成的文件不会重复处理.
+轮询实现, 不依赖操作系统的文件通知接口, 也可以在cron中配合--once使用.
+
+操作链配置(json), 与常驻服务的任务格式相同:
+    [{"op": "rotate"}, {"op": "ocr", "args": {"lang": "en"}}, {"op": "compress", "args": {"dpi": 150}}]
+"""
+import glob
+import inspect
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+import fitz
+from loguru import logger
+
+from pdf_toolbox.lib.bookmark import add_toc_from_fonts, add_toc_from_ocr
+from pdf_toolbox.lib.compress import compress_pdf
+from pdf_toolbox.lib.dedupe import dedupe_pdf
+from pdf_toolbox.lib.extract import extract_text_from_pdf
+from pdf_toolbox.lib.header_footer import redact_headers_footers
+from pdf_toolbox.lib.ocr import ocr_from_pdf
+from pdf_toolbox.lib.orientation import auto_rotate_pdf
+from pdf_toolbox.lib.search import file_hash
+from pdf_toolbox.lib.watermark import remove_mark_from_pdf
+
+def _dedupe(doc: fitz.Document, max_distance: int = 0, dpi: int = 20):
+    return dedupe_pdf([doc], max_distance, dpi)
+
+# 操作名称 -> 输入为fitz.Document的函数, 依次作用在同一份文档上; 返回None时沿用原文档
+PDF_STEPS = {
+    "rotate": auto_rotate_pdf,
+    "dedupe": _dedupe,
+    "redact_headers": redact_headers_footers,
+    "remove_watermark": remove_mark_from_pdf,
+    "bookmark": add_toc_from_ocr,
+    "bookmark_fonts": add_toc_from_fonts,
+    "compress": compress_pdf,
+    "optimize": compress_pdf,
+}
+# 操作名称 -> (函数, 输出文件名后缀), 在处理到该步骤时的文档上生成附加结果, 不修改文档
+SIDE_STEPS = {
+    "ocr": (ocr_from_pdf, "_ocr_result"),
+    "text": (extract_text_from_pdf, "-text.txt"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path       TEXT PRIMARY KEY,
+    size       INTEGER,
+    mtime      REAL,
+    hash       TEXT,
+    ops        TEXT,
+    status     TEXT,
+    attempts   INTEGER DEFAULT 0,
+    outputs    TEXT,
+    error      TEXT,
+    updated_at REAL
+);
+"""
+
+
+def _check_args(op: str, func, args: dict):
+    """检查操作参数: 缺少必需参数或有未知参数时报错, 使错误的操作链在启动时就失败, 而不是每个文件都失败"""
+    params = list(inspect.signature(func).parameters.values())[1:]  # 第一个参数为文档
+    names = {v.name for v in params if v.kind in (v.POSITIONAL_OR_KEYWORD, v.KEYWORD_ONLY)}
+    if "output_path" in args:
+        raise ValueError(f"{op}: 输出路径由监视模式决定, 不能指定output_path!")
+    missing = [v.name for v in params if v.default is v.empty and v.name in names and v.name not in args]
+    if missing:
+        raise ValueError(f"{op}: 缺少参数 {', '.join(missing)}, 请在操作链配置的args中指定!")
+    if not any(v.kind == v.VAR_KEYWORD for v in params):
+        unknown = [k for k in args if k not in names]
+        if unknown:
+            raise ValueError(f"{op}: 未知参数 {', '.join(unknown)}!")
+
+def parse_ops(ops: list) -> list:
+    """规范化并检查操作链: 接受操作名称或{"op": ..., "args": {...}}, 返回[{"op", "args"}, ...]"""
+    chain = []
+    for item in ops:
+        if isinstance(item, str):
+            item = {"op": item}
+        if item["op"] not in PDF_STEPS and item["op"] not in SIDE_STEPS:
+            raise ValueError(f"不支持的操作: {item['op']}, 可选: {', '.join([*PDF_STEPS, *SIDE_STEPS])}!")
+        args = item.get("args", {})
+        func = SIDE_STEPS[item["op"]][0] if item["op"] in SIDE_STEPS else PDF_STEPS[item["op"]]
+        _check_args(item["op"], func, args)
+        chain.append({"op": item["op"], "args": args})
+    return chain
+
+def load_ops(config_path: str) -> list:
+    with open(config_path, "r", encoding="utf-8") as f:
+        return parse_ops(json.load(f))
+
+def connect_state(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def process_file(input_path: str, chain: list, output_dir: str, relpath: str) -> list:
+    """对单个文件执行操作链(在工作进程中运行)
+
+    所有结果先写入输出目录下的临时目录, 全部成功后逐个os.replace到最终位置, 不会留下写了一半的结果
+
+    Returns:
+        list: 输出文件/目录路径
+    """
+    target = Path(output_dir) / relpath
+    staging = Path(output_dir) / f".staging-{uuid.uuid4().hex}"
+    staging.mkdir(parents=True)
+    try:
+        doc = fitz.open(input_path)
+        names = []
+        for step in chain:
+            if step["op"] in SIDE_STEPS:
+                func, suffix = SIDE_STEPS[step["op"]]
+                name = f"{target.stem}{suffix}"
+                func(doc, output_path=str(staging / name), **step["args"])
+                names.append(name)
+            else:
+                result = PDF_STEPS[step["op"]](doc, **step["args"])
+                if result is not None:
+                    doc = result
+        doc.save(str(staging / target.name), garbage=3, deflate=True)
+        names.append(target.name)
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        outputs = []
+        for name in names:
+            dst = target.parent / name
+            if dst.is_dir():
+                shutil.rmtree(dst)
+            os.replace(staging / name, dst)
+            outputs.append(str(dst))
+        return outputs
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def scan_inputs(input_dirs: List[str], settle: float = 5., exclude: str = None) -> list:
+    """列出输入目录下的pdf, 返回[(绝对路径, 相对路径), ...]; 最近settle秒内修改过的文件可能仍在写入, 暂不处理
+
+    Args:
+        exclude (str, optional): 跳过该目录(输出目录位于输入目录内时). Defaults to None.
+    """
+    now = time.time()
+    exclude = os.path.abspath(exclude) + os.sep if exclude else None
+    files = []
+    for input_dir in input_dirs:
+        root = os.path.abspath(input_dir)
+        for path in sorted(glob.glob(os.path.join(root, "**", "*.pdf"), recursive=True)):
+            if (exclude and path.startswith(exclude)) or now - os.path.getmtime(path) < settle:
+                continue
+            relpath = os.path.relpath(path, root)
+            if len(input_dirs) > 1:
+                relpath = os.path.join(os.path.basename(root), relpath)  # 多个输入目录时按目录名区分
+            files.append((path, relpath))
+    return files
+
+def poll_once(conn: sqlite3.Connection, input_dirs: List[str], chain: list, output_dir: str, executor: ProcessPoolExecutor,
+              max_pending: int, settle: float = 5., max_attempts: int = 3) -> dict:
+    """扫描一次输入目录, 处理新增或变化的文件, 全部完成后返回统计"""
+    ops = json.dumps(chain, sort_keys=True, ensure_ascii=False)
+    stats = {"done": 0, "failed": 0, "unchanged": 0}
+    pending = deque()
+
+    def finish(path: str, future):
+        try:
+            outputs = future.result()
+        except Exception as e:
+            logger.error(f"{path}: {e!r}")
+            with conn:
+                conn.execute("UPDATE files SET status = 'failed', attempts = attempts + 1, error = ?, updated_at = ? WHERE path = ?",
+                             (repr(e), time.time(), path))
+            stats["failed"] += 1
+            return
+        with conn:
+            conn.execute("UPDATE files SET status = 'done', outputs = ?, error = NULL, updated_at = ? WHERE path = ?",
+                         (json.dumps(outputs, ensure_ascii=False), time.time(), path))
+        logger.info(f"{path} -> {', '.join(outputs)}")
+        stats["done"] += 1
+
+    for path, relpath in scan_inputs(input_dirs, settle, exclude=output_dir):
+        st = os.stat(path)
+        row = conn.execute("SELECT size, mtime, hash, ops, status, attempts FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime and row[3] == ops:
+            if row[4] == "done" or (row[4] == "failed" and row[5] >= max_attempts):
+                stats["unchanged"] += 1
+                continue
+        digest = file_hash(path)
+        if row is not None and row[2] == digest and row[3] == ops and row[4] == "done":
+            # 内容未变(如被touch), 只更新元数据
+            with conn:
+                conn.execute("UPDATE files SET size = ?, mtime = ? WHERE path = ?", (st.st_size, st.st_mtime, path))
+            stats["unchanged"] += 1
+            continue
+        attempts = row[5] if row is not None and row[2] == digest and row[3] == ops else 0
+        if attempts >= max_attempts:
+            stats["unchanged"] += 1
+            continue
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, hash, ops, status, attempts, updated_at) "
+                         "VALUES (?, ?, ?, ?, ?, 'running', ?, ?)", (path, st.st_size, st.st_mtime, digest, ops, attempts, time.time()))
+        pending.append((path, executor.submit(process_file, path, chain, output_dir, relpath)))
+        while len(pending) > max_pending:
+            finish(*pending.popleft())
+    while pending:
+        finish(*pending.popleft())
+    return stats
+
+def watch(input_dirs: List[str], output_dir: str, ops: list, db_path: str = None, interval: float = 10., settle: float = 5.,
+          workers: int = 1, max_attempts: int = 3, once: bool = False):
+    """监视输入目录, 对新增或变化的pdf执行操作链
+
+    Args:
+        input_dirs (List[str]): 输入目录, 递归查找*.pdf
+        output_dir (str): 输出目录, 保持输入的相对路径(多个输入目录时加一级目录名)
+        ops (list): 操作链, 操作名称或{"op": ..., "args": {...}}, 见PDF_STEPS和SIDE_STEPS
+        db_path (str, optional): 状态数据库路径. Defaults to None(输出目录下的.pdf_toolbox_watch.db).
+        interval (float, optional): 轮询间隔(秒). Defaults to 10..
+        settle (float, optional): 修改时间距今不足该秒数的文件视为仍在写入, 下次轮询再处理. Defaults to 5..
+        workers (int, optional): 工作进程数. Defaults to 1.
+        max_attempts (int, optional): 同一内容最多尝试次数, 超过后不再重试(文件变化后重新计数). Defaults to 3.
+        once (bool, optional): 只扫描处理一次后退出(用于cron). Defaults to False.
+    """
+    chain = parse_ops(ops)
+    os.makedirs(output_dir, exist_ok=True)
+    conn = connect_state(db_path or os.path.join(output_dir, ".pdf_toolbox_watch.db"))
+    logger.info(f"watching {', '.join(input_dirs)}, ops: {' -> '.join(v['op'] for v in chain)}")
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            while True:
+                stats = poll_once(conn, input_dirs, chain, output_dir, executor, workers * 2, settle, max_attempts)
+                if stats["done"] or stats["failed"]:
+                    logger.info(", ".join(f"{k}: {v}" for k, v in stats.items()))
+                if once:
+                    return stats
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("stopped")
+    finally:
+        conn.close()